@@ -0,0 +1,161 @@
+"""
+Noyau vectorisé des profits quotidiens et des projections de gains
+
+Les positions actives sont chargées en colonnes, puis les crédits du jour,
+les totaux par utilisateur et les projections sont calculés en bloc.
+NumPy est utilisé s'il est installé, sinon un équivalent en Python pur.
+"""
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# Codes compacts des types de position
+KIND_BOT = 0
+KIND_COPY = 1
+KIND_NAMES = {KIND_BOT: 'bot', KIND_COPY: 'copy'}
+
+# Crédit du jour = fixed_credit + amount * daily_rate * ratio
+#   bot  : profit quotidien fixé à l'activation
+#   copy : rendement mensuel du trader ramené au jour (approximation /30) x copy_ratio
+POSITIONS_SELECT = '''
+    SELECT 0 AS kind, utb.id, utb.user_id, utb.amount,
+           COALESCE(utb.daily_profit, 0) AS fixed_credit, 0.0 AS daily_rate, 1.0 AS ratio,
+           ts.name AS label
+    FROM user_trading_bots utb
+    JOIN users u ON utb.user_id = u.id
+    JOIN trading_strategies ts ON utb.strategy_id = ts.id
+    WHERE utb.is_active = 1 AND {bot_scope}
+    UNION ALL
+    SELECT 1 AS kind, uct.id, uct.user_id, uct.amount,
+           0.0 AS fixed_credit, tt.monthly_return / 100.0 / 30 AS daily_rate,
+           COALESCE(uct.copy_ratio, 1.0) AS ratio,
+           tt.name AS label
+    FROM user_copy_trading uct
+    JOIN users u ON uct.user_id = u.id
+    JOIN top_traders tt ON uct.trader_id = tt.id
+    WHERE uct.is_active = 1 AND {copy_scope}
+'''
+
+COLUMNS = ('kind', 'position_id', 'user_id', 'amount', 'fixed_credit', 'daily_rate', 'ratio')
+
+def load_positions(conn, bot_scope='1', copy_scope='1', params=()):
+    """
+    Charger les positions actives en colonnes.
+
+    bot_scope / copy_scope restreignent chaque branche (fragments SQL
+    constants) ; params contient les paramètres de bot_scope puis de copy_scope.
+    Les libellés sont dédupliqués : 'label_codes' indexe 'labels'.
+    """
+    sql = POSITIONS_SELECT.format(bot_scope=bot_scope, copy_scope=copy_scope)
+    rows = conn.execute(sql, params).fetchall()
+
+    labels = []
+    label_index = {}
+    label_codes = []
+    for row in rows:
+        code = label_index.get(row[7])
+        if code is None:
+            code = label_index[row[7]] = len(labels)
+            labels.append(row[7])
+        label_codes.append(code)
+
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(COLUMNS)}
+    columns['label_codes'] = label_codes
+    if NUMPY_AVAILABLE:
+        columns = {
+            'kind': np.array(columns['kind'], dtype=np.int8),
+            'position_id': np.array(columns['position_id'], dtype=np.int64),
+            'user_id': np.array(columns['user_id'], dtype=np.int64),
+            'amount': np.array(columns['amount'], dtype=np.float64),
+            'fixed_credit': np.array(columns['fixed_credit'], dtype=np.float64),
+            'daily_rate': np.array(columns['daily_rate'], dtype=np.float64),
+            'ratio': np.array(columns['ratio'], dtype=np.float64),
+            'label_codes': np.array(columns['label_codes'], dtype=np.int32),
+        }
+    columns['labels'] = labels
+    return columns
+
+def daily_credits(columns):
+    """Crédit du jour de chaque position"""
+    if NUMPY_AVAILABLE:
+        return columns['fixed_credit'] + columns['amount'] * columns['daily_rate'] * columns['ratio']
+    return [
+        fixed + amount * rate * ratio
+        for fixed, amount, rate, ratio in zip(
+            columns['fixed_credit'], columns['amount'], columns['daily_rate'], columns['ratio']
+        )
+    ]
+
+def user_totals(user_ids, values):
+    """Réduction groupée par utilisateur : (id utilisateurs triés, sommes)"""
+    if NUMPY_AVAILABLE:
+        users, inverse = np.unique(user_ids, return_inverse=True)
+        return users, np.bincount(inverse, weights=values, minlength=len(users))
+    totals = {}
+    for user_id, value in zip(user_ids, values):
+        totals[user_id] = totals.get(user_id, 0.0) + value
+    users = sorted(totals)
+    return users, [totals[user_id] for user_id in users]
+
+def project_earnings(columns, horizons=(7, 30, 90)):
+    """
+    Gains projetés par utilisateur sur chaque horizon (en jours).
+
+    Les bots et copy trades actifs n'ont pas de date de fin : la projection
+    est linéaire. Retourne (id utilisateurs, matrice utilisateurs x horizons).
+    """
+    users, per_day = user_totals(columns['user_id'], daily_credits(columns))
+    if NUMPY_AVAILABLE:
+        return users, np.outer(per_day, np.asarray(horizons, dtype=np.float64))
+    return users, [[total * days for days in horizons] for total in per_day]
+
+def credit_columns(columns):
+    """Colonnes compactes des crédits positifs (kind, position_id, user_id, amount, label_codes, labels)"""
+    credits = daily_credits(columns)
+    if NUMPY_AVAILABLE:
+        mask = credits > 0
+        return {
+            'kind': columns['kind'][mask],
+            'position_id': columns['position_id'][mask],
+            'user_id': columns['user_id'][mask],
+            'amount': credits[mask],
+            'label_codes': columns['label_codes'][mask],
+            'labels': columns['labels'],
+        }
+    keep = [credit > 0 for credit in credits]
+    compact = {
+        name: [value for value, kept in zip(columns[name], keep) if kept]
+        for name in ('kind', 'position_id', 'user_id', 'label_codes')
+    }
+    compact['amount'] = [credit for credit, kept in zip(credits, keep) if kept]
+    compact['labels'] = columns['labels']
+    return compact
+
+def credit_rows(credits, start=0, stop=None):
+    """Lignes (kind, position_id, user_id, amount, label) d'une tranche de crédits, pour executemany"""
+    window = slice(start, stop)
+    kinds = credits['kind'][window]
+    position_ids = credits['position_id'][window]
+    user_ids = credits['user_id'][window]
+    amounts = credits['amount'][window]
+    label_codes = credits['label_codes'][window]
+    if NUMPY_AVAILABLE:
+        kinds, position_ids, user_ids, amounts, label_codes = (
+            kinds.tolist(), position_ids.tolist(), user_ids.tolist(), amounts.tolist(), label_codes.tolist()
+        )
+    return [
+        (KIND_NAMES[kind], position_id, user_id, amount, credits['labels'][code])
+        for kind, position_id, user_id, amount, code in zip(kinds, position_ids, user_ids, amounts, label_codes)
+    ]
+
+def project_user_earnings(conn, user_id, horizons=(7, 30, 90)):
+    """Gains projetés d'un utilisateur : {horizon en jours: montant}"""
+    columns = load_positions(conn, 'utb.user_id = ?', 'uct.user_id = ?', (user_id, user_id))
+    users, projections = project_earnings(columns, horizons)
+    if len(users) == 0:
+        return {days: 0.0 for days in horizons}
+    return {days: float(value) for days, value in zip(horizons, projections[0])}
@@ -0,0 +1,154 @@
+"""
+File d'attente admin des transactions en attente
+
+Les pages sont lues par curseur (keyset) sur (created_at, id) décroissants,
+avec filtres type / montant / date. La page admin se tient à jour par des
+appels delta légers : nouvelles transactions au-delà du plus grand id connu,
+et transactions affichées qui ne sont plus en attente.
+"""
+
+from sqlite_utils import encode_cursor, decode_cursor
+
+QUEUE_TYPES = ('deposit', 'withdrawal')
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+# Nombre maximal d'id affichés vérifiés par un appel delta
+MAX_WATCHED_IDS = 500
+
+QUEUE_COLUMNS = (
+    'id', 'user_id', 'type', 'amount', 'transaction_hash', 'created_at',
+    'first_name', 'last_name', 'email'
+)
+# Clé de tri encodée dans le curseur, et conversion de chaque valeur au décodage
+CURSOR_COLUMNS = ('created_at', 'id')
+CURSOR_TYPES = (str, int)
+
+QUEUE_SELECT = '''
+    SELECT t.id, t.user_id, t.type, t.amount, t.transaction_hash, t.created_at,
+           u.first_name, u.last_name, u.email
+    FROM transactions t
+    JOIN users u ON t.user_id = u.id
+'''
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def _rows(cursor_rows):
+    return [dict(zip(QUEUE_COLUMNS, row)) for row in cursor_rows.fetchall()]
+
+def pending_counts(conn):
+    """Nombre de transactions en attente, au total et par type"""
+    counts = {'total': 0}
+    counts.update({tx_type: 0 for tx_type in QUEUE_TYPES})
+    for tx_type, count in conn.execute('''
+        SELECT type, COUNT(*) FROM transactions
+        WHERE status = 'pending'
+        GROUP BY type
+    ''').fetchall():
+        counts[tx_type] = count
+        counts['total'] += count
+    return counts
+
+def _filter_clauses(tx_type=None, min_amount=None, max_amount=None, date_from=None, date_to=None):
+    clauses = ["t.status = 'pending'"]
+    params = []
+
+    if tx_type in QUEUE_TYPES:
+        clauses.append('t.type = ?')
+        params.append(tx_type)
+    min_amount, max_amount = _to_float(min_amount), _to_float(max_amount)
+    if min_amount is not None:
+        clauses.append('t.amount >= ?')
+        params.append(min_amount)
+    if max_amount is not None:
+        clauses.append('t.amount <= ?')
+        params.append(max_amount)
+    if date_from:
+        clauses.append('t.created_at >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append("t.created_at < date(?, '+1 day')")
+        params.append(date_to)
+    return clauses, params
+
+def fetch_pending_page(conn, cursor=None, limit=DEFAULT_PAGE_SIZE, **filters):
+    """
+    Page de transactions en attente, les plus récentes d'abord.
+
+    Filtres : tx_type (QUEUE_TYPES), min_amount / max_amount (bornes
+    incluses), date_from / date_to (AAAA-MM-JJ, bornes incluses).
+    Retourne (transactions, curseur de la page suivante ou None).
+    """
+    clauses, params = _filter_clauses(**filters)
+
+    key = decode_cursor(cursor, CURSOR_TYPES) if cursor else None
+    if key:
+        clauses.append('(t.created_at, t.id) < (?, ?)')
+        params.extend(key)
+
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    # Une ligne de plus que la page pour savoir s'il en reste
+    rows = _rows(conn.execute(f'''
+        {QUEUE_SELECT}
+        WHERE {' AND '.join(clauses)}
+        ORDER BY t.created_at DESC, t.id DESC
+        LIMIT ?
+    ''', params + [limit + 1]))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], CURSOR_COLUMNS)
+    return rows, next_cursor
+
+def fetch_queue_changes(conn, since_id=0, watched_ids=(), **filters):
+    """
+    Changements de la file depuis le dernier appel.
+
+    since_id : plus grand id déjà connu de la page ; watched_ids : id
+    affichés dont il faut savoir s'ils ont été traités entre-temps ;
+    filters : ceux de la page affichée (voir fetch_pending_page).
+    Retourne un dictionnaire {added, resolved, counts, last_id} ; added est
+    trié par id croissant et borné, le reste arrive à l'appel suivant.
+    """
+    clauses, params = _filter_clauses(**filters)
+    clauses.append('t.id > ?')
+    params.append(since_id)
+    added = _rows(conn.execute(f'''
+        {QUEUE_SELECT}
+        WHERE {' AND '.join(clauses)}
+        ORDER BY t.id
+        LIMIT ?
+    ''', params + [MAX_PAGE_SIZE]))
+
+    resolved = []
+    watched_ids = list(watched_ids)[:MAX_WATCHED_IDS]
+    if watched_ids:
+        placeholders = ', '.join('?' * len(watched_ids))
+        resolved = [
+            {'id': transaction_id, 'status': status}
+            for transaction_id, status in conn.execute(f'''
+                SELECT id, status FROM transactions
+                WHERE id IN ({placeholders}) AND status != 'pending'
+            ''', watched_ids).fetchall()
+        ]
+
+    return {
+        'added': added,
+        'resolved': resolved,
+        'counts': pending_counts(conn),
+        'last_id': max([since_id] + [row['id'] for row in added]),
+    }
+
+def parse_id_list(value):
+    """'12,15,18' -> [12, 15, 18] (valeurs invalides ignorées)"""
+    ids = []
+    for part in (value or '').split(','):
+        try:
+            ids.append(int(part))
+        except ValueError:
+            continue
+    return ids
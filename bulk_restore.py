@@ -0,0 +1,251 @@
+"""
+Export logique et restauration en masse (JSON Lines, gzip optionnel)
+
+Format : pour chaque table, une ligne d'en-tête
+{"table": ..., "columns": [...]} suivie d'une ligne par enregistrement
+(liste JSON des valeurs, dans l'ordre des colonnes).
+
+La restauration lit le fichier au fil de l'eau et insère par executemany
+en lots de RESTORE_BATCH lignes, dans une seule transaction : les index
+secondaires et les triggers des tables restaurées sont supprimés au début
+puis recréés à la fin (un tri par index au lieu d'une mise à jour par
+ligne). Les tables dérivées (compteurs de notifications, résumés de
+portefeuille) sont recalculées une fois, et le catalogue invalidé.
+
+Ligne de commande :
+    python bulk_restore.py dump backups/dumps/dump.jsonl.gz
+    python bulk_restore.py restore backups/dumps/dump.jsonl.gz [--truncate]
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import time
+
+from catalog_cache import bump_catalog_version
+from database_config import open_connection
+from notification_feed import rebuild_notification_state
+from portfolio_summary import rebuild_portfolio_summaries
+
+RESTORE_BATCH = 20000
+FETCH_SIZE = 1000
+# Progression affichée toutes les PROGRESS_EVERY lignes
+PROGRESS_EVERY = 200000
+
+# Tables propres à la base cible (version du schéma, méta) ou recalculées après restauration
+SKIPPED_TABLES = ('schema_version', 'schema_meta', 'user_notification_state', 'user_portfolio_summary')
+
+def default_dump_dir(backup_dir):
+    return os.path.join(backup_dir, 'dumps')
+
+def latest_dump(dump_dir):
+    """Export le plus récent du répertoire (None si aucun)"""
+    try:
+        names = [name for name in os.listdir(dump_dir) if name.endswith(('.jsonl', '.jsonl.gz'))]
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    return max((os.path.join(dump_dir, name) for name in names), key=os.path.getmtime)
+
+def _open(path, mode, compress=None):
+    if compress is None:
+        compress = path.endswith('.gz')
+    return gzip.open(path, mode + 't', encoding='utf-8') if compress else open(path, mode, encoding='utf-8')
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return {'$b64': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'Valeur non sérialisable: {type(value).__name__}')
+
+def _decode(obj):
+    if '$b64' in obj:
+        return base64.b64decode(obj['$b64'])
+    return obj
+
+def dump_tables(conn, output, tables=None):
+    """Écrire les tables (toutes les tables de données par défaut) ; retourne {table: lignes}"""
+    if tables is None:
+        tables = [row[0] for row in conn.execute('''
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+            ORDER BY name
+        ''').fetchall() if row[0] not in SKIPPED_TABLES]
+
+    counts = {}
+    for table in tables:
+        cursor = conn.execute(f'SELECT * FROM "{table}"')
+        columns = [description[0] for description in cursor.description]
+        output.write(json.dumps({'table': table, 'columns': columns}) + '\n')
+        count = 0
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            output.write(''.join(
+                json.dumps(tuple(row), ensure_ascii=False, default=_encode) + '\n' for row in rows
+            ))
+            count += len(rows)
+        counts[table] = count
+    return counts
+
+def _read_sections(lines):
+    """(table, colonnes, itérateur des lignes) pour chaque section du fichier"""
+    header, pending = None, []
+    for line in lines:
+        record = json.loads(line, object_hook=_decode)
+        if isinstance(record, dict):
+            if header is not None:
+                yield header['table'], header['columns'], iter(pending)
+            header, pending = record, []
+        elif header is None:
+            raise ValueError('Enregistrement avant toute en-tête de table')
+        else:
+            pending.append(record)
+            if len(pending) >= RESTORE_BATCH:
+                yield header['table'], header['columns'], iter(pending)
+                pending = []
+    if header is not None:
+        yield header['table'], header['columns'], iter(pending)
+
+def _print_progress(table, table_rows, total_rows, elapsed):
+    print(f"🔄 Restauration {table}: {table_rows} lignes "
+          f"({total_rows} au total, {total_rows / max(elapsed, 1e-9):.0f} lignes/s)")
+
+class _RestorePlan:
+    """Tables touchées : colonnes retenues, index et triggers mis de côté"""
+
+    def __init__(self, conn, truncate):
+        self.conn = conn
+        self.truncate = truncate
+        self.tables = {}
+        self.deferred = []
+
+    def prepare(self, table, columns):
+        if table in self.tables:
+            return self.tables[table]
+        existing = {row[1] for row in self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()}
+        if not existing or table in SKIPPED_TABLES:
+            print(f"⚠️ Table ignorée à la restauration: {table}")
+            self.tables[table] = None
+            return None
+
+        # Les index uniques (implicites ou CREATE UNIQUE INDEX) restent en place :
+        # INSERT OR REPLACE s'appuie sur eux pour résoudre les conflits de clé
+        unique = {row[1] for row in self.conn.execute(f'PRAGMA index_list("{table}")').fetchall() if row[2]}
+        for kind, name, sql in self.conn.execute('''
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        ''', (table,)).fetchall():
+            if name in unique:
+                continue
+            self.conn.execute(f'DROP {kind.upper()} "{name}"')
+            self.deferred.append(sql)
+        if self.truncate:
+            self.conn.execute(f'DELETE FROM "{table}"')
+
+        # Colonnes absentes de la cible ignorées ; celles absentes du fichier gardent leur défaut
+        keep = [position for position, column in enumerate(columns) if column in existing]
+        names = ', '.join(f'"{columns[position]}"' for position in keep)
+        statement = f'INSERT OR REPLACE INTO "{table}" ({names}) VALUES ({", ".join("?" * len(keep))})'
+        self.tables[table] = (statement, keep if len(keep) < len(columns) else None)
+        return self.tables[table]
+
+    def finish(self):
+        for sql in self.deferred:
+            self.conn.execute(sql)
+
+def bulk_restore(conn, lines, truncate=False, progress=_print_progress):
+    """
+    Restaurer un export (itérable de lignes JSON) dans une seule transaction.
+
+    truncate vide chaque table restaurée avant insertion ; sinon les lignes
+    existantes de même clé sont remplacées. Retourne les statistiques.
+    """
+    started = time.monotonic()
+    counts = {}
+    total = 0
+    next_report = PROGRESS_EVERY
+
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    conn.execute('PRAGMA synchronous=OFF')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            plan = _RestorePlan(conn, truncate)
+            for table, columns, rows in _read_sections(lines):
+                target = plan.prepare(table, columns)
+                if target is None:
+                    continue
+                statement, keep = target
+                if keep is not None:
+                    rows = ([row[position] for position in keep] for row in rows)
+                inserted = conn.executemany(statement, rows).rowcount
+                counts[table] = counts.get(table, 0) + inserted
+                total += inserted
+                if progress and total >= next_report:
+                    progress(table, counts[table], total, time.monotonic() - started)
+                    next_report = total + PROGRESS_EVERY
+
+            plan.finish()
+            rebuild_notification_state(conn)
+            rebuild_portfolio_summaries(conn)
+            bump_catalog_version(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.isolation_level = isolation_level
+
+    elapsed = time.monotonic() - started
+    return {
+        'tables': counts,
+        'rows': total,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(total / max(elapsed, 1e-9))
+    }
+
+def restore_file(conn, path, truncate=False, progress=_print_progress):
+    """Restaurer le fichier path (.jsonl ou .jsonl.gz), lu au fil de l'eau"""
+    with _open(path, 'r') as lines:
+        return bulk_restore(conn, lines, truncate=truncate, progress=progress)
+
+def dump_file(conn, path, tables=None):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _open(path + '.tmp', 'w', compress=path.endswith('.gz')) as output:
+        counts = dump_tables(conn, output, tables)
+    os.replace(path + '.tmp', path)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export logique et restauration en masse')
+    parser.add_argument('--database', default='investment_platform.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    dump = commands.add_parser('dump', help='exporter les tables')
+    dump.add_argument('path', help='fichier .jsonl ou .jsonl.gz')
+    dump.add_argument('--table', action='append', dest='tables', help='table à exporter (répétable)')
+    restore = commands.add_parser('restore', help='restaurer un export')
+    restore.add_argument('path')
+    restore.add_argument('--truncate', action='store_true', help='vider les tables restaurées avant insertion')
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.database)
+    try:
+        if args.command == 'dump':
+            counts = dump_file(conn, args.path, args.tables)
+            print(f"✅ Export: {sum(counts.values())} lignes, {len(counts)} tables -> {args.path}")
+        else:
+            stats = restore_file(conn, args.path, truncate=args.truncate)
+            print(f"✅ Restauration: {stats['rows']} lignes en {stats['seconds']}s "
+                  f"({stats['rows_per_second']} lignes/s)")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
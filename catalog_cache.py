@@ -0,0 +1,119 @@
+"""
+Cache en mémoire du catalogue (plans, stratégies, traders, projets, FAQ)
+
+Ces tables sont lues à presque chaque requête mais ne changent que
+rarement. Chaque worker garde une copie en mémoire, estampillée par le
+compteur catalog_version de schema_meta : toute modification du catalogue
+incrémente ce compteur dans sa transaction, et chaque requête relit
+seulement le compteur pour savoir si sa copie est encore valide.
+
+Les compteurs que les utilisateurs font évoluer (montant collecté d'un
+projet, followers d'un trader) ne sont pas servis par la copie : ils sont
+relus à chaque lecture et fusionnés dans les lignes retournées, pour que
+les investissements ne vident pas le cache de tous les workers.
+"""
+
+import threading
+
+CATALOG_TABLES = (
+    'roi_plans',
+    'staking_plans',
+    'frozen_plans',
+    'trading_strategies',
+    'top_traders',
+    'projects',
+    'faq',
+)
+
+# Colonnes relues à chaque lecture au lieu d'être servies par la copie
+LIVE_COLUMNS = {
+    'projects': ('raised_amount',),
+    'top_traders': ('followers_count',),
+}
+
+def bump_catalog_version(conn):
+    """Invalider le catalogue de tous les workers (dans la transaction de la modification)"""
+    conn.execute('''
+        INSERT INTO schema_meta (key, value) VALUES ('catalog_version', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+    ''')
+
+def read_catalog_version(conn):
+    row = conn.execute("SELECT value FROM schema_meta WHERE key = 'catalog_version'").fetchone()
+    return row[0] if row else 0
+
+class CatalogCache:
+    """Copie par processus des tables du catalogue, rechargée table par table à la demande"""
+
+    def __init__(self, tables=CATALOG_TABLES, live_columns=LIVE_COLUMNS):
+        self.tables = tables
+        self.live_columns = live_columns
+        self._lock = threading.Lock()
+        self._version = None
+        self._rows = {}
+        self._by_id = {}
+
+    def sync(self, conn):
+        """Relire catalog_version et vider la copie locale si le catalogue a changé"""
+        version = read_catalog_version(conn)
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._rows = {}
+                self._by_id = {}
+        return version
+
+    def _load(self, conn, table):
+        if table not in self.tables:
+            raise KeyError(f"Table hors catalogue: {table}")
+        with self._lock:
+            rows = self._rows.get(table)
+            version = self._version
+        if rows is not None:
+            return rows
+
+        cursor = conn.execute(f'SELECT * FROM {table} ORDER BY id')
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+        with self._lock:
+            # Ne pas publier une lecture faite avant une invalidation concurrente
+            if self._version == version:
+                self._rows[table] = rows
+                self._by_id[table] = {row['id']: row for row in rows}
+        return rows
+
+    def _live(self, conn, table, row_id=None):
+        """{id: {colonne: valeur}} des colonnes vivantes (d'une ligne si row_id est donné)"""
+        columns = ', '.join(self.live_columns[table])
+        if row_id is None:
+            cursor = conn.execute(f'SELECT id, {columns} FROM {table}')
+        else:
+            cursor = conn.execute(f'SELECT id, {columns} FROM {table} WHERE id = ?', (row_id,))
+        names = [column[0] for column in cursor.description][1:]
+        return {row[0]: dict(zip(names, row[1:])) for row in cursor.fetchall()}
+
+    def all(self, conn, table):
+        """Toutes les lignes de la table (dictionnaires partagés : ne pas les modifier)"""
+        rows = self._load(conn, table)
+        if table not in self.live_columns:
+            return rows
+        live = self._live(conn, table)
+        return [dict(row, **live.get(row['id'], {})) for row in rows]
+
+    def get(self, conn, table, row_id):
+        """Ligne d'identifiant row_id, ou None"""
+        rows = self._load(conn, table)
+        try:
+            row_id = int(row_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            by_id = self._by_id.get(table)
+        if by_id is None:
+            # Invalidation pendant le chargement : recherche directe dans la lecture
+            row = next((row for row in rows if row['id'] == row_id), None)
+        else:
+            row = by_id.get(row_id)
+        if row is None or table not in self.live_columns:
+            return row
+        return dict(row, **self._live(conn, table, row_id).get(row_id, {}))
@@ -0,0 +1,389 @@
+"""
+Générateur de données synthétiques à l'échelle de la production
+
+Remplit tout le schéma (run_migrations) avec des volumes réalistes :
+utilisateurs, transactions étalées sur LEDGER_SPAN_DAYS (ids croissants
+avec le temps), notifications, positions (ROI, staking, bots, copy
+trading), tickets de support et leurs messages. Les insertions passent par
+executemany, table par table en une transaction, index secondaires et
+triggers (dont le pack d'index, créé par les migrations) supprimés
+pendant le chargement puis recréés ; les tables dérivées (compteurs de
+notifications, résumés de portefeuille) sont recalculées à la fin.
+
+Tous les comptes ont le même mot de passe (un seul hachage) :
+user{n}@load.test / --password, et au moins MIN_BALANCE USDT de solde. Le tirage est déterministe (--seed).
+
+Ligne de commande :
+    python data_generator.py --database loadtest.db                # volumes de production
+    python data_generator.py --database loadtest.db --scale 0.01   # 1 % des volumes
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from werkzeug.security import generate_password_hash
+
+from database_config import open_connection
+from migrations import run_migrations
+from notification_feed import rebuild_notification_state
+from portfolio_summary import rebuild_portfolio_summaries
+
+# Volumes par défaut (--scale les multiplie)
+DEFAULT_VOLUMES = {
+    'users': 1_000_000,
+    'transactions': 10_000_000,
+    'notifications': 5_000_000,
+    'investments': 400_000,
+    'staking': 300_000,
+    'bots': 250_000,
+    'copy_trades': 250_000,
+    'frozen': 100_000,
+    'project_investments': 100_000,
+    'tickets': 100_000,
+    'security_logs': 2_000_000,
+}
+MESSAGES_PER_TICKET = 6
+LEDGER_SPAN_DAYS = 730
+INSERT_BATCH = 50_000
+DEFAULT_PASSWORD = 'loadtest123'
+# Solde plancher des comptes générés : les investissements du banc de charge doivent aboutir
+MIN_BALANCE = 10_000
+
+TRANSACTION_TYPES = (
+    ('deposit', 40), ('withdrawal', 15), ('roi_investment', 15), ('trading_bot', 12),
+    ('copy_trading', 10), ('project_investment', 8),
+)
+NOTIFICATION_TYPES = (
+    ('Profit bot de trading', 'Votre bot a généré {amount:.2f} USDT de profit', 'success', 45),
+    ('Profit copy trading', 'Le trader copié a généré {amount:.2f} USDT de profit', 'success', 30),
+    ('Dépôt confirmé', 'Votre dépôt de {amount:.2f} USDT a été confirmé', 'success', 10),
+    ('Retrait en cours', 'Votre retrait de {amount:.2f} USDT est en cours de traitement', 'info', 10),
+    ('Nouveau message support', 'Le support a répondu à votre ticket', 'info', 5),
+)
+TICKET_SUBJECTS = (
+    'Dépôt non crédité', 'Retrait en attente', 'Question sur le staking', 'Problème de connexion',
+    'Bot de trading arrêté', 'Vérification KYC', 'Parrainage', 'Calcul des profits',
+)
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def _weighted(rng, choices):
+    """Tirage pondéré parmi des tuples (valeur..., poids) ; une valeur seule est renvoyée telle quelle"""
+    values = [choice[0] if len(choice) == 2 else choice[:-1] for choice in choices]
+    weights = [choice[-1] for choice in choices]
+    return lambda: rng.choices(values, weights)[0]
+
+def _user_picker(rng, users):
+    # Activité concentrée : une minorité d'utilisateurs (petits ids) porte une bonne part des lignes
+    return lambda: min(int(rng.paretovariate(1.16)), users) if rng.random() < 0.2 else rng.randint(1, users)
+
+class Generator:
+    """Remplissage table par table, dans l'ordre des dépendances"""
+
+    def __init__(self, conn, volumes, seed=42, password=DEFAULT_PASSWORD, now=None):
+        self.conn = conn
+        self.volumes = volumes
+        self.rng = random.Random(seed)
+        self.password_hash = generate_password_hash(password)
+        self.now = now or datetime.now().replace(microsecond=0)
+        self.pick_user = _user_picker(self.rng, max(volumes['users'], 1))
+
+    def _moment(self, position, total, span_days=LEDGER_SPAN_DAYS):
+        """Date croissante avec la position : les ids suivent le temps, comme en production"""
+        span = span_days * 86400
+        offset = span * position / max(total, 1) + self.rng.uniform(0, span / max(total, 1))
+        return self.now - timedelta(seconds=span - min(offset, span))
+
+    def _timestamp_at(self, position, total):
+        return _timestamp(self._moment(position, total))
+
+    def _catalog(self, table, columns='id'):
+        return self.conn.execute(f'SELECT {columns} FROM {table} ORDER BY id').fetchall()
+
+    def _load(self, table, columns, rows):
+        """Insérer rows par lots, index et triggers de la table différés ; retourne le nombre inséré"""
+        started = time.monotonic()
+        deferred = self.conn.execute('''
+            SELECT type, name, sql FROM sqlite_master
+            WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+        ''', (table,)).fetchall()
+        statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for kind, name, _ in deferred:
+                self.conn.execute(f'DROP {kind.upper()} "{name}"')
+            total = 0
+            while True:
+                batch = list(islice(rows, INSERT_BATCH))
+                if not batch:
+                    break
+                self.conn.executemany(statement, batch)
+                total += len(batch)
+            for _, _, sql in deferred:
+                self.conn.execute(sql)
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+        elapsed = time.monotonic() - started
+        print(f"✅ {table}: {total} lignes en {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} lignes/s)")
+        return total
+
+    def users(self):
+        total = self.volumes['users']
+        kyc = _weighted(self.rng, (('verified', 55), ('pending', 40), ('rejected', 5)))
+        rng = self.rng
+
+        def rows():
+            for n in range(1, total + 1):
+                created = _timestamp(self._moment(n, total))
+                referred_by = f'LT{rng.randint(1, n - 1)}' if n > 1 and rng.random() < 0.3 else None
+                yield (
+                    f'user{n}@load.test', self.password_hash, f'Prénom{n}', f'Nom{n}',
+                    round(MIN_BALANCE + rng.lognormvariate(4.5, 1.2), 2), kyc(), f'LT{n}', referred_by,
+                    created, created,
+                )
+
+        return self._load('users', (
+            'email', 'password_hash', 'first_name', 'last_name', 'balance', 'kyc_status',
+            'referral_code', 'referred_by', 'created_at', 'updated_at',
+        ), rows())
+
+    def transactions(self):
+        total = self.volumes['transactions']
+        tx_type = _weighted(self.rng, TRANSACTION_TYPES)
+        rng = self.rng
+        # Les transactions récentes restent parfois en attente (file admin)
+        recent = total - min(total // 50, 20_000)
+
+        def rows():
+            for n in range(total):
+                moment = self._timestamp_at(n, total)
+                kind = tx_type()
+                if kind in ('deposit', 'withdrawal'):
+                    status = 'pending' if n >= recent and rng.random() < 0.5 else rng.choices(
+                        ('completed', 'rejected'), (95, 5))[0]
+                else:
+                    status = 'completed'
+                yield (self.pick_user(), kind, round(rng.lognormvariate(4, 1), 2), status,
+                       f'{rng.getrandbits(128):032x}', moment, moment)
+
+        return self._load('transactions', (
+            'user_id', 'type', 'amount', 'status', 'transaction_hash', 'created_at', 'updated_at',
+        ), rows())
+
+    def notifications(self):
+        total = self.volumes['notifications']
+        kind = _weighted(self.rng, NOTIFICATION_TYPES)
+        rng = self.rng
+
+        def rows():
+            for n in range(total):
+                title, message, level = kind()
+                # Les anciennes notifications sont presque toutes lues
+                is_read = 1 if rng.random() < 0.5 + 0.45 * (1 - n / total) else 0
+                yield (self.pick_user(), title, message.format(amount=rng.lognormvariate(1.5, 1)),
+                       level, is_read, self._timestamp_at(n, total))
+
+        return self._load('notifications', (
+            'user_id', 'title', 'message', 'type', 'is_read', 'created_at',
+        ), rows())
+
+    def _positions(self, table, columns, total, make_row, span_days=LEDGER_SPAN_DAYS):
+        def rows():
+            for n in range(total):
+                start = self._moment(n, total, span_days)
+                yield make_row(start, self.now - start)
+        return self._load(table, columns, rows())
+
+    def investments(self):
+        plans = self._catalog('roi_plans', 'id, daily_rate, duration_days')
+        rng = self.rng
+
+        def make_row(start, age):
+            plan = rng.choice(plans)
+            amount = round(rng.uniform(20, 2000), 2)
+            daily = amount * plan['daily_rate']
+            days = min(age.days, plan['duration_days'])
+            return (self.pick_user(), plan['id'], amount, _timestamp(start),
+                    _timestamp(start + timedelta(days=plan['duration_days'])), daily, round(daily * days, 2),
+                    1 if age.days < plan['duration_days'] else 0)
+
+        return self._positions('user_investments', (
+            'user_id', 'plan_id', 'amount', 'start_date', 'end_date', 'daily_profit', 'total_earned', 'is_active',
+        ), self.volumes['investments'], make_row)
+
+    def staking(self):
+        plans = self._catalog('staking_plans', 'id, annual_rate, duration_days')
+        rng = self.rng
+
+        def make_row(start, age):
+            plan = rng.choice(plans)
+            amount = round(rng.uniform(20, 3000), 2)
+            days = min(age.days, plan['duration_days'])
+            active = age.days < plan['duration_days']
+            return (self.pick_user(), plan['id'], amount, _timestamp(start),
+                    _timestamp(start + timedelta(days=plan['duration_days'])), 1 if active else 0,
+                    0 if active else 1, round(amount * plan['annual_rate'] * days / 365, 2))
+
+        return self._positions('user_staking', (
+            'user_id', 'plan_id', 'amount', 'start_date', 'end_date', 'is_active', 'is_withdrawn', 'total_earned',
+        ), self.volumes['staking'], make_row)
+
+    def bots(self):
+        strategies = [row['id'] for row in self._catalog('trading_strategies')]
+        rng = self.rng
+
+        # Positions récentes : toutes actives (volume de bots actifs à créditer chaque jour)
+        def make_row(start, age):
+            amount = round(rng.uniform(50, 5000), 2)
+            daily = round(amount * rng.uniform(0.01, 0.05), 2)
+            return (self.pick_user(), rng.choice(strategies), amount, _timestamp(start), 1,
+                    round(daily * age.days, 2), daily, _timestamp(self.now - timedelta(days=1)))
+
+        return self._positions('user_trading_bots', (
+            'user_id', 'strategy_id', 'amount', 'start_date', 'is_active', 'total_profit', 'daily_profit',
+            'last_profit_date',
+        ), self.volumes['bots'], make_row, span_days=90)
+
+    def copy_trades(self):
+        traders = [row['id'] for row in self._catalog('top_traders')]
+        rng = self.rng
+
+        def make_row(start, age):
+            amount = round(rng.uniform(50, 5000), 2)
+            return (self.pick_user(), rng.choice(traders), amount, _timestamp(start), 1,
+                    round(amount * rng.uniform(0.005, 0.03) * age.days, 2), rng.choice((0.5, 1.0, 1.0, 2.0)))
+
+        return self._positions('user_copy_trading', (
+            'user_id', 'trader_id', 'amount', 'start_date', 'is_active', 'total_profit', 'copy_ratio',
+        ), self.volumes['copy_trades'], make_row, span_days=90)
+
+    def frozen(self):
+        plans = self._catalog('frozen_plans', 'id, total_return_rate, duration_days')
+        rng = self.rng
+
+        def make_row(start, age):
+            plan = rng.choice(plans)
+            amount = round(rng.uniform(20, 2000), 2)
+            done = age.days >= plan['duration_days']
+            return (self.pick_user(), plan['id'], amount, _timestamp(start),
+                    _timestamp(start + timedelta(days=plan['duration_days'])),
+                    round(amount * (1 + plan['total_return_rate']), 2), 0 if done else 1, 1 if done else 0)
+
+        return self._positions('user_frozen_investments', (
+            'user_id', 'plan_id', 'amount', 'start_date', 'end_date', 'final_amount', 'is_active', 'is_completed',
+        ), self.volumes['frozen'], make_row)
+
+    def project_investments(self):
+        projects = [row['id'] for row in self._catalog('projects')]
+        rng = self.rng
+
+        def make_row(start, age):
+            return (self.pick_user(), rng.choice(projects), round(rng.uniform(20, 1000), 2), _timestamp(start))
+
+        return self._positions('project_investments', (
+            'user_id', 'project_id', 'amount', 'investment_date',
+        ), self.volumes['project_investments'], make_row)
+
+    def security_logs(self):
+        total = self.volumes['security_logs']
+        action = _weighted(self.rng, (('login', 80), ('logout', 10), ('password_change', 5), ('2fa_enabled', 5)))
+        rng = self.rng
+
+        def rows():
+            for n in range(total):
+                yield (self.pick_user(), action(), None, f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+                       'Mozilla/5.0 (load test)', self._timestamp_at(n, total))
+
+        return self._load('security_logs', (
+            'user_id', 'action', 'details', 'ip_address', 'user_agent', 'created_at',
+        ), rows())
+
+    def support(self):
+        total = self.volumes['tickets']
+        rng = self.rng
+        status = _weighted(rng, (('closed', 70), ('open', 20), ('in_progress', 10)))
+        ticket_users = [self.pick_user() for _ in range(total)]
+
+        def tickets():
+            for n in range(total):
+                created = self._timestamp_at(n, total)
+                yield (ticket_users[n], rng.choice(TICKET_SUBJECTS), status(), created, created)
+
+        first_id = (self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM support_tickets').fetchone()[0]) + 1
+        self._load('support_tickets', ('user_id', 'subject', 'status', 'created_at', 'updated_at'), tickets())
+
+        def messages():
+            for n in range(total):
+                opened = self._moment(n, total)
+                for k in range(rng.randint(1, MESSAGES_PER_TICKET * 2 - 1)):
+                    is_admin = k % 2
+                    yield (first_id + n, None if is_admin else ticket_users[n],
+                           'Réponse du support' if is_admin else f'Message {k + 1} du ticket',
+                           is_admin, _timestamp(opened + timedelta(minutes=30 * k)))
+
+        return self._load('support_messages', ('ticket_id', 'user_id', 'message', 'is_admin', 'created_at'),
+                          messages())
+
+    def run(self):
+        started = time.monotonic()
+        self.users()
+        self.transactions()
+        self.notifications()
+        self.investments()
+        self.staking()
+        self.bots()
+        self.copy_trades()
+        self.frozen()
+        self.project_investments()
+        self.support()
+        self.security_logs()
+
+        print("🔄 Recalcul des tables dérivées...")
+        self.conn.execute('BEGIN IMMEDIATE')
+        rebuild_notification_state(self.conn)
+        rebuild_portfolio_summaries(self.conn)
+        self.conn.execute('COMMIT')
+        self.conn.execute('PRAGMA optimize')
+        print(f"✅ Génération terminée en {time.monotonic() - started:.1f}s")
+
+def scaled_volumes(scale=1.0, **overrides):
+    volumes = {name: max(int(count * scale), 1) for name, count in DEFAULT_VOLUMES.items()}
+    volumes.update({name: count for name, count in overrides.items() if count is not None})
+    return volumes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Générer une base synthétique à l\'échelle de la production')
+    parser.add_argument('--database', default='loadtest.db')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplicateur des volumes par défaut')
+    for name in DEFAULT_VOLUMES:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name,
+                            help=f'nombre de lignes (défaut {DEFAULT_VOLUMES[name]} × scale)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default=DEFAULT_PASSWORD, help='mot de passe de tous les comptes')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} existe déjà : le générateur remplit une base neuve')
+
+    volumes = scaled_volumes(args.scale, **{name: getattr(args, name) for name in DEFAULT_VOLUMES})
+    conn = open_connection(args.database)
+    try:
+        run_migrations(conn)
+        conn.execute('PRAGMA synchronous=OFF')
+        # Transactions pilotées explicitement (BEGIN IMMEDIATE ... COMMIT)
+        conn.isolation_level = None
+        Generator(conn, volumes, seed=args.seed, password=args.password).run()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,123 +1,151 @@
 """
 Configuration de base de données optimisée pour Render
-Gère les problèmes de connexion et de verrouillage
+Gère les connexions (pool par processus) et le verrouillage (busy_timeout)
 """
 
 import sqlite3
 import os
 import time
-from functools import wraps
+import threading
 
-def get_db_connection():
-    """Obtenir une connexion à la base de données avec retry automatique"""
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
+from migrations import run_migrations
+
+# PRAGMA appliqués une seule fois à l'ouverture de chaque connexion du pool
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;',
+    'PRAGMA busy_timeout=60000;',  # 60 seconds timeout
+    'PRAGMA synchronous=NORMAL;',  # Better performance
+    'PRAGMA cache_size=10000;',    # Larger cache
+    'PRAGMA temp_store=memory;',   # Use memory for temp
+)
+
+def open_connection(database, timeout=60.0):
+    """Ouvrir une connexion configurée (row_factory + PRAGMA)"""
+    # check_same_thread=False : une connexion du pool peut servir plusieurs threads
+    # successivement, jamais simultanément
+    conn = sqlite3.connect(database, timeout=timeout, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """Pool borné de connexions SQLite, propre à chaque processus (worker gunicorn)"""
+
+    def __init__(self, database, max_size=8, timeout=30.0):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # Les connexions héritées d'un fork ne doivent jamais être réutilisées
+        if self._pid != os.getpid():
+            self._idle = []
+            self._size = 0
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Emprunter une connexion (LIFO pour garder le cache de pages chaud)"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._check_fork()
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(f"Pool de connexions épuisé ({self.max_size} connexions)")
+                self._cond.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
         try:
-            conn = sqlite3.connect('investment_platform.db', timeout=30)
-            conn.row_factory = sqlite3.Row
-            return conn
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                print(f"⚠️ Base de données verrouillée, tentative {attempt + 1}/{max_retries}")
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Augmenter le délai à chaque tentative
-                continue
-            else:
-                print(f"❌ Erreur connexion base de données: {e}")
-                raise
-        except Exception as e:
-            print(f"❌ Erreur inattendue: {e}")
+            return open_connection(self.database)
+        except Exception:
+            self._discard()
             raise
 
-def db_retry(max_retries=3):
-    """Décorateur pour retry automatique des opérations de base de données"""
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except sqlite3.OperationalError as e:
-                    if "database is locked" in str(e) and attempt < max_retries - 1:
-                        print(f"⚠️ Retry opération DB, tentative {attempt + 1}/{max_retries}")
-                        time.sleep(1)
-                        continue
-                    else:
-                        raise
-            return None
-        return wrapper
-    return decorator
+    def release(self, conn):
+        """Rendre une connexion au pool ; le travail non validé est annulé"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            print(f"⚠️ Connexion du pool invalide, fermeture: {e}")
+            conn.close()
+            self._discard()
+            return
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Fermer toutes les connexions inactives du pool"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            conn.close()
+
+class PooledConnection:
+    """Connexion empruntée au pool : close() la rend au pool au lieu de la fermer.
+
+    En mode request_scoped, la même connexion sert toute la requête Flask et
+    close() ne fait rien : la connexion est rendue au teardown du contexte.
+    """
+
+    def __init__(self, pool, conn, request_scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._request_scoped = request_scoped
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # isolation_level, row_factory... sont posés sur la connexion réelle
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def close(self):
+        if not self._request_scoped:
+            self.release()
+
+    def release(self):
+        """Rendre effectivement la connexion au pool"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+def get_db_connection():
+    """Obtenir une connexion à la base de données (busy_timeout au lieu de retries)"""
+    return open_connection('investment_platform.db')
 
 def init_tables():
-    """Initialiser les tables de base de données"""
+    """Initialiser les tables de base de données (schéma versionné de migrations.py)"""
     conn = get_db_connection()
-    
     try:
-        # Table users
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                balance REAL DEFAULT 0.0,
-                is_admin BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                two_factor_secret TEXT,
-                two_factor_enabled BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        # Table transactions
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                amount REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                transaction_hash TEXT UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Table notifications
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                message TEXT NOT NULL,
-                type TEXT DEFAULT 'info',
-                is_read BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Table user_investments
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_investments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan_name TEXT NOT NULL,
-                amount REAL NOT NULL,
-                daily_profit REAL NOT NULL,
-                total_earned REAL DEFAULT 0.0,
-                start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_date TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.commit()
-        print("✅ Tables de base de données initialisées")
-        
+        version = run_migrations(conn)
+        print(f"✅ Tables de base de données initialisées (schéma v{version})")
     except Exception as e:
         print(f"❌ Erreur initialisation tables: {e}")
         raise
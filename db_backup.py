@@ -0,0 +1,580 @@
+"""
+Sauvegardes en ligne de la base SQLite
+
+Chaque sauvegarde est un snapshot complet (gzip) ou un delta (gzip des
+seules pages modifiées). Une chaîne = un snapshot complet suivi de ses
+deltas ; la restauration rejoue la chaîne jusqu'au point choisi.
+
+Les pages modifiées sont trouvées de deux façons :
+
+- depuis le WAL : chaque passage note la position du WAL (sels de l'en-tête
+  et dernière trame validée). Tant que le WAL n'a pas été réinitialisé, les
+  pages écrites depuis sont exactement celles des trames suivantes, relues
+  directement dans le fichier WAL : le coût suit le volume écrit, pas la
+  taille de la base ;
+- sinon (WAL réinitialisé ou tronqué par un checkpoint, début de chaîne) :
+  copie de la base avec Connection.backup(), par pas de BACKUP_PAGES pages
+  en rendant la main entre deux pas, puis comparaison page par page avec
+  les empreintes de la sauvegarde précédente.
+
+Un checkpoint réinitialise le WAL dès que toutes ses trames ont été
+rapatriées : plus les passages sont rapprochés (BACKUP_INTERVAL_MINUTES),
+plus ils passent par le WAL. Un passage sans écriture depuis le précédent
+(taille et date de la base et du WAL inchangées) s'arrête avant toute
+lecture. Les partitions du registre (ledger_partitions), modifiées
+seulement par le partitionnement mensuel, sont copiées quand elles changent.
+
+Ligne de commande :
+    python db_backup.py backup
+    python db_backup.py list
+    python db_backup.py restore restored.db [--at snapshot_...delta.gz]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
+
+from database_config import open_connection
+
+BACKUP_INTERVAL_MINUTES = int(os.environ.get('BACKUP_INTERVAL_MINUTES', 30))
+# Chaînes (snapshot complet + deltas) conservées
+BACKUP_KEEP_CHAINS = int(os.environ.get('BACKUP_KEEP_CHAINS', 3))
+# Nombre maximal de deltas avant un nouveau snapshot complet
+BACKUP_FULL_EVERY = int(os.environ.get('BACKUP_FULL_EVERY', 48))
+# Au-delà de cette part de pages modifiées, un snapshot complet coûte moins qu'un delta
+BACKUP_FULL_RATIO = 0.5
+BACKUP_PAGES = 1024
+BACKUP_STEP_SLEEP = 0.01
+# Redémarrages tolérés (écritures d'une autre connexion) avant une copie en un seul pas
+BACKUP_MAX_RESTARTS = 3
+COPY_BUFFER = 1024 * 1024
+
+MANIFEST = 'manifest.json'
+PAGE_HASHES = 'pages.idx'
+HASH_SIZE = 16
+PAGE_HEADER = struct.Struct('>I')
+
+# Format du fichier WAL : en-tête de 32 octets, puis trames (en-tête de 24 octets + page)
+WAL_HEADER = struct.Struct('>8I')
+WAL_FRAME_HEADER = struct.Struct('>6I')
+WAL_MAGIC = (0x377f0682, 0x377f0683)
+
+_process_lock = threading.Lock()
+
+class _BackupRestarted(Exception):
+    pass
+
+def default_backup_dir(database):
+    """Répertoire des sauvegardes, à côté de la base"""
+    return os.environ.get('BACKUP_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(database)), 'backups'
+    )
+
+def file_fingerprint(path):
+    """(taille, mtime) de la base et de son WAL : change à chaque écriture validée"""
+    fingerprint = []
+    for name in (path, path + '-wal'):
+        try:
+            stat = os.stat(name)
+            fingerprint.append([stat.st_size, stat.st_mtime_ns])
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return fingerprint
+
+def _load_manifest(backup_dir):
+    try:
+        with open(os.path.join(backup_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'fingerprint': None, 'page_size': None, 'wal': None, 'chains': [], 'partitions': {}}
+
+def _write_atomic(path, data, mode='w'):
+    tmp = path + '.tmp'
+    with open(tmp, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _save_manifest(backup_dir, manifest):
+    _write_atomic(os.path.join(backup_dir, MANIFEST), json.dumps(manifest, indent=1))
+
+def _load_page_hashes(backup_dir):
+    try:
+        with open(os.path.join(backup_dir, PAGE_HASHES), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    return [data[i:i + HASH_SIZE] for i in range(0, len(data), HASH_SIZE)]
+
+class _DirectoryLock:
+    """Un seul passage à la fois, entre threads et entre workers"""
+
+    def __init__(self, backup_dir):
+        self.path = os.path.join(backup_dir, '.lock')
+        self.handle = None
+
+    def __enter__(self):
+        _process_lock.acquire()
+        if fcntl is not None:
+            self.handle = open(self.path, 'w')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+        _process_lock.release()
+
+def online_copy(source, target, pages=BACKUP_PAGES, step_sleep=BACKUP_STEP_SLEEP):
+    """
+    Copier source (connexion) dans le fichier target par pas de pages.
+
+    Une écriture d'une autre connexion pendant la copie la fait repartir du
+    début ; après BACKUP_MAX_RESTARTS redémarrages, la copie se fait en un
+    seul pas (en WAL, la lecture ne bloque pas les écrivains).
+    """
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    dest = sqlite3.connect(target)
+    try:
+        try:
+            source.backup(dest, pages=pages, progress=progress)
+        except _BackupRestarted:
+            source.backup(dest, pages=-1)
+    finally:
+        dest.close()
+    return state['restarts']
+
+def _page_size(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('PRAGMA page_size').fetchone()[0]
+    finally:
+        conn.close()
+
+def _hash_pages(path, page_size):
+    with open(path, 'rb') as f:
+        hashes = []
+        while True:
+            page = f.read(page_size)
+            if not page:
+                return hashes
+            hashes.append(hashlib.blake2b(page, digest_size=HASH_SIZE).digest())
+
+def _gzip_file(source, target):
+    with open(source, 'rb') as src, gzip.open(target + '.tmp', 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER)
+    os.replace(target + '.tmp', target)
+    return os.path.getsize(target)
+
+def _write_delta(target, page_size, page_count, pages, count):
+    """Pages modifiées : en-tête JSON puis (numéro de page, contenu) pour chacune des count pages"""
+    with gzip.open(target + '.tmp', 'wb', compresslevel=6) as dst:
+        header = {'page_size': page_size, 'page_count': page_count, 'pages': count}
+        dst.write(json.dumps(header).encode('utf-8') + b'\n')
+        for page_no, data in pages:
+            dst.write(PAGE_HEADER.pack(page_no))
+            dst.write(data)
+    os.replace(target + '.tmp', target)
+    return os.path.getsize(target)
+
+def _file_pages(path, page_size, page_numbers):
+    with open(path, 'rb') as f:
+        for page_no in page_numbers:
+            f.seek(page_no * page_size)
+            yield page_no, f.read(page_size)
+
+def _wal_checksum(data, s0, s1, big_endian):
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+class _WalFile:
+    """Fichier WAL : en-tête, trames validées (sels et sommes de contrôle), contenu des pages"""
+
+    def __init__(self, path):
+        self.salt = None
+        self.page_size = None
+        try:
+            self.handle = open(path, 'rb')
+        except FileNotFoundError:
+            self.handle = None
+            return
+        header = self._header()
+        if header is None:
+            return
+        magic, _, page_size, _, salt1, salt2, checksum1, checksum2 = header
+        self.big_endian = magic & 1
+        self.page_size = page_size
+        self.frame_size = WAL_FRAME_HEADER.size + page_size
+        self.salt = [salt1, salt2]
+        self.header_checksum = (checksum1, checksum2)
+
+    def _header(self):
+        self.handle.seek(0)
+        data = self.handle.read(WAL_HEADER.size)
+        if len(data) < WAL_HEADER.size:
+            return None
+        header = WAL_HEADER.unpack(data)
+        return header if header[0] in WAL_MAGIC else None
+
+    def current_salt(self):
+        """Sels relus dans le fichier : différents de self.salt si le WAL a été réinitialisé entre-temps"""
+        header = self._header() if self.handle is not None else None
+        return list(header[4:6]) if header else None
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+
+    def _offset(self, frame):
+        return WAL_HEADER.size + (frame - 1) * self.frame_size
+
+    def frame_count(self):
+        return (os.fstat(self.handle.fileno()).st_size - WAL_HEADER.size) // self.frame_size
+
+    def _frame_header(self, frame):
+        self.handle.seek(self._offset(frame))
+        return WAL_FRAME_HEADER.unpack(self.handle.read(WAL_FRAME_HEADER.size))
+
+    def last_commit(self, start):
+        """(dernière trame de validation après start, taille de la base en pages à ce point)"""
+        last = (start, None)
+        for frame in range(start + 1, self.frame_count() + 1):
+            _, commit, salt1, salt2, _, _ = self._frame_header(frame)
+            if [salt1, salt2] != self.salt:
+                break
+            if commit:
+                last = (frame, commit)
+        return last
+
+    def changed_pages(self, start, end):
+        """{page: trame la plus récente} des trames start+1..end ; None si une somme de contrôle est fausse"""
+        checksum = self.header_checksum if start == 0 else self._frame_header(start)[4:6]
+        latest = {}
+        for frame in range(start + 1, end + 1):
+            self.handle.seek(self._offset(frame))
+            data = self.handle.read(self.frame_size)
+            header = WAL_FRAME_HEADER.unpack_from(data)
+            checksum = _wal_checksum(data[:8], *checksum, self.big_endian)
+            checksum = _wal_checksum(data[WAL_FRAME_HEADER.size:], *checksum, self.big_endian)
+            if list(header[2:4]) != self.salt or checksum != header[4:6]:
+                return None
+            latest[header[0]] = frame
+        return latest
+
+    def pages(self, latest):
+        """(page, contenu) par numéro de page croissant ; les pages du WAL sont numérotées à partir de 1"""
+        for page_no in sorted(latest):
+            self.handle.seek(self._offset(latest[page_no]) + WAL_FRAME_HEADER.size)
+            yield page_no - 1, self.handle.read(self.page_size)
+
+def _wal_position(database):
+    """Position du WAL lue sous verrou d'écriture : point de départ du prochain delta, ou None"""
+    conn = open_connection(database)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            wal = _WalFile(database + '-wal')
+            try:
+                if wal.salt is None:
+                    return None
+                return {'salt': wal.salt, 'frame': wal.last_commit(0)[0]}
+            finally:
+                wal.close()
+        finally:
+            conn.rollback()
+    finally:
+        conn.close()
+
+def _rotate(backup_dir, manifest, keep_chains):
+    while len(manifest['chains']) > keep_chains:
+        for entry in manifest['chains'].pop(0):
+            try:
+                os.remove(os.path.join(backup_dir, entry['file']))
+            except FileNotFoundError:
+                pass
+
+def _backup_partitions(source, backup_dir, manifest):
+    """Copier les partitions mensuelles modifiées depuis le dernier passage"""
+    try:
+        partitions = source.execute('SELECT month, path FROM ledger_partitions ORDER BY month').fetchall()
+    except sqlite3.OperationalError:
+        return 0
+    ledger_dir = os.path.join(backup_dir, 'ledger')
+    copied = 0
+    for month, path in partitions:
+        fingerprint = file_fingerprint(path)
+        if fingerprint[0] is None or manifest['partitions'].get(month) == fingerprint:
+            continue
+        os.makedirs(ledger_dir, exist_ok=True)
+        tmp = os.path.join(ledger_dir, '.partition.tmp')
+        partition = sqlite3.connect(path)
+        try:
+            online_copy(partition, tmp)
+        finally:
+            partition.close()
+        try:
+            _gzip_file(tmp, os.path.join(ledger_dir, f'transactions_{month}.db.gz'))
+        finally:
+            os.remove(tmp)
+        manifest['partitions'][month] = fingerprint
+        copied += 1
+    return copied
+
+def _new_entry(kind, pages, page_count):
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    suffix = 'full.db.gz' if kind == 'full' else 'delta.gz'
+    return {'created_at': datetime.now().isoformat(), 'page_count': page_count,
+            'kind': kind, 'file': f'snapshot_{stamp}_{suffix}', 'pages': pages}
+
+def _backup_from_wal(database, backup_dir, manifest):
+    """
+    Delta des pages écrites dans le WAL depuis la position du passage précédent.
+
+    Retourne (entrée ou None si rien n'a changé, position, empreintes des
+    pages), ou None quand le WAL ne permet pas de conclure (réinitialisé,
+    page_size différent, somme de contrôle fausse, trop de pages modifiées).
+    """
+    since = manifest['wal']
+    writer = open_connection(database)
+    reader = open_connection(database)
+    wal = None
+    try:
+        # Sous verrou d'écriture : aucune trame en cours d'ajout, la dernière validation est fiable
+        writer.execute('BEGIN IMMEDIATE')
+        try:
+            # Lecture ouverte au même point : retient la réinitialisation du WAL pendant la copie
+            reader.execute('BEGIN')
+            reader.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            wal = _WalFile(database + '-wal')
+            if (wal.salt != since['salt'] or wal.page_size != manifest['page_size']
+                    or wal.frame_count() < since['frame']):
+                return None
+            end, page_count = wal.last_commit(since['frame'])
+        finally:
+            writer.rollback()
+
+        position = {'salt': wal.salt, 'frame': end}
+        if end == since['frame']:
+            return None, position, None
+        latest = wal.changed_pages(since['frame'], end)
+        if latest is None or len(latest) > page_count * BACKUP_FULL_RATIO:
+            return None
+
+        entry = _new_entry('delta', len(latest), page_count)
+        path = os.path.join(backup_dir, entry['file'])
+        hashes = _load_page_hashes(backup_dir)[:page_count]
+        hashes += [b''] * (page_count - len(hashes))
+
+        def pages():
+            for page_no, data in wal.pages(latest):
+                hashes[page_no] = hashlib.blake2b(data, digest_size=HASH_SIZE).digest()
+                yield page_no, data
+
+        entry['bytes'] = _write_delta(path, wal.page_size, page_count, pages(), len(latest))
+        # Trames réécrites par une réinitialisation pendant la lecture : delta inutilisable
+        if wal.current_salt() != since['salt']:
+            os.remove(path)
+            return None
+        return entry, position, hashes
+    finally:
+        if wal is not None:
+            wal.close()
+        reader.rollback()
+        reader.close()
+        writer.close()
+
+def _backup_from_copy(database, backup_dir, manifest, force_full, full_every):
+    """Copie en ligne puis comparaison aux empreintes : (entrée ou None, empreintes, redémarrages)"""
+    tmp = os.path.join(backup_dir, '.snapshot.tmp')
+    source = open_connection(database)
+    try:
+        restarts = online_copy(source, tmp)
+    finally:
+        source.close()
+
+    try:
+        page_size = _page_size(tmp)
+        hashes = _hash_pages(tmp, page_size)
+        previous = _load_page_hashes(backup_dir)
+        changed = [
+            page_no for page_no, digest in enumerate(hashes)
+            if page_no >= len(previous) or previous[page_no] != digest
+        ]
+        chain = manifest['chains'][-1] if manifest['chains'] else None
+        full = (
+            force_full or chain is None
+            or manifest['page_size'] != page_size
+            or len(chain) > full_every
+            or len(changed) > len(hashes) * BACKUP_FULL_RATIO
+        )
+
+        if full:
+            entry = _new_entry('full', len(hashes), len(hashes))
+            entry['bytes'] = _gzip_file(tmp, os.path.join(backup_dir, entry['file']))
+        elif not changed and len(hashes) == len(previous):
+            entry = None
+        else:
+            entry = _new_entry('delta', len(changed), len(hashes))
+            entry['bytes'] = _write_delta(os.path.join(backup_dir, entry['file']), page_size, len(hashes),
+                                          _file_pages(tmp, page_size, changed), len(changed))
+    finally:
+        os.remove(tmp)
+    manifest['page_size'] = page_size
+    return entry, hashes, restarts
+
+def run_backup(database, backup_dir, force_full=False, keep_chains=BACKUP_KEEP_CHAINS,
+               full_every=BACKUP_FULL_EVERY):
+    """
+    Sauvegarder database dans backup_dir ; retourne les statistiques du passage.
+
+    status : 'skipped' (aucune écriture depuis le passage précédent),
+    'unchanged' (aucune page modifiée), 'full' ou 'delta' ; source : 'wal'
+    (pages relues dans le WAL) ou 'copy' (copie complète comparée).
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.monotonic()
+    with _DirectoryLock(backup_dir):
+        manifest = _load_manifest(backup_dir)
+        fingerprint = file_fingerprint(database)
+        if not force_full and manifest['chains'] and manifest['fingerprint'] == fingerprint:
+            return {'status': 'skipped', 'source': None, 'file': None, 'pages': 0, 'bytes': 0, 'partitions': 0,
+                    'restarts': 0, 'seconds': round(time.monotonic() - started, 3)}
+
+        chain = manifest['chains'][-1] if manifest['chains'] else None
+        result = None
+        if not force_full and chain is not None and len(chain) <= full_every and manifest.get('wal'):
+            result = _backup_from_wal(database, backup_dir, manifest)
+
+        restarts = 0
+        if result is not None:
+            entry, manifest['wal'], hashes = result
+            source = 'wal'
+        else:
+            # Position notée avant la copie : le prochain delta rejoue au pire des pages déjà copiées
+            manifest['wal'] = _wal_position(database)
+            entry, hashes, restarts = _backup_from_copy(database, backup_dir, manifest, force_full, full_every)
+            source = 'copy'
+
+        if entry is not None:
+            if entry['kind'] == 'full':
+                manifest['chains'].append([entry])
+            else:
+                chain.append(entry)
+            _write_atomic(os.path.join(backup_dir, PAGE_HASHES), b''.join(hashes), 'wb')
+
+        conn = open_connection(database)
+        try:
+            partitions = _backup_partitions(conn, backup_dir, manifest)
+        finally:
+            conn.close()
+
+        manifest['fingerprint'] = fingerprint
+        _rotate(backup_dir, manifest, keep_chains)
+        _save_manifest(backup_dir, manifest)
+
+    return {
+        'status': entry['kind'] if entry else 'unchanged',
+        'source': source,
+        'file': entry['file'] if entry else None,
+        'pages': entry['pages'] if entry else 0,
+        'bytes': entry['bytes'] if entry else 0,
+        'partitions': partitions,
+        'restarts': restarts,
+        'seconds': round(time.monotonic() - started, 3)
+    }
+
+def list_backups(backup_dir):
+    """Points de restauration disponibles, du plus ancien au plus récent"""
+    return [entry for chain in _load_manifest(backup_dir)['chains'] for entry in chain]
+
+def restore_backup(backup_dir, target, at=None):
+    """
+    Reconstruire dans target (fichier inexistant) la base au point at
+    (nom de fichier d'un snapshot ou d'un delta ; le plus récent par défaut).
+    Retourne le résultat de PRAGMA quick_check.
+    """
+    if os.path.exists(target):
+        raise FileExistsError(f'La cible existe déjà: {target}')
+    chains = _load_manifest(backup_dir)['chains']
+    if not chains:
+        raise FileNotFoundError(f'Aucune sauvegarde dans {backup_dir}')
+
+    replay = None
+    for chain in chains:
+        for position, entry in enumerate(chain):
+            if at is None or entry['file'] == at:
+                replay = chain[:position + 1]
+    if replay is None:
+        raise ValueError(f'Point de restauration inconnu: {at}')
+
+    with gzip.open(os.path.join(backup_dir, replay[0]['file']), 'rb') as src, open(target, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER)
+
+    with open(target, 'r+b') as dst:
+        for entry in replay[1:]:
+            with gzip.open(os.path.join(backup_dir, entry['file']), 'rb') as delta:
+                header = json.loads(delta.readline())
+                page_size = header['page_size']
+                for _ in range(header['pages']):
+                    page_no = PAGE_HEADER.unpack(delta.read(PAGE_HEADER.size))[0]
+                    dst.seek(page_no * page_size)
+                    dst.write(delta.read(page_size))
+            dst.truncate(header['page_count'] * page_size)
+
+    conn = sqlite3.connect(target)
+    try:
+        return conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sauvegardes en ligne de la base SQLite')
+    parser.add_argument('--database', default='investment_platform.db')
+    parser.add_argument('--backup-dir', help='répertoire des sauvegardes (à côté de la base par défaut)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    backup = commands.add_parser('backup', help='sauvegarder maintenant')
+    backup.add_argument('--full', action='store_true', help='forcer un snapshot complet')
+    commands.add_parser('list', help='lister les points de restauration')
+    restore = commands.add_parser('restore', help='reconstruire une base depuis les sauvegardes')
+    restore.add_argument('target')
+    restore.add_argument('--at', help='snapshot ou delta visé (le plus récent par défaut)')
+    args = parser.parse_args(argv)
+
+    backup_dir = args.backup_dir or default_backup_dir(args.database)
+    if args.command == 'backup':
+        print(json.dumps(run_backup(args.database, backup_dir, force_full=args.full)))
+    elif args.command == 'list':
+        for entry in list_backups(backup_dir):
+            print(f"{entry['created_at']}  {entry['kind']:5}  {entry['pages']:>8} pages  "
+                  f"{entry.get('bytes', 0):>12} octets  {entry['file']}")
+    else:
+        print(f"quick_check: {restore_backup(backup_dir, args.target, args.at)}")
+
+if __name__ == '__main__':
+    main()
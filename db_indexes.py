@@ -0,0 +1,161 @@
+"""
+Contrôle des plans d'exécution des requêtes chaudes
+
+Les index de ces requêtes sont créés par migrations.py (étape 8 pour le
+pack initial). Un nouvel index demande une nouvelle étape de migration,
+avec son CREATE INDEX IF NOT EXISTS : les étapes publiées ne changent
+plus. check_query_plans() signale les requêtes chaudes qui parcourent une
+table entière, et donc un index manquant.
+"""
+
+import re
+import sqlite3
+
+# Requêtes chaudes des pages dashboard, support et admin : (nom, SQL, paramètres d'exemple)
+HOT_QUERIES = (
+    ('dashboard_notifications', '''
+        SELECT * FROM notifications
+        WHERE user_id = ? AND is_read = 0
+        ORDER BY created_at DESC
+        LIMIT 5
+    ''', (1,)),
+    ('notifications_since', '''
+        SELECT id, title, message, type, is_read, created_at
+        FROM notifications
+        WHERE user_id = ? AND id > ?
+        ORDER BY id ASC
+        LIMIT 20
+    ''', (1, 0)),
+    ('dashboard_project_investments', '''
+        SELECT pi.*, p.title, p.status, p.expected_return
+        FROM project_investments pi
+        JOIN projects p ON pi.project_id = p.id
+        WHERE pi.user_id = ?
+        ORDER BY pi.investment_date DESC
+    ''', (1,)),
+    ('history_roi_investments', '''
+        SELECT ui.*, rp.name as plan_name
+        FROM user_investments ui
+        LEFT JOIN roi_plans rp ON ui.plan_id = rp.id
+        WHERE ui.user_id = ?
+        ORDER BY ui.start_date DESC
+    ''', (1,)),
+    ('history_staking', '''
+        SELECT us.*, sp.name as plan_name
+        FROM user_staking us
+        LEFT JOIN staking_plans sp ON us.plan_id = sp.id
+        WHERE us.user_id = ?
+        ORDER BY us.start_date DESC
+    ''', (1,)),
+    ('auto_trading_user_bots', '''
+        SELECT utb.*, ts.name as strategy_name
+        FROM user_trading_bots utb
+        JOIN trading_strategies ts ON utb.strategy_id = ts.id
+        WHERE utb.user_id = ? AND utb.is_active = 1
+        ORDER BY utb.start_date DESC
+    ''', (1,)),
+    ('copy_trading_user_copies', '''
+        SELECT uct.*, tt.name as trader_name
+        FROM user_copy_trading uct
+        JOIN top_traders tt ON uct.trader_id = tt.id
+        WHERE uct.user_id = ? AND uct.is_active = 1
+        ORDER BY uct.start_date DESC
+    ''', (1,)),
+    ('profile_referrals', '''
+        SELECT COUNT(*) as count, COALESCE(SUM(balance), 0) as total_balance
+        FROM users
+        WHERE referred_by = ?
+    ''', ('CODE',)),
+    ('projects_collecting', '''
+        SELECT * FROM projects
+        WHERE status = 'collecting' AND deadline > datetime('now')
+    ''', ()),
+    ('support_user_tickets', '''
+        SELECT st.*,
+               (SELECT COUNT(*) FROM support_messages sm WHERE sm.ticket_id = st.id) as message_count,
+               (SELECT sm.created_at FROM support_messages sm WHERE sm.ticket_id = st.id ORDER BY sm.created_at DESC LIMIT 1) as last_message_at
+        FROM support_tickets st
+        WHERE st.user_id = ?
+        ORDER BY st.created_at DESC
+    ''', (1,)),
+    ('support_ticket_messages', '''
+        SELECT sm.*, u.first_name, u.last_name
+        FROM support_messages sm
+        LEFT JOIN users u ON sm.user_id = u.id
+        WHERE sm.ticket_id = ?
+        ORDER BY sm.created_at ASC
+    ''', (1,)),
+    ('support_messages_since', '''
+        SELECT sm.id, sm.message, sm.is_admin, sm.created_at, u.first_name, u.last_name
+        FROM support_messages sm
+        LEFT JOIN users u ON sm.user_id = u.id
+        WHERE sm.ticket_id = ? AND sm.id > ?
+        ORDER BY sm.id ASC
+    ''', (1, 0)),
+    ('admin_pending_transactions', '''
+        SELECT t.*, u.first_name, u.last_name, u.email
+        FROM transactions t
+        JOIN users u ON t.user_id = u.id
+        WHERE t.status = 'pending'
+        ORDER BY t.created_at DESC
+    ''', ()),
+    ('admin_queue_page', '''
+        SELECT t.id, t.type, t.amount, t.created_at, u.email
+        FROM transactions t
+        JOIN users u ON t.user_id = u.id
+        WHERE t.status = 'pending' AND t.type = ? AND (t.created_at, t.id) < (?, ?)
+        ORDER BY t.created_at DESC, t.id DESC
+        LIMIT 26
+    ''', ('deposit', '9999-12-31', 0)),
+    ('admin_queue_counts', '''
+        SELECT type, COUNT(*) FROM transactions
+        WHERE status = 'pending'
+        GROUP BY type
+    ''', ()),
+    ('admin_recent_transactions', '''
+        SELECT t.*, u.first_name, u.last_name, u.email
+        FROM transactions t
+        JOIN users u ON t.user_id = u.id
+        ORDER BY t.created_at DESC
+        LIMIT 10
+    ''', ()),
+    ('positions_page', '''
+        SELECT * FROM user_positions
+        WHERE user_id = ? AND (sort_date, kind, id) < (?, ?, ?)
+        ORDER BY sort_date DESC, kind DESC, id DESC
+        LIMIT 20
+    ''', (1, '9999-12-31', 'z', 0)),
+    ('security_logs_recent', '''
+        SELECT * FROM security_logs
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+    ''', (1,)),
+)
+
+# "SCAN table" sans index : parcours complet de la table
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+# Sous-requêtes et vues évaluées à part : les parcourir ne touche pas une table
+SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """
+    Passer les requêtes chaudes à EXPLAIN QUERY PLAN.
+
+    Retourne la liste (nom, table) des requêtes qui parcourent une table
+    entière au lieu d'utiliser un index.
+    """
+    full_scans = []
+    for name, sql, params in queries:
+        try:
+            plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Plan de {name} indisponible: {e}")
+            continue
+        subqueries = {match.group(1) for match in (SUBQUERY.match(row[3]) for row in plan) if match}
+        for row in plan:
+            match = FULL_SCAN.match(row[3])
+            if match and match.group(1) not in subqueries:
+                full_scans.append((name, match.group(1)))
+                print(f"⚠️ Requête chaude {name}: parcours complet de {match.group(1)}")
+    return full_scans
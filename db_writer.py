@@ -0,0 +1,145 @@
+"""
+File d'écriture unique par processus (group commit)
+
+Un thread dédié par worker valide les écritures chaudes : mouvements de
+solde et transactions (investissements, arrêts, retraits, dépôts,
+validations admin), notifications et journal de sécurité. Les handlers y
+déposent une opération et reçoivent un Future ; le thread regroupe tout ce
+qui arrive pendant quelques millisecondes dans une seule transaction
+BEGIN IMMEDIATE, sans boucle de retry ni sleep côté requête. Une
+vérification de solde faite dans l'opération est donc atomique avec le
+débit.
+
+Les écritures rares (inscription, profil, tickets de support, écrans
+admin, scheduler) restent sur leur propre connexion et attendent le verrou
+via busy_timeout.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from database_config import open_connection
+
+class WriteTimeout(Exception):
+    """Opération annulée avant d'avoir été exécutée par le writer"""
+
+class WriteQueue:
+    """Thread d'écriture unique avec validation groupée"""
+
+    def __init__(self, database, commit_interval=0.005, max_batch=500):
+        self.database = database
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Démarrage paresseux, une fois par processus (les threads ne survivent pas au fork)
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, operation):
+        """
+        Déposer une opération et retourner son Future.
+
+        operation est un callable(conn) exécuté dans la transaction du lot ;
+        il ne doit ni valider ni annuler lui-même. Sa valeur de retour
+        devient le résultat du Future.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def execute(self, sql, params=()):
+        """Déposer une requête ; le Future renvoie le lastrowid"""
+        return self.submit(lambda conn: conn.execute(sql, params).lastrowid)
+
+    def executemany(self, sql, seq_of_params):
+        """Déposer une requête multi-lignes ; le Future renvoie le nombre de lignes"""
+        return self.submit(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    def wait(self, future, timeout):
+        """
+        Attendre le résultat d'une opération déposée avec submit().
+
+        Si elle n'a pas démarré dans le délai, elle est annulée et WriteTimeout
+        est levée : rien n'a été écrit, la requête peut être rejouée sans
+        double débit. Si le writer l'exécute déjà, on attend la fin du lot
+        (bornée par le busy_timeout de sa connexion) pour ne jamais répondre
+        « échec » sur une écriture qui sera validée.
+        """
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriteTimeout(f"Écriture non démarrée après {timeout}s")
+            return future.result()
+
+    def flush(self, timeout=None):
+        """Attendre que tout ce qui a été déposé jusqu'ici soit validé"""
+        return self.submit(lambda conn: None).result(timeout)
+
+    def _collect(self, first):
+        """Regrouper les opérations arrivées pendant commit_interval"""
+        batch = [first]
+        deadline = time.monotonic() + self.commit_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = open_connection(self.database)
+        # Transactions gérées explicitement (BEGIN / SAVEPOINT / COMMIT)
+        conn.isolation_level = None
+        while True:
+            # Les opérations annulées par wait() sont écartées sans être exécutées
+            batch = [(operation, future) for operation, future in self._collect(self._queue.get())
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            results = []
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for operation, future in batch:
+                    # Un SAVEPOINT par opération : un échec n'annule pas le reste du lot
+                    conn.execute('SAVEPOINT op')
+                    try:
+                        results.append((future, operation(conn), None))
+                        conn.execute('RELEASE op')
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO op')
+                        conn.execute('RELEASE op')
+                        results.append((future, None, e))
+                conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                print(f"❌ Erreur validation lot d'écriture ({len(batch)} opérations): {e}")
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                results = [(future, None, e) for _, future in batch]
+
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
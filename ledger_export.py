@@ -0,0 +1,167 @@
+"""
+Export en flux des transactions et des positions (CSV ou JSON Lines)
+
+Les lignes sont lues par fetchmany et écrites au fil de l'eau, avec
+compression gzip optionnelle : la mémoire reste constante quel que soit
+le volume exporté. Les transactions couvrent la table chaude et les
+partitions mensuelles (ledger_partitions).
+
+Ligne de commande :
+    python ledger_export.py transactions --format csv --gzip --from 2025-01-01 -o export.csv.gz
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+from database_config import open_connection
+from ledger_partitions import LEDGER_COLUMNS, ledger_sources
+from position_history import POSITION_COLUMNS, POSITION_KINDS
+
+EXPORT_DATASETS = ('transactions', 'positions')
+EXPORT_FORMATS = ('csv', 'jsonl')
+FETCH_SIZE = 1000
+# Taille visée d'un morceau envoyé au client (octets)
+CHUNK_SIZE = 64 * 1024
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+def _filters(user_id=None, type_column=None, type_value=None, date_column=None, date_from=None, date_to=None):
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append('user_id = ?')
+        params.append(user_id)
+    if type_value:
+        clauses.append(f'{type_column} = ?')
+        params.append(type_value)
+    if date_from:
+        clauses.append(f'{date_column} >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append(f"{date_column} < date(?, '+1 day')")
+        params.append(date_to)
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+def _fetch_all(cursor):
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            yield tuple(row)
+
+def iter_transactions(conn, user_id=None, tx_type=None, date_from=None, date_to=None):
+    """Transactions filtrées, partitions comprises, mois par mois"""
+    where, params = _filters(user_id, 'type', tx_type, 'created_at', date_from, date_to)
+    sources = ledger_sources(conn, date_from, date_to)
+    try:
+        for source in sources:
+            cursor = conn.execute(f'''
+                SELECT {', '.join(LEDGER_COLUMNS)} FROM {source}
+                {where}
+                ORDER BY created_at, id
+            ''', params)
+            # Curseur fermé avant le DETACH de sa partition, même si l'export est interrompu
+            try:
+                yield from _fetch_all(cursor)
+            finally:
+                cursor.close()
+    finally:
+        sources.close()
+
+def iter_positions(conn, user_id=None, kind=None, date_from=None, date_to=None):
+    """Positions filtrées (vue user_positions)"""
+    where, params = _filters(user_id, 'kind', kind if kind in POSITION_KINDS else None,
+                             'start_date', date_from, date_to)
+    cursor = conn.execute(f'''
+        SELECT user_id, {', '.join(POSITION_COLUMNS)} FROM user_positions
+        {where}
+        ORDER BY start_date, kind, id
+    ''', params)
+    yield from _fetch_all(cursor)
+
+def dataset_rows(conn, dataset, user_id=None, type=None, date_from=None, date_to=None):
+    """(colonnes, itérateur de lignes) du jeu de données"""
+    if dataset == 'transactions':
+        return LEDGER_COLUMNS, iter_transactions(conn, user_id, type, date_from, date_to)
+    if dataset == 'positions':
+        return ('user_id',) + POSITION_COLUMNS, iter_positions(conn, user_id, type, date_from, date_to)
+    raise ValueError(f'Jeu de données inconnu: {dataset}')
+
+def csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def jsonl_chunks(columns, rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines).encode('utf-8')
+            lines, size = [], 0
+    yield ''.join(lines).encode('utf-8')
+
+def gzip_chunks(chunks):
+    """Compresser un flux de morceaux au format gzip, sans le mettre en mémoire"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(conn, dataset, fmt='csv', compress=False, **filters):
+    """Générateur d'octets de l'export (CSV ou JSON Lines, gzip optionnel)"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Format inconnu: {fmt}')
+    columns, rows = dataset_rows(conn, dataset, **filters)
+    chunks = csv_chunks(columns, rows) if fmt == 'csv' else jsonl_chunks(columns, rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+def export_filename(dataset, fmt, compress, suffix=''):
+    return f"{dataset}{suffix}.{fmt}{'.gz' if compress else ''}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export en flux des transactions ou des positions')
+    parser.add_argument('dataset', choices=EXPORT_DATASETS)
+    parser.add_argument('--database', default='investment_platform.db')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--user-id', type=int)
+    parser.add_argument('--type', help='type de transaction ou de position')
+    parser.add_argument('--from', dest='date_from', help='AAAA-MM-JJ (inclus)')
+    parser.add_argument('--to', dest='date_to', help='AAAA-MM-JJ (inclus)')
+    parser.add_argument('-o', '--output', help='fichier de sortie (sortie standard par défaut)')
+    args = parser.parse_args(argv)
+
+    conn = open_connection(args.database)
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_stream(conn, args.dataset, args.format, args.gzip,
+                                   user_id=args.user_id, type=args.type,
+                                   date_from=args.date_from, date_to=args.date_to):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Partitionnement mensuel du registre des transactions
+
+La table transactions ne garde que les mois récents et les transactions
+en attente. Les mois clos sont déplacés, par lots, dans un fichier SQLite
+par mois (ledger_archive/transactions_AAAA-MM.db), inscrit dans la table
+ledger_partitions. Les lectures historiques (exports de ledger_export)
+parcourent les sources une à une avec ledger_sources(), qui attache
+chaque partition utile (ATTACH) le temps de son parcours.
+
+Les écrans ne lisent que la table chaude : les transactions récentes du
+dashboard administrateur sont dans la fenêtre chaude et la file des
+transactions en attente n'est jamais archivée. L'historique des mois
+archivés s'obtient par export.
+
+Les ids restent uniques d'une partition à l'autre (AUTOINCREMENT : jamais
+réutilisés). Une transaction SQLite en WAL n'est pas atomique entre deux
+fichiers : après un arrêt entre la copie et la suppression d'un lot, les
+lignes sont présentes des deux côtés jusqu'au passage suivant, qui
+termine le déplacement (INSERT OR IGNORE puis DELETE).
+"""
+
+import os
+
+LEDGER_HOT_MONTHS = int(os.environ.get('LEDGER_HOT_MONTHS', 3))
+LEDGER_PARTITION_BATCH = 5000
+
+LEDGER_COLUMNS = (
+    'id', 'user_id', 'type', 'amount', 'status', 'transaction_hash', 'created_at', 'updated_at'
+)
+
+# Table d'une partition (sans clé étrangère : users est dans une autre base)
+PARTITION_TABLE_DDL = (
+    '''
+    CREATE TABLE IF NOT EXISTS {alias}.transactions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        status TEXT,
+        transaction_hash TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {alias}.idx_transactions_user_created ON transactions (user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS {alias}.idx_transactions_created ON transactions (created_at)',
+)
+
+def default_archive_dir(database):
+    """Répertoire des partitions, à côté de la base"""
+    return os.environ.get('LEDGER_ARCHIVE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(database)), 'ledger_archive'
+    )
+
+def partition_alias(month):
+    return 'ledger_' + month.replace('-', '_')
+
+def _month_bounds(conn, month):
+    return conn.execute("SELECT ? || '-01', date(? || '-01', '+1 month')", (month, month)).fetchone()
+
+def _attach(conn, path, alias):
+    # ATTACH est interdit dans une transaction ouverte
+    conn.commit()
+    conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+
+def _detach(conn, alias):
+    conn.commit()
+    conn.execute(f'DETACH DATABASE {alias}')
+
+def closed_months(conn, hot_months=LEDGER_HOT_MONTHS):
+    """Mois antérieurs à la fenêtre chaude qui ont encore des lignes closes dans transactions"""
+    cutoff = conn.execute(
+        "SELECT date('now', 'start of month', ?)", (f'-{max(hot_months - 1, 0)} months',)
+    ).fetchone()[0]
+    return [row[0] for row in conn.execute('''
+        SELECT DISTINCT strftime('%Y-%m', created_at)
+        FROM transactions
+        WHERE created_at < ? AND status != 'pending'
+        ORDER BY 1
+    ''', (cutoff,)).fetchall()]
+
+def archive_month(conn, archive_dir, month, batch_size=LEDGER_PARTITION_BATCH):
+    """Déplacer les transactions closes de month (AAAA-MM) dans sa partition ; retourne le nombre déplacé"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'transactions_{month}.db')
+    alias = partition_alias(month)
+    month_start, month_end = _month_bounds(conn, month)
+    columns = ', '.join(LEDGER_COLUMNS)
+    scope = "created_at >= ? AND created_at < ? AND status != 'pending' AND id <= ?"
+
+    moved = 0
+    _attach(conn, path, alias)
+    try:
+        for statement in PARTITION_TABLE_DDL:
+            conn.execute(statement.format(alias=alias))
+        conn.commit()
+
+        while True:
+            # Lot borné par id : copie et suppression portent exactement sur les mêmes lignes
+            last_id = conn.execute('''
+                SELECT MAX(id) FROM (
+                    SELECT id FROM main.transactions
+                    WHERE created_at >= ? AND created_at < ? AND status != 'pending'
+                    ORDER BY id
+                    LIMIT ?
+                )
+            ''', (month_start, month_end, batch_size)).fetchone()[0]
+            if last_id is None:
+                break
+            params = (month_start, month_end, last_id)
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {alias}.transactions ({columns})
+                SELECT {columns} FROM main.transactions WHERE {scope}
+            ''', params)
+            moved += conn.execute(f'DELETE FROM main.transactions WHERE {scope}', params).rowcount
+            conn.commit()
+
+        conn.execute(f'''
+            INSERT INTO ledger_partitions (month, path, row_count, min_created_at, max_created_at)
+            SELECT ?, ?, COUNT(*), MIN(created_at), MAX(created_at) FROM {alias}.transactions
+            WHERE 1
+            ON CONFLICT(month) DO UPDATE SET
+                path = excluded.path,
+                row_count = excluded.row_count,
+                min_created_at = excluded.min_created_at,
+                max_created_at = excluded.max_created_at,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (month, path))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _detach(conn, alias)
+    return moved
+
+def partition_ledger(conn, archive_dir, hot_months=LEDGER_HOT_MONTHS, batch_size=LEDGER_PARTITION_BATCH):
+    """Déplacer tous les mois clos ; retourne {mois: lignes déplacées}"""
+    return {
+        month: archive_month(conn, archive_dir, month, batch_size)
+        for month in closed_months(conn, hot_months)
+    }
+
+def partitions_for_range(conn, date_from=None, date_to=None):
+    """Partitions (mois, chemin) qui recouvrent [date_from, date_to] (AAAA-MM-JJ, bornes incluses)"""
+    clauses, params = [], []
+    if date_from:
+        clauses.append("month >= strftime('%Y-%m', ?)")
+        params.append(date_from)
+    if date_to:
+        clauses.append("month <= strftime('%Y-%m', ?)")
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    return conn.execute(f'SELECT month, path FROM ledger_partitions {where} ORDER BY month', params).fetchall()
+
+def ledger_sources(conn, date_from=None, date_to=None):
+    """
+    Tables à parcourir pour la période, une à la fois et dans l'ordre des
+    mois : chaque partition, attachée le temps de son parcours, puis la
+    table chaude.
+    """
+    for month, path in partitions_for_range(conn, date_from, date_to):
+        alias = partition_alias(month)
+        _attach(conn, path, alias)
+        try:
+            yield f'{alias}.transactions'
+        finally:
+            _detach(conn, alias)
+    yield 'main.transactions'
@@ -0,0 +1,362 @@
+"""
+Banc de charge des parcours principaux
+
+Des utilisateurs virtuels (threads) se connectent avec les comptes du
+générateur (user{n}@load.test), puis enchaînent pendant --duration des
+actions tirées selon --mix : dashboard, historique des investissements,
+catalogue des projets (liste et fiche), investissements (ROI, staking,
+bot, projet), polling du chat support (since_id + ETag). Des administrateurs virtuels parcourent la file des transactions
+en attente et son delta. Chaque action est chronométrée ; le rapport donne
+débit, percentiles et codes HTTP, en séparant les refus métier (4xx,
+ex. solde insuffisant) des erreurs serveur (5xx, réseau), et peut être enregistré (--output) puis
+comparé à une référence (--baseline).
+
+Avec --spawn, un gunicorn local est lancé sur la base donnée (même
+configuration que start.sh, scheduler désactivé) le temps de la mesure.
+
+Ligne de commande :
+    python data_generator.py --database loadtest.db --scale 0.01
+    python load_test.py --spawn loadtest.db --users 50 --duration 60 --output run.json
+    python load_test.py --base-url http://127.0.0.1:8000 --baseline run.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from data_generator import DEFAULT_PASSWORD
+
+ACTIONS = ('dashboard', 'history', 'projects', 'invest', 'support')
+DEFAULT_MIX = 'dashboard=25,history=15,projects=10,invest=10,support=40'
+ADMIN_ACTIVATION_CODE = 'ADMIN2024!'
+REQUEST_TIMEOUT = 30
+# Pause entre deux actions d'un utilisateur virtuel (secondes, tirée uniformément)
+THINK_TIME = (0.0, 0.2)
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Une redirection (vers /login, /admin-activation-required) est un résultat à compter, pas à suivre
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class Results:
+    """Latences et codes HTTP par action, partagés entre threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, action, status, seconds):
+        with self._lock:
+            self.latencies[action].append(seconds)
+            self.statuses[action][str(status)] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        with self._lock:
+            for action in sorted(self.latencies):
+                samples = sorted(self.latencies[action])
+                statuses = dict(self.statuses[action])
+                errors = sum(count for status, count in statuses.items()
+                             if status == 'error' or status.startswith('5'))
+                # Refus métier (validation, solde insuffisant) : la requête a abouti sans effet
+                rejected = sum(count for status, count in statuses.items() if status.startswith('4'))
+                report[action] = {
+                    'count': len(samples),
+                    'rps': round(len(samples) / elapsed, 2),
+                    'p50_ms': _percentile(samples, 50),
+                    'p90_ms': _percentile(samples, 90),
+                    'p99_ms': _percentile(samples, 99),
+                    'max_ms': round(samples[-1] * 1000, 1),
+                    'errors': errors,
+                    'rejected': rejected,
+                    'statuses': statuses,
+                }
+        return report
+
+def _percentile(samples, percent):
+    if not samples:
+        return 0.0
+    index = min(int(round(percent / 100 * (len(samples) - 1))), len(samples) - 1)
+    return round(samples[index] * 1000, 1)
+
+class Client:
+    """Session HTTP d'un utilisateur virtuel (cookies propres)"""
+
+    def __init__(self, base_url, results):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def request(self, action, path, payload=None, headers=None):
+        """(statut, corps JSON ou None, en-têtes) ; la durée est enregistrée sous action"""
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=dict(headers or {}))
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as response:
+                status, body, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, body, response_headers = e.code, e.read(), e.headers
+        except (urllib.error.URLError, OSError):
+            self.results.record(action, 'error', time.perf_counter() - started)
+            return None, None, {}
+        self.results.record(action, status, time.perf_counter() - started)
+        try:
+            parsed = json.loads(body) if body and 'json' in response_headers.get('Content-Type', '') else None
+        except ValueError:
+            parsed = None
+        return status, parsed, response_headers
+
+class VirtualUser:
+    """Parcours d'un utilisateur : connexion puis actions pondérées"""
+
+    def __init__(self, client, email, password, mix, rng):
+        self.client = client
+        self.email = email
+        self.password = password
+        self.actions = [getattr(self, f'do_{name}') for name in mix]
+        self.weights = list(mix.values())
+        self.rng = rng
+        self.ticket_id = None
+        self.since_id = 0
+        self.etag = None
+
+    def login(self):
+        status, _, _ = self.client.request('login', '/login', {'email': self.email, 'password': self.password})
+        return status == 200
+
+    def step(self):
+        self.rng.choices(self.actions, self.weights)[0]()
+
+    def do_dashboard(self):
+        self.client.request('dashboard', '/dashboard')
+
+    def do_history(self):
+        self.client.request('investment_history', '/investment-history')
+        self.client.request('investment_history_positions', '/investment-history/positions?limit=20')
+
+    def do_projects(self):
+        self.client.request('projects', '/projects')
+        self.client.request('project_detail', f'/project/{self.rng.randint(1, 10)}')
+
+    def do_invest(self):
+        kind = self.rng.choice(('roi', 'staking', 'bot', 'project'))
+        amount = round(self.rng.uniform(20, 60), 2)
+        if kind == 'roi':
+            self.client.request('invest_roi', '/invest-roi', {'plan_id': self.rng.randint(1, 5), 'amount': amount})
+        elif kind == 'staking':
+            self.client.request('invest_staking', '/invest-staking',
+                                {'plan_id': self.rng.randint(1, 10), 'amount': amount})
+        elif kind == 'bot':
+            self.client.request('start_trading_bot', '/start-trading-bot',
+                                {'strategy_id': self.rng.randint(1, 10), 'amount': amount})
+        else:
+            self.client.request('invest_project', '/invest-project',
+                                {'project_id': self.rng.randint(1, 10), 'amount': amount})
+
+    def do_support(self):
+        if self.ticket_id is None:
+            _, body, _ = self.client.request('support_create_ticket', '/support/create-ticket', {
+                'subject': 'Test de charge', 'message': 'Ouverture du ticket', 'category': 'general'
+            })
+            self.ticket_id = (body or {}).get('ticket_id')
+            return
+        if self.rng.random() < 0.1:
+            self.client.request('support_send_message', '/support/send-message',
+                                {'ticket_id': self.ticket_id, 'message': 'Message de test de charge'})
+            return
+        headers = {'If-None-Match': self.etag} if self.etag else None
+        status, body, response_headers = self.client.request(
+            'support_poll', f'/support/get-messages/{self.ticket_id}?since_id={self.since_id}', headers=headers
+        )
+        if status == 200 and body:
+            self.since_id = body.get('last_id') or self.since_id
+            self.etag = response_headers.get('ETag')
+
+class VirtualAdmin:
+    """Parcours administrateur : file des transactions en attente et son delta"""
+
+    def __init__(self, client, rng):
+        self.client = client
+        self.rng = rng
+        self.since_id = 0
+
+    def login(self):
+        status, _, _ = self.client.request('admin_activate', '/admin/activate',
+                                           {'activation_code': ADMIN_ACTIVATION_CODE, 'duration': 240})
+        return status == 200
+
+    def step(self):
+        if self.rng.random() < 0.3:
+            status, body, _ = self.client.request('admin_queue', '/admin/transactions/queue?limit=25')
+        else:
+            status, body, _ = self.client.request('admin_queue_changes',
+                                                  f'/admin/transactions/changes?since_id={self.since_id}')
+            if status == 200 and body:
+                self.since_id = body.get('last_id', self.since_id)
+        # Accès admin propre à chaque worker : réactiver quand la requête tombe sur un autre
+        if status == 302:
+            self.login()
+
+def _run_actor(actor, deadline, stop):
+    if not actor.login():
+        return
+    while not stop.is_set() and time.monotonic() < deadline:
+        actor.step()
+        time.sleep(actor.rng.uniform(*THINK_TIME))
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ACTIONS:
+            raise ValueError(f'Action inconnue: {name}')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def run_load(base_url, users, admins, duration, mix, user_ids, password, ramp_up, seed):
+    """Lancer la charge et retourner (rapport par action, durée effective)"""
+    results = Results()
+    rng = random.Random(seed)
+    stop = threading.Event()
+    started = time.monotonic()
+    deadline = started + ramp_up + duration
+    threads = []
+    actors = [
+        VirtualUser(Client(base_url, results), f'user{rng.randint(*user_ids)}@load.test', password,
+                    mix, random.Random(rng.random()))
+        for _ in range(users)
+    ] + [VirtualAdmin(Client(base_url, results), random.Random(rng.random())) for _ in range(admins)]
+
+    try:
+        for index, actor in enumerate(actors):
+            thread = threading.Thread(target=_run_actor, args=(actor, deadline, stop), daemon=True)
+            thread.start()
+            threads.append(thread)
+            if ramp_up:
+                time.sleep(ramp_up / len(actors))
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join(REQUEST_TIMEOUT)
+    elapsed = time.monotonic() - started
+    return results.summary(elapsed), elapsed
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def spawn_gunicorn(database, workers, threads):
+    """Démarrer gunicorn (configuration de start.sh) sur une copie de travail de database"""
+    workdir = tempfile.mkdtemp(prefix='loadtest_')
+    # main.py ouvre investment_platform.db dans le répertoire courant
+    shutil.copy(database, os.path.join(workdir, 'investment_platform.db'))
+    port = _free_port()
+    env = dict(os.environ, DISABLE_SCHEDULER='1', FLASK_ENV='production',
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'loadtest'),
+               METRICS_DIR=os.path.join(workdir, 'metrics'))
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--worker-class', 'gthread', '--threads', str(threads),
+        '--timeout', '120', '--chdir', workdir,
+        '--pythonpath', os.path.dirname(os.path.abspath(__file__)), 'main:app',
+    ], env=env)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn arrêté au démarrage (code {process.returncode})')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, f'http://127.0.0.1:{port}', workdir
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError('gunicorn ne répond pas après 60 s')
+
+def print_report(report, elapsed, baseline=None):
+    print(f"\n📊 Résultats sur {elapsed:.1f}s")
+    print(f"{'action':32} {'n':>7} {'req/s':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'err':>5} {'4xx':>5}  statuts")
+    for action, stats in report.items():
+        line = (f"{action:32} {stats['count']:>7} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p90_ms']:>8} "
+                f"{stats['p99_ms']:>8} {stats['max_ms']:>8} {stats['errors']:>5} "
+                f"{stats['rejected']:>5}  {stats['statuses']}")
+        reference = (baseline or {}).get(action)
+        if reference and reference['p99_ms']:
+            change = (stats['p99_ms'] - reference['p99_ms']) / reference['p99_ms'] * 100
+            line += f"  p99 {change:+.0f}% vs référence"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Banc de charge des parcours principaux')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--base-url', help='serveur déjà démarré')
+    target.add_argument('--spawn', metavar='DATABASE', help='démarrer un gunicorn local sur une copie de cette base')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=20, help='utilisateurs virtuels concurrents')
+    parser.add_argument('--admins', type=int, default=1, help='administrateurs virtuels concurrents')
+    parser.add_argument('--duration', type=float, default=60, help='secondes de mesure après la montée en charge')
+    parser.add_argument('--ramp-up', type=float, default=5)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'poids des actions (défaut {DEFAULT_MIX})')
+    parser.add_argument('--user-ids', default='1-10000', help='plage des comptes user{n}@load.test utilisés')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='enregistrer le rapport (JSON)')
+    parser.add_argument('--baseline', help='rapport de référence à comparer (JSON)')
+    args = parser.parse_args(argv)
+
+    first, _, last = args.user_ids.partition('-')
+    user_ids = (int(first), int(last or first))
+    process = workdir = None
+    base_url = args.base_url
+    if args.spawn:
+        process, base_url, workdir = spawn_gunicorn(args.spawn, args.workers, args.threads)
+        print(f"🚀 gunicorn {args.workers}×{args.threads} sur {base_url} ({workdir})")
+
+    try:
+        report, elapsed = run_load(base_url, args.users, args.admins, args.duration, parse_mix(args.mix),
+                                   user_ids, args.password, args.ramp_up, args.seed)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            process.wait(30)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['actions']
+    print_report(report, elapsed, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+                'elapsed': round(elapsed, 2),
+                'actions': report
+            }, f, indent=1)
+        print(f"💾 Rapport enregistré: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, g, has_app_context, Response
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import os
@@ -12,6 +12,29 @@ import time
 import sqlite3
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
+from database_config import ConnectionPool, PooledConnection
+from db_writer import WriteQueue, WriteTimeout
+from notification_pipeline import NotificationBuffer
+from profit_calculator import accrue_daily_profits, accrue_daily_profits_sharded
+from accrual_kernel import project_user_earnings
+from db_indexes import check_query_plans
+from migrations import run_migrations
+from catalog_cache import CatalogCache
+from portfolio_summary import get_portfolio_summary, record_position_opened, record_position_closed
+from position_history import fetch_positions_page, DEFAULT_PAGE_SIZE
+import admin_queue
+from realtime import EventBroker, TopicWatcher, StreamSlots, stream_events, last_event_id, SSE_MAX_STREAMS, SSE_BUSY_RETRY_MS
+from support_chat import support_topic, fetch_messages, messages_etag, latest_message_ids
+from notification_retention import run_notification_retention
+from ledger_partitions import partition_ledger, default_archive_dir
+from db_backup import run_backup, default_backup_dir, BACKUP_INTERVAL_MINUTES
+from bulk_restore import restore_file, default_dump_dir, latest_dump
+from ledger_export import EXPORT_DATASETS, EXPORT_FORMATS, EXPORT_MIMETYPES, export_stream, export_filename
+from request_metrics import MetricsRegistry, QueryStats, InstrumentedConnection, render_prometheus
+from slow_queries import SlowQueryLog
+from profiler import RequestProfiler, sample_stacks, collapse, SAMPLE_INTERVAL_MS
+from notification_feed import (notification_topic, get_notification_state, fetch_notifications_since,
+                               mark_notifications_read, notification_versions)
 
 # Utilisation de SQLite pour la persistance
 REPLIT_DB_AVAILABLE = False
@@ -23,7 +46,7 @@ TELEGRAM_USER_BOT_ENABLED = False
 
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
 
 # Configuration PWA
 @app.route('/static/sw.js')
@@ -38,6 +61,11 @@ def manifest():
 def offline():
     return app.send_static_file('offline.html')
 
+# Enfant spawn du calcul des profits (accrue_daily_profits_sharded) : multiprocessing
+# réimporte `python main.py` sous le nom __mp_main__ ; l'enfant ne lit que la base,
+# sans migrations, contrôle des plans ni vidage du writer à la sortie
+SPAWNED_CHILD = __name__ == '__mp_main__'
+
 # Configuration avec persistance
 if REPLIT_DB_AVAILABLE:
     # Utiliser un répertoire persistant pour la base de données
@@ -48,775 +76,94 @@ if REPLIT_DB_AVAILABLE:
 else:
     DATABASE = 'investment_platform.db'
 
+# Pool de connexions par worker : les PRAGMA ne sont exécutés qu'à l'ouverture.
+# Une connexion par thread de requête ordinaire (WEB_THREADS - SSE_MAX_STREAMS,
+# exporté par start.sh) : une requête garde la sienne jusqu'au teardown
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or
+                   int(os.environ.get('WEB_THREADS', 32)) - int(os.environ.get('SSE_MAX_STREAMS', SSE_MAX_STREAMS)))
+db_pool = ConnectionPool(DATABASE, max_size=DB_POOL_SIZE)
+
+# Writer unique par worker : notifications, logs et écritures de solde validés en groupe
+db_writer = WriteQueue(DATABASE)
+# Délai max d'attente d'un Future d'écriture dans une requête : au-delà du
+# busy_timeout (60 s) du writer, pour qu'un lot bloqué sur le verrou échoue
+# avant que la requête n'abandonne
+WRITE_TIMEOUT = 90
+# Valider les écritures en attente à l'arrêt du worker
+if not SPAWNED_CHILD:
+    atexit.register(db_writer.flush, WRITE_TIMEOUT)
+
+# Pub/sub en mémoire des flux SSE (par worker)
+event_broker = EventBroker()
+# Réveil des flux sur les écritures des autres workers (PRAGMA data_version + sondes par sujet)
+topic_watcher = TopicWatcher(DATABASE, event_broker, {
+    'support': latest_message_ids,
+    'notifications': notification_versions,
+})
+# Flux SSE simultanés par worker : chacun immobilise un thread gthread
+stream_slots = StreamSlots(int(os.environ.get('SSE_MAX_STREAMS', SSE_MAX_STREAMS)))
+
+def publish_notifications(user_ids):
+    """Réveiller les flux de notifications des utilisateurs d'un lot écrit"""
+    for user_id in user_ids:
+        event_broker.publish(notification_topic(user_id))
+
+# Notifications bufferisées, écrites par lots (executemany) via le writer
+notification_buffer = NotificationBuffer(db_writer, on_written=publish_notifications)
+# Enregistré après le writer : vidé en premier à l'arrêt (atexit est LIFO)
+if not SPAWNED_CHILD:
+    atexit.register(lambda: notification_buffer.flush().result(WRITE_TIMEOUT))
+
+# Catalogue (plans, stratégies, traders, projets, FAQ) en mémoire, invalidé par catalog_version
+catalog = CatalogCache()
+
+# Latences et compteurs SQL par route, exposés par /metrics
+metrics_registry = MetricsRegistry()
+# Jeton attendu par /metrics (Authorization: Bearer ...) ; sans jeton l'endpoint est désactivé
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Requêtes SQL au-delà de SLOW_QUERY_MS, avec leur plan (dashboard administrateur, tous workers avec METRICS_DIR)
+slow_query_log = SlowQueryLog()
+# cProfile des prochaines requêtes de ce worker, armé depuis /admin/profile/requests
+request_profiler = RequestProfiler()
+
+# Nombre de processus pour le calcul des profits (1 = mode séquentiel)
+PROFIT_WORKERS = int(os.environ.get('PROFIT_WORKERS', 1))
+
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            first_name TEXT NOT NULL,
-            last_name TEXT NOT NULL,
-            wallet_address TEXT,
-            balance REAL DEFAULT 0.0,
-            pending_balance REAL DEFAULT 0.0,
-            kyc_status TEXT DEFAULT 'pending',
-            referral_code TEXT UNIQUE,
-            referred_by TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            two_fa_enabled BOOLEAN DEFAULT 0,
-            two_fa_secret TEXT,
-            telegram_id INTEGER UNIQUE,
-            last_login TIMESTAMP,
-            failed_login_attempts INTEGER DEFAULT 0,
-            account_locked BOOLEAN DEFAULT 0,
-            locked_until TIMESTAMP
-        )
-    ''')
-
-    
-
-    # User Investments table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_investments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            plan_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_date TIMESTAMP,
-            daily_profit REAL NOT NULL,
-            total_earned REAL DEFAULT 0.0,
-            is_active BOOLEAN DEFAULT 1,
-            transaction_hash TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (plan_id) REFERENCES roi_plans (id)
-        )
-    ''')
-
-    # Crowdfunding Projects table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            category TEXT NOT NULL,
-            target_amount REAL NOT NULL,
-            raised_amount REAL DEFAULT 0.0,
-            expected_return REAL NOT NULL,
-            duration_months INTEGER NOT NULL,
-            min_investment REAL NOT NULL,
-            max_investment REAL NOT NULL,
-            status TEXT DEFAULT 'collecting',
-            image_url TEXT,
-            video_url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            deadline TIMESTAMP
-        )
-    ''')
-
-    # Project Investments table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS project_investments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            project_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            investment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            transaction_hash TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (project_id) REFERENCES projects (id)
-        )
-    ''')
-
-    # Transactions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            transaction_hash TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-def backup_critical_data():
-    """Sauvegarder les données critiques dans Replit DB"""
-    if not REPLIT_DB_AVAILABLE:
-        return
-    
+    """Amener le schéma à la dernière version (une simple lecture si la base est à jour)"""
+    # Connexion brute : run_migrations pilote lui-même ses transactions
+    conn = db_pool.acquire()
     try:
-        conn = get_db_connection()
-        
-        # Sauvegarder TOUS les investissements ROI (actifs et terminés)
-        all_investments = conn.execute('''
-            SELECT * FROM user_investments ORDER BY start_date DESC
-        ''').fetchall()
-        
-        investments_data = []
-        for inv in all_investments:
-            investments_data.append(dict(inv))
-        
-        replit_db['all_investments_history'] = json.dumps(investments_data, default=str)
-        
-        # Sauvegarder TOUS les investissements staking (actifs et terminés)
-        all_staking = conn.execute('''
-            SELECT * FROM user_staking ORDER BY start_date DESC
-        ''').fetchall()
-        
-        staking_data = []
-        for stake in all_staking:
-            staking_data.append(dict(stake))
-        
-        replit_db['all_staking_history'] = json.dumps(staking_data, default=str)
-        
-        # Sauvegarder TOUS les bots de trading (actifs et terminés)
-        all_bots = conn.execute('''
-            SELECT * FROM user_trading_bots ORDER BY start_date DESC
-        ''').fetchall()
-        
-        bots_data = []
-        for bot in all_bots:
-            bots_data.append(dict(bot))
-        
-        replit_db['all_bots_history'] = json.dumps(bots_data, default=str)
-        
-        # Sauvegarder TOUS les copy trades (actifs et terminés)
-        all_copy_trades = conn.execute('''
-            SELECT * FROM user_copy_trading ORDER BY start_date DESC
-        ''').fetchall()
-        
-        copy_trades_data = []
-        for trade in all_copy_trades:
-            copy_trades_data.append(dict(trade))
-        
-        replit_db['all_copy_trading_history'] = json.dumps(copy_trades_data, default=str)
-        
-        # Sauvegarder TOUS les investissements projets
-        all_projects = conn.execute('''
-            SELECT * FROM project_investments ORDER BY investment_date DESC
-        ''').fetchall()
-        
-        projects_data = []
-        for proj in all_projects:
-            projects_data.append(dict(proj))
-        
-        replit_db['all_projects_history'] = json.dumps(projects_data, default=str)
-        
-        # Sauvegarder TOUTES les transactions
-        all_transactions = conn.execute('''
-            SELECT * FROM transactions ORDER BY created_at DESC
-        ''').fetchall()
-        
-        transactions_data = []
-        for trans in all_transactions:
-            transactions_data.append(dict(trans))
-        
-        replit_db['all_transactions_history'] = json.dumps(transactions_data, default=str)
-        
-        # Sauvegarder les soldes utilisateurs
-        users = conn.execute('SELECT id, email, balance, first_name, last_name FROM users').fetchall()
-        users_data = []
-        for user in users:
-            users_data.append(dict(user))
-        
-        replit_db['user_balances'] = json.dumps(users_data, default=str)
-        
-        # Sauvegarder les plans pour restauration
-        roi_plans = conn.execute('SELECT * FROM roi_plans').fetchall()
-        roi_plans_data = []
-        for plan in roi_plans:
-            roi_plans_data.append(dict(plan))
-        replit_db['roi_plans_backup'] = json.dumps(roi_plans_data, default=str)
-        
-        replit_db['last_backup'] = datetime.now().isoformat()
-        conn.close()
-        
-        print("✅ Sauvegarde complète de l'historique effectuée")
-        
-    except Exception as e:
-        print(f"❌ Erreur sauvegarde: {e}")
+        run_migrations(conn)
+    finally:
+        db_pool.release(conn)
 
-def restore_critical_data():
-    """Restaurer les données critiques depuis Replit DB"""
-    if not REPLIT_DB_AVAILABLE:
-        return False
-    
+def restore_critical_data(path):
+    """Restaurer en masse un export JSON Lines (bulk_restore) dans la base"""
+    # Les notifications en buffer seraient écrites après la restauration : on les écrit avant
+    notification_buffer.flush().result(WRITE_TIMEOUT)
+    conn = get_db_connection()
     try:
-        # Vérifier s'il y a une sauvegarde disponible
-        if 'last_backup' not in replit_db:
-            return False
-        
-        conn = get_db_connection()
-        
-        print("🔄 Restauration de l'historique complet depuis la sauvegarde...")
-        
-        # Restaurer TOUS les investissements ROI
-        if 'all_investments_history' in replit_db:
-            investments_data = json.loads(replit_db['all_investments_history'])
-            for inv in investments_data:
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO user_investments 
-                        (id, user_id, plan_id, amount, start_date, end_date, daily_profit, total_earned, is_active, transaction_hash)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        inv.get('id'), inv.get('user_id'), inv.get('plan_id'), 
-                        inv.get('amount'), inv.get('start_date'), inv.get('end_date'),
-                        inv.get('daily_profit'), inv.get('total_earned', 0), 
-                        inv.get('is_active', 1), inv.get('transaction_hash')
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration investissement {inv.get('id')}: {e}")
-        
-        # Restaurer TOUS les investissements staking
-        if 'all_staking_history' in replit_db:
-            staking_data = json.loads(replit_db['all_staking_history'])
-            for stake in staking_data:
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO user_staking 
-                        (id, user_id, plan_id, amount, start_date, end_date, is_active, is_withdrawn, total_earned, transaction_hash)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        stake.get('id'), stake.get('user_id'), stake.get('plan_id'),
-                        stake.get('amount'), stake.get('start_date'), stake.get('end_date'),
-                        stake.get('is_active', 1), stake.get('is_withdrawn', 0),
-                        stake.get('total_earned', 0), stake.get('transaction_hash')
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration staking {stake.get('id')}: {e}")
-        
-        # Restaurer TOUS les bots de trading
-        if 'all_bots_history' in replit_db:
-            bots_data = json.loads(replit_db['all_bots_history'])
-            for bot in bots_data:
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO user_trading_bots 
-                        (id, user_id, strategy_id, amount, start_date, end_date, is_active, total_profit, daily_profit, last_profit_date, transaction_hash)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        bot.get('id'), bot.get('user_id'), bot.get('strategy_id'),
-                        bot.get('amount'), bot.get('start_date'), bot.get('end_date'),
-                        bot.get('is_active', 1), bot.get('total_profit', 0),
-                        bot.get('daily_profit', 0), bot.get('last_profit_date'), bot.get('transaction_hash')
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration bot {bot.get('id')}: {e}")
-        
-        # Restaurer TOUS les copy trades
-        if 'all_copy_trading_history' in replit_db:
-            copy_trades_data = json.loads(replit_db['all_copy_trading_history'])
-            for trade in copy_trades_data:
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO user_copy_trading 
-                        (id, user_id, trader_id, amount, start_date, end_date, is_active, total_profit, copy_ratio, transaction_hash)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        trade.get('id'), trade.get('user_id'), trade.get('trader_id'),
-                        trade.get('amount'), trade.get('start_date'), trade.get('end_date'),
-                        trade.get('is_active', 1), trade.get('total_profit', 0),
-                        trade.get('copy_ratio', 1.0), trade.get('transaction_hash')
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration copy trade {trade.get('id')}: {e}")
-        
-        # Restaurer TOUS les investissements projets
-        if 'all_projects_history' in replit_db:
-            projects_data = json.loads(replit_db['all_projects_history'])
-            for proj in projects_data:
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO project_investments 
-                        (id, user_id, project_id, amount, investment_date, transaction_hash)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        proj.get('id'), proj.get('user_id'), proj.get('project_id'),
-                        proj.get('amount'), proj.get('investment_date'), proj.get('transaction_hash')
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration projet {proj.get('id')}: {e}")
-        
-        # Restaurer TOUTES les transactions
-        if 'all_transactions_history' in replit_db:
-            transactions_data = json.loads(replit_db['all_transactions_history'])
-            for trans in transactions_data:
-                try:
-                    conn.execute('''
-                        INSERT OR REPLACE INTO transactions 
-                        (id, user_id, type, amount, status, transaction_hash, created_at, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        trans.get('id'), trans.get('user_id'), trans.get('type'),
-                        trans.get('amount'), trans.get('status'), trans.get('transaction_hash'),
-                        trans.get('created_at'), trans.get('updated_at')
-                    ))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration transaction {trans.get('id')}: {e}")
-        
-        # Restaurer les soldes utilisateurs
-        if 'user_balances' in replit_db:
-            users_data = json.loads(replit_db['user_balances'])
-            for user in users_data:
-                try:
-                    conn.execute('''
-                        UPDATE users SET balance = ? WHERE id = ?
-                    ''', (user.get('balance', 0), user.get('id')))
-                except Exception as e:
-                    print(f"⚠️ Erreur restauration solde utilisateur {user.get('id')}: {e}")
-        
-        conn.commit()
+        stats = restore_file(conn, path)
+    finally:
         conn.close()
-        
-        last_backup = replit_db.get('last_backup', 'Inconnue')
-        print(f"✅ Historique complet restauré depuis la sauvegarde du {last_backup}")
-        return True
-        
-    except Exception as e:
-        print(f"❌ Erreur restauration: {e}")
-        return False
-
-    # Transactions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            type TEXT NOT NULL,
-            amount REAL NOT NULL,
-            status TEXT DEFAULT 'pending',
-            transaction_hash TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Add missing columns to existing tables
-    try:
-        # Vérifier et ajouter les colonnes manquantes à transactions
-        columns = cursor.execute("PRAGMA table_info(transactions)").fetchall()
-        column_names = [column[1] for column in columns]
-        
-        if 'updated_at' not in column_names:
-            # Ajouter la colonne sans valeur par défaut d'abord
-            cursor.execute('ALTER TABLE transactions ADD COLUMN updated_at TIMESTAMP')
-            # Puis mettre à jour les enregistrements existants avec la date actuelle
-            cursor.execute('UPDATE transactions SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL')
-            print("✅ Colonne updated_at ajoutée à la table transactions")
-    except sqlite3.OperationalError as e:
-        print(f"⚠️ Erreur ajout colonne updated_at: {e}")
-
-    # Vérifier et ajouter les colonnes 2FA manquantes à users
-    try:
-        users_columns = cursor.execute("PRAGMA table_info(users)").fetchall()
-        users_column_names = [column[1] for column in users_columns]
-        
-        if 'two_fa_enabled' not in users_column_names:
-            cursor.execute('ALTER TABLE users ADD COLUMN two_fa_enabled BOOLEAN DEFAULT 0')
-            print("✅ Colonne two_fa_enabled ajoutée à la table users")
-            
-        if 'two_fa_secret' not in users_column_names:
-            cursor.execute('ALTER TABLE users ADD COLUMN two_fa_secret TEXT')
-            print("✅ Colonne two_fa_secret ajoutée à la table users")
-            
-    except sqlite3.OperationalError as e:
-        print(f"⚠️ Erreur ajout colonnes 2FA: {e}")
-
-    # Notifications table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS notifications (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            message TEXT NOT NULL,
-            type TEXT NOT NULL,
-            is_read BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Staking Plans table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS staking_plans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            duration_days INTEGER NOT NULL,
-            annual_rate REAL NOT NULL,
-            min_amount REAL NOT NULL,
-            max_amount REAL NOT NULL,
-            penalty_rate REAL DEFAULT 0.05,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # User Staking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_staking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            plan_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_date TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1,
-            is_withdrawn BOOLEAN DEFAULT 0,
-            total_earned REAL DEFAULT 0.0,
-            transaction_hash TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (plan_id) REFERENCES staking_plans (id)
-        )
-    ''')
-
-    # Frozen Investment Plans table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS frozen_plans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            duration_days INTEGER NOT NULL,
-            total_return_rate REAL NOT NULL,
-            min_amount REAL NOT NULL,
-            max_amount REAL NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # User Frozen Investments table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_frozen_investments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            plan_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_date TIMESTAMP,
-            final_amount REAL NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            is_completed BOOLEAN DEFAULT 0,
-            transaction_hash TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (plan_id) REFERENCES frozen_plans (id)
-        )
-    ''')
-
-    # Portfolio Distribution table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS portfolio_distributions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            total_amount REAL NOT NULL,
-            distribution_data TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Auto Trading Strategies table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS trading_strategies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL,
-            risk_level TEXT NOT NULL,
-            expected_daily_return REAL NOT NULL,
-            min_amount REAL NOT NULL,
-            max_amount REAL NOT NULL,
-            strategy_type TEXT NOT NULL,
-            parameters TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # User Trading Bots table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_trading_bots (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            strategy_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_date TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1,
-            total_profit REAL DEFAULT 0.0,
-            daily_profit REAL DEFAULT 0.0,
-            last_profit_date TIMESTAMP,
-            transaction_hash TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (strategy_id) REFERENCES trading_strategies (id)
-        )
-    ''')
-
-    # Top Traders table (pour copy trading)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS top_traders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            avatar_url TEXT,
-            total_return REAL NOT NULL,
-            win_rate REAL NOT NULL,
-            followers_count INTEGER DEFAULT 0,
-            monthly_return REAL NOT NULL,
-            risk_score REAL NOT NULL,
-            trading_style TEXT NOT NULL,
-            min_copy_amount REAL NOT NULL,
-            max_copy_amount REAL NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # User Copy Trading table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_copy_trading (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            trader_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            end_date TIMESTAMP,
-            is_active BOOLEAN DEFAULT 1,
-            total_profit REAL DEFAULT 0.0,
-            copy_ratio REAL DEFAULT 1.0,
-            transaction_hash TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (trader_id) REFERENCES top_traders (id)
-        )
-    ''')
-
-    # Trading Signals table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS trading_signals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            strategy_id INTEGER NOT NULL,
-            signal_type TEXT NOT NULL,
-            asset_pair TEXT NOT NULL,
-            action TEXT NOT NULL,
-            price REAL NOT NULL,
-            confidence REAL NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            is_executed BOOLEAN DEFAULT 0,
-            FOREIGN KEY (strategy_id) REFERENCES trading_strategies (id)
-        )
-    ''')
-
-    # Support Tickets table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS support_tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            subject TEXT NOT NULL,
-            status TEXT DEFAULT 'open',
-            priority TEXT DEFAULT 'normal',
-            category TEXT DEFAULT 'general',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            assigned_to TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Support Messages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS support_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ticket_id INTEGER NOT NULL,
-            user_id INTEGER,
-            message TEXT NOT NULL,
-            is_admin BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (ticket_id) REFERENCES support_tickets (id),
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # FAQ table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS faq (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            question TEXT NOT NULL,
-            answer TEXT NOT NULL,
-            category TEXT DEFAULT 'general',
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Security Logs table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS security_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            action TEXT NOT NULL,
-            details TEXT,
-            ip_address TEXT,
-            user_agent TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-
-    # Insert default FAQ entries
-    cursor.execute('''
-        INSERT OR IGNORE INTO faq (question, answer, category) VALUES 
-        ('Comment déposer des fonds ?', 'Rendez-vous dans votre portefeuille et cliquez sur "Déposer". Suivez les instructions pour transférer vos USDT.', 'wallet'),
-        ('Quand puis-je retirer mes gains ?', 'Vos gains quotidiens sont disponibles immédiatement pour retrait. Le capital initial est libéré à la fin du plan.', 'investment'),
-        ('Les investissements sont-ils sécurisés ?', 'Oui, nous utilisons des smart contracts et un système de sécurité multicouche pour protéger vos investissements.', 'security'),
-        ('Comment fonctionne le parrainage ?', 'Partagez votre code de parrainage unique et recevez 5% sur tous les investissements de vos filleuls.', 'referral'),
-        ('Quel est le montant minimum d investissement ?', 'Le montant minimum est de 20 USDT pour tous nos plans d investissement.', 'investment')
-    ''')
-
-    
-
-    # ROI Plans table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS roi_plans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            daily_rate REAL NOT NULL,
-            duration_days INTEGER NOT NULL,
-            min_amount REAL NOT NULL,
-            max_amount REAL NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Insert ultra-premium ROI plans (only if not exist)
-    roi_count = cursor.execute('SELECT COUNT(*) as count FROM roi_plans').fetchone()['count']
-    
-    if roi_count == 0:
-        cursor.execute('''
-            INSERT INTO roi_plans (name, description, daily_rate, duration_days, min_amount, max_amount)
-        VALUES 
-        ('Rocket Launch', '🚀 Plan meteore ultra-rentable ! 35% quotidien pendant 3 jours.', 0.35, 3, 20, 2000),
-        ('Mega Booster', '💥 Plan mega booster ! 30% quotidien pendant 5 jours.', 0.30, 5, 20, 3000),
-        ('Super Express', '⚡ Plan super express ! 25% quotidien pendant 7 jours.', 0.25, 7, 20, 4000),
-        ('Lightning Pro', '⚡ Plan lightning pro ! 22% quotidien pendant 10 jours.', 0.22, 10, 20, 5000),
-        ('Turbo Flash', '🔥 Plan turbo flash ! 20% quotidien pendant 14 jours.', 0.20, 14, 20, 8000)
-    ''')
-
-    # Insert top 10 staking plans - Starting from 20 USDT (only if not exist)
-    staking_count = cursor.execute('SELECT COUNT(*) as count FROM staking_plans').fetchone()['count']
-    
-    if staking_count == 0:
-        cursor.execute('''
-            INSERT INTO staking_plans (name, description, duration_days, annual_rate, min_amount, max_amount, penalty_rate)
-        VALUES 
-        ('Quick Stake', '⚡ Staking rapide 7 jours ! 8% annuel. Parfait pour tester le staking.', 7, 0.08, 20, 300, 0.02),
-        ('Flex Stake', '🔄 Staking flexible 15 jours ! 12% annuel. Idéal pour débutants.', 15, 0.12, 20, 500, 0.03),
-        ('Standard Stake', '📊 Staking standard 30 jours ! 18% annuel. Notre choix populaire.', 30, 0.18, 20, 1000, 0.04),
-        ('Power Stake', '💪 Staking puissant 45 jours ! 22% annuel. Excellent rendement.', 45, 0.22, 20, 2000, 0.05),
-        ('Premium Stake', '💎 Staking premium 60 jours ! 28% annuel. Pour investisseurs sérieux.', 60, 0.28, 20, 3000, 0.06),
-        ('Elite Stake', '🏆 Staking elite 90 jours ! 35% annuel. Performance exceptionnelle.', 90, 0.35, 20, 5000, 0.07),
-        ('Master Stake', '👑 Staking master 120 jours ! 42% annuel. Retour impressionnant.', 120, 0.42, 20, 8000, 0.08),
-        ('Royal Stake', '🎖️ Staking royal 150 jours ! 50% annuel. Rendement royal.', 150, 0.50, 20, 12000, 0.09),
-        ('Supreme Stake', '⭐ Staking suprême 180 jours ! 60% annuel. Le top du staking.', 180, 0.60, 20, 20000, 0.10),
-        ('Ultimate Stake', '🚀 Staking ultimate 365 jours ! 80% annuel. Performance ultime.', 365, 0.80, 20, 50000, 0.12)
-    ''')
-
-    # Insert top 10 frozen plans - Starting from 20 USDT (only if not exist)
-    frozen_count = cursor.execute('SELECT COUNT(*) as count FROM frozen_plans').fetchone()['count']
-    
-    if frozen_count == 0:
-        cursor.execute('''
-            INSERT INTO frozen_plans (name, description, duration_days, total_return_rate, min_amount, max_amount)
-        VALUES 
-        ('Ice Starter', '🧊 Plan gelé débutant ! 30 jours gelés pour 150% de retour total.', 30, 1.5, 20, 400),
-        ('Frost Basic', '❄️ Plan frost basique ! 60 jours gelés pour 180% de retour total.', 60, 1.8, 20, 600),
-        ('Freeze Standard', '🥶 Plan freeze standard ! 90 jours gelés pour 220% de retour total.', 90, 2.2, 20, 800),
-        ('Glacial Pro', '🏔️ Plan glacial pro ! 120 jours gelés pour 280% de retour total.', 120, 2.8, 20, 1200),
-        ('Arctic Elite', '🐧 Plan arctique elite ! 150 jours gelés pour 350% de retour total.', 150, 3.5, 20, 2000),
-        ('Polar Premium', '🐻‍❄️ Plan polaire premium ! 180 jours gelés pour 450% de retour total.', 180, 4.5, 20, 3000),
-        ('Blizzard VIP', '❄️ Plan blizzard VIP ! 240 jours gelés pour 600% de retour total.', 240, 6.0, 20, 5000),
-        ('Absolute Zero', '🌨️ Plan zéro absolu ! 300 jours gelés pour 800% de retour total.', 300, 8.0, 20, 8000),
-        ('Eternal Frost', '🧊 Plan gel éternel ! 360 jours gelés pour 1200% de retour total.', 360, 12.0, 20, 15000),
-        ('Cosmic Ice', '🌌 Plan glace cosmique ! 450 jours gelés pour 2000% de retour total.', 450, 20.0, 20, 50000)
-    ''')
-
-    # Insert top 10 projects - Starting from 20 USDT (only if not exist)
-    projects_count = cursor.execute('SELECT COUNT(*) as count FROM projects').fetchone()['count']
-    
-    if projects_count == 0:
-        cursor.execute('''
-            INSERT INTO projects (title, description, category, target_amount, expected_return, duration_months, min_investment, max_investment, deadline)
-        VALUES 
-        ('Crypto Mining Farm', '⛏️ Ferme de minage crypto moderne ! 15% de retour en 6 mois.', 'Mining', 10000, 0.15, 6, 20, 1000, datetime("now", "+30 days")),
-        ('E-commerce Platform', '🛒 Plateforme e-commerce innovante ! 18% de retour en 8 mois.', 'Tech', 15000, 0.18, 8, 20, 1500, datetime("now", "+45 days")),
-        ('Green Energy Solar', '☀️ Énergie solaire verte ! 20% de retour en 12 mois.', 'Énergie', 25000, 0.20, 12, 20, 2500, datetime("now", "+60 days")),
-        ('FinTech Startup', '💳 Startup fintech prometteuse ! 22% de retour en 10 mois.', 'Finance', 20000, 0.22, 10, 20, 2000, datetime("now", "+40 days")),
-        ('Real Estate Fund', '🏠 Fonds immobilier diversifié ! 25% de retour en 18 mois.', 'Immobilier', 50000, 0.25, 18, 20, 5000, datetime("now", "+75 days")),
-        ('AI Tech Company', '🤖 Entreprise tech IA ! 28% de retour en 14 mois.', 'Intelligence Artificielle', 35000, 0.28, 14, 20, 3500, datetime("now", "+50 days")),
-        ('Renewable Energy', '🌱 Énergies renouvelables ! 30% de retour en 20 mois.', 'Écologie', 40000, 0.30, 20, 20, 4000, datetime("now", "+65 days")),
-        ('Biotech Innovation', '🧬 Innovation biotechnologique ! 35% de retour en 24 mois.', 'Biotechnologie', 60000, 0.35, 24, 20, 6000, datetime("now", "+80 days")),
-        ('Space Technology', '🚀 Technologie spatiale ! 40% de retour en 30 mois.', 'Espace', 80000, 0.40, 30, 20, 8000, datetime("now", "+90 days")),
-        ('Quantum Computing', '⚛️ Informatique quantique ! 50% de retour en 36 mois.', 'Quantique', 100000, 0.50, 36, 20, 10000, datetime("now", "+120 days"))
-    ''')
-
-    # Insert trading strategies (only if not exist)
-    strategies_count = cursor.execute('SELECT COUNT(*) as count FROM trading_strategies').fetchone()['count']
-    
-    if strategies_count == 0:
-        cursor.execute('''
-            INSERT INTO trading_strategies (name, description, risk_level, expected_daily_return, min_amount, max_amount, strategy_type, parameters)
-        VALUES 
-        ('IA Conservateur', '🛡️ Stratégie IA sécurisée avec analyse de risque avancée. Idéale pour débuter le trading automatique.', 'Faible', 0.015, 20, 1000, 'ai_conservative', '{"stop_loss": 0.05, "take_profit": 0.03, "max_trades": 3}'),
-        ('IA Équilibré', '⚖️ Stratégie IA équilibrée combinant sécurité et performance. Parfait équilibre risque/rendement.', 'Moyen', 0.025, 20, 2000, 'ai_balanced', '{"stop_loss": 0.08, "take_profit": 0.05, "max_trades": 5}'),
-        ('IA Agressif', '🚀 Stratégie IA haute performance avec algorithmes avancés. Pour investisseurs expérimentés.', 'Élevé', 0.04, 20, 5000, 'ai_aggressive', '{"stop_loss": 0.12, "take_profit": 0.08, "max_trades": 8}'),
-        ('Scalping Bot', '⚡ Bot de scalping ultra-rapide avec IA prédictive. Trades haute fréquence pour profits constants.', 'Moyen', 0.035, 20, 3000, 'scalping_ai', '{"timeframe": "1m", "trades_per_hour": 10, "profit_target": 0.02}'),
-        ('Arbitrage IA', '🔄 Bot d arbitrage intelligent détectant les écarts de prix entre exchanges. Profits garantis.', 'Faible', 0.02, 20, 10000, 'arbitrage_ai', '{"min_spread": 0.01, "max_exposure": 0.3, "exchanges": 5}'),
-        ('Swing Trading Pro', '📈 IA de swing trading analysant les tendances moyennes. Positions 2-7 jours pour profits optimaux.', 'Moyen', 0.03, 20, 4000, 'swing_ai', '{"timeframe": "4h", "trend_strength": 0.7, "position_size": 0.2}'),
-        ('DeFi Yield Bot', '🌾 Bot DeFi intelligent optimisant les rendements sur protocols décentralisés. Farming automatisé.', 'Moyen', 0.045, 20, 8000, 'defi_yield', '{"protocols": ["uniswap", "compound"], "rebalance_frequency": "daily"}'),
-        ('Grid Trading IA', '🔳 Stratégie de trading en grille avec IA adaptative. Profits dans tous les marchés.', 'Faible', 0.018, 20, 6000, 'grid_ai', '{"grid_size": 20, "price_range": 0.1, "adaptive": true}'),
-        ('News Trading Bot', '📰 Bot réagissant aux news crypto en temps réel avec analyse sentiment IA. Profits sur volatilité.', 'Élevé', 0.038, 20, 2500, 'news_ai', '{"sentiment_threshold": 0.8, "reaction_time": "30s", "news_sources": 15}'),
-        ('Multi-Strategy IA', '🎯 Bot combinant plusieurs stratégies IA adaptatives. Performance optimisée automatiquement.', 'Moyen', 0.032, 20, 15000, 'multi_ai', '{"strategies": 5, "allocation_dynamic": true, "rebalance": "weekly"}')
-    ''')
-
-    # Insert top traders for copy trading (only if not exist)
-    traders_count = cursor.execute('SELECT COUNT(*) as count FROM top_traders').fetchone()['count']
-    
-    if traders_count == 0:
-        cursor.execute('''
-            INSERT INTO top_traders (name, avatar_url, total_return, win_rate, followers_count, monthly_return, risk_score, trading_style, min_copy_amount, max_copy_amount)
-        VALUES 
-        ('CryptoKing_AI', '/static/avatars/trader1.png', 245.5, 78.5, 1250, 25.2, 6.2, 'Swing Trading + IA', 20, 5000),
-        ('QuantMaster_Pro', '/static/avatars/trader2.png', 189.3, 82.1, 980, 18.7, 4.8, 'Algorithmic Trading', 20, 3000),
-        ('ScalpBot_Elite', '/static/avatars/trader3.png', 156.8, 75.3, 1580, 22.4, 7.1, 'Scalping + Arbitrage', 20, 2500),
-        ('TrendHunter_IA', '/static/avatars/trader4.png', 198.7, 80.2, 920, 19.8, 5.5, 'Trend Following IA', 20, 4000),
-        ('DeFi_Wizard', '/static/avatars/trader5.png', 134.2, 88.9, 750, 15.8, 3.2, 'DeFi Yield Farming', 20, 8000),
-        ('Volatility_Pro', '/static/avatars/trader6.png', 178.5, 73.4, 1120, 21.3, 8.5, 'Volatility Trading', 20, 3500),
-        ('AI_GridMaster', '/static/avatars/trader7.png', 145.6, 85.7, 680, 16.9, 4.1, 'Grid + IA Adaptive', 20, 6000),
-        ('NewsBot_Elite', '/static/avatars/trader8.png', 167.3, 76.8, 1340, 20.1, 6.8, 'News-based Trading', 20, 2800),
-        ('Hodl_IA_Pro', '/static/avatars/trader9.png', 123.8, 91.2, 2100, 14.5, 2.9, 'Long-term IA', 20, 10000),
-        ('MultiStrat_Bot', '/static/avatars/trader10.png', 201.4, 79.6, 1450, 23.7, 5.9, 'Multi-Strategy IA', 20, 7500)
-    ''')
-
-    conn.commit()
-    conn.close()
+    print(f"✅ Restauration de {path}: {stats['rows']} lignes en {stats['seconds']}s "
+          f"({stats['rows_per_second']} lignes/s)")
+    return stats
 
 # État global pour l'activation admin
 ADMIN_ACCESS_ENABLED = False
 ADMIN_ACCESS_EXPIRY = None
 
+@app.errorhandler(WriteTimeout)
+def write_timeout(e):
+    """Écriture annulée avant exécution (writer saturé) : rien n'a été débité, le client peut réessayer"""
+    return jsonify({'error': 'Service momentanément saturé, veuillez réessayer'}), 503
+
 # Authentication decorator
 def login_required(f):
     @wraps(f)
@@ -878,30 +225,90 @@ def get_admin_status():
 
 # Utility functions
 def get_db_connection():
-    import time
-    max_retries = 5
-    for attempt in range(max_retries):
-        try:
-            conn = sqlite3.connect(DATABASE, timeout=60.0)
-            conn.row_factory = sqlite3.Row
-            # Enable WAL mode for better concurrency
-            conn.execute('PRAGMA journal_mode=WAL;')
-            conn.execute('PRAGMA busy_timeout=60000;')  # 60 seconds timeout
-            conn.execute('PRAGMA synchronous=NORMAL;')  # Better performance
-            conn.execute('PRAGMA cache_size=10000;')     # Larger cache
-            conn.execute('PRAGMA temp_store=memory;')    # Use memory for temp
-            return conn
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                time.sleep(0.5 * (attempt + 1))  # Progressive backoff
-                continue
-            else:
-                print(f"❌ Database connection failed after {max_retries} attempts: {e}")
-                raise e
-        except Exception as e:
-            print(f"❌ Unexpected database error: {e}")
-            raise e
-    return conn
+    """Connexion issue du pool.
+
+    Dans un contexte Flask, une seule connexion est empruntée par requête
+    (close() est alors sans effet) et rendue au pool au teardown. Hors
+    contexte (scheduler, console), close() rend la connexion au pool.
+    """
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = PooledConnection(db_pool, db_pool.acquire(), request_scoped=True)
+            stats = g.get('query_stats')
+            if stats is not None:
+                stats.connections += 1
+                conn = InstrumentedConnection(conn, stats, slow_query_log)
+            g.db_conn = conn
+        return conn
+    # Hors requête (scheduler, flux) : seul le journal des requêtes lentes est alimenté
+    stats = QueryStats(route=f'<{threading.current_thread().name}>')
+    return InstrumentedConnection(PooledConnection(db_pool, db_pool.acquire()), stats, slow_query_log)
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Rendre la connexion de la requête au pool (rollback du travail non validé)"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.query_stats = QueryStats(route=request.url_rule.rule if request.url_rule is not None else '<unmatched>')
+
+@app.before_request
+def start_request_profile():
+    # Un simple test d'attribut tant que le profileur n'est pas armé
+    if request_profiler.armed and not request.path.startswith('/admin/profile'):
+        g.request_profile = request_profiler.start()
+
+@app.after_request
+def capture_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exception=None):
+    """Agréger latence et compteurs SQL de la requête (500 si une exception a interrompu la réponse)"""
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        request_profiler.finish(profile)
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    stats = g.pop('query_stats')
+    metrics_registry.observe(stats.route, request.method, g.pop('response_status', 500),
+                             time.perf_counter() - started, stats)
+    # Requêtes lentes de la requête visibles des autres workers (METRICS_DIR)
+    slow_query_log.flush()
+
+def get_catalog(conn):
+    """Cache du catalogue, dont la version n'est vérifiée qu'une fois par requête"""
+    if has_app_context():
+        if not g.get('catalog_synced'):
+            catalog.sync(conn)
+            g.catalog_synced = True
+    else:
+        catalog.sync(conn)
+    return catalog
+
+def check_hot_query_plans():
+    """Signaler les requêtes chaudes qui parcourent une table entière (hors production)"""
+    if os.environ.get('FLASK_ENV') == 'production':
+        return
+    conn = get_db_connection()
+    try:
+        check_query_plans(conn)
+    except sqlite3.Error as e:
+        print(f"⚠️ Erreur contrôle des plans d'exécution: {e}")
+    finally:
+        conn.close()
+
+# Au chargement du module : couvre aussi les workers gunicorn, qui n'exécutent pas le bloc __main__
+if not SPAWNED_CHILD:
+    init_db()
+    check_hot_query_plans()
 
 def generate_transaction_hash():
     return hashlib.sha256(f"{datetime.now().isoformat()}{secrets.token_hex(16)}".encode()).hexdigest()
@@ -909,214 +316,58 @@ def generate_transaction_hash():
 def generate_referral_code():
     return secrets.token_urlsafe(8).upper()
 
+def debit_balance(conn, user_id, amount):
+    """Débiter le solde s'il couvre amount (vérification et débit en une seule requête)"""
+    cursor = conn.execute('UPDATE users SET balance = balance - ? WHERE id = ? AND balance >= ?',
+                          (amount, user_id, amount))
+    return cursor.rowcount == 1
+
 def add_notification(user_id, title, message, type='info'):
-    import time
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            conn = get_db_connection()
-            conn.execute('''
-                INSERT INTO notifications (user_id, title, message, type)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, title, message, type))
-            conn.commit()
-            conn.close()
-            return
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                time.sleep(0.1 * (attempt + 1))  # Progressive backoff
-                continue
-            else:
-                print(f"❌ Erreur ajout notification après {attempt + 1} tentatives: {e}")
-                break
-        except Exception as e:
-            print(f"❌ Erreur ajout notification: {e}")
-            break
+    """Mettre une notification en file (écrite par lot en arrière-plan)"""
+    notification_buffer.add(user_id, title, message, type)
 
 # Scheduled tasks
 def calculate_daily_profits():
-    # Sauvegarder les données importantes si Replit DB est disponible
-    if REPLIT_DB_AVAILABLE:
-        backup_critical_data()
-    
+    """Créditer les profits quotidiens (moteur ensembliste de profit_calculator)"""
     conn = get_db_connection()
-    
-    # Plus d'investissements ROI actifs
-    active_investments = []
-
-    # Récupérer tous les bots de trading actifs
-    active_bots = conn.execute('''
-        SELECT utb.*, u.email, ts.name as strategy_name
-        FROM user_trading_bots utb
-        JOIN users u ON utb.user_id = u.id
-        JOIN trading_strategies ts ON utb.strategy_id = ts.id
-        WHERE utb.is_active = 1
-    ''').fetchall()
-
-    # Récupérer tous les copy trades actifs
-    active_copies = conn.execute('''
-        SELECT uct.*, u.email, tt.name as trader_name, tt.monthly_return
-        FROM user_copy_trading uct
-        JOIN users u ON uct.user_id = u.id
-        JOIN top_traders tt ON uct.trader_id = tt.id
-        WHERE uct.is_active = 1
-    ''').fetchall()
-
-    print(f"🔄 Calcul des profits pour {len(active_investments)} investissements, {len(active_bots)} bots, {len(active_copies)} copy trades")
-
-    # Traiter les investissements ROI classiques
-    for investment in active_investments:
-        try:
-            # Vérifier si l'investissement est vraiment actif (pas expiré)
-            from datetime import datetime
-            if investment['end_date']:
-                end_date = datetime.fromisoformat(investment['end_date'].replace('Z', ''))
-                if datetime.now() > end_date:
-                    # Marquer comme terminé
-                    conn.execute('''
-                        UPDATE user_investments 
-                        SET is_active = 0 
-                        WHERE id = ?
-                    ''', (investment['id'],))
-                    
-                    add_notification(
-                        investment['user_id'],
-                        'Plan d\'investissement terminé',
-                        f'Votre plan {investment["plan_name"]} est arrivé à terme. Total gagné: {investment["total_earned"]:.2f} USDT',
-                        'info'
-                    )
-                    continue
-
-            # Calculate daily profit
-            daily_profit = investment['daily_profit']
-            
-            if daily_profit > 0:
-                print(f"💰 Ajout de {daily_profit:.2f} USDT pour l'utilisateur {investment['user_id']} - Plan: {investment['plan_name']}")
-
-                # Update user balance
-                conn.execute('''
-                    UPDATE users 
-                    SET balance = balance + ? 
-                    WHERE id = ?
-                ''', (daily_profit, investment['user_id']))
-
-                # Update total earned
-                current_earned = investment['total_earned'] if investment['total_earned'] else 0
-                new_total_earned = current_earned + daily_profit
-                conn.execute('''
-                    UPDATE user_investments 
-                    SET total_earned = ? 
-                    WHERE id = ?
-                ''', (new_total_earned, investment['id']))
-
-                # Add transaction record
-                conn.execute('''
-                    INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-                    VALUES (?, 'daily_profit', ?, 'completed', ?)
-                ''', (investment['user_id'], daily_profit, generate_transaction_hash()))
-
-                # Add notification
-                add_notification(
-                    investment['user_id'],
-                    'Profit journalier reçu',
-                    f'Vous avez reçu {daily_profit:.2f} USDT de votre plan {investment["plan_name"]}',
-                    'success'
-                )
-
-        except Exception as e:
-            print(f"❌ Erreur calcul profit pour investissement {investment['id']}: {e}")
-            continue
-
-    # Traiter les bots de trading
-    for bot in active_bots:
-        try:
-            daily_profit = bot['daily_profit']
-            
-            if daily_profit > 0:
-                print(f"🤖 Ajout de {daily_profit:.2f} USDT pour le bot {bot['id']} de l'utilisateur {bot['user_id']}")
-
-                # Mettre à jour le solde utilisateur
-                conn.execute('''
-                    UPDATE users 
-                    SET balance = balance + ? 
-                    WHERE id = ?
-                ''', (daily_profit, bot['user_id']))
-
-                # Mettre à jour les profits totaux du bot
-                current_profit = bot['total_profit'] if bot['total_profit'] else 0
-                new_total_profit = current_profit + daily_profit
-                conn.execute('''
-                    UPDATE user_trading_bots 
-                    SET total_profit = ?, last_profit_date = CURRENT_TIMESTAMP 
-                    WHERE id = ?
-                ''', (new_total_profit, bot['id']))
-
-                # Ajouter transaction
-                conn.execute('''
-                    INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-                    VALUES (?, 'bot_profit', ?, 'completed', ?)
-                ''', (bot['user_id'], daily_profit, generate_transaction_hash()))
-
-                # Ajouter notification
-                add_notification(
-                    bot['user_id'],
-                    'Profit bot de trading',
-                    f'Votre bot {bot["strategy_name"]} a généré {daily_profit:.2f} USDT de profit!',
-                    'success'
-                )
-
-        except Exception as e:
-            print(f"❌ Erreur calcul profit pour bot {bot['id']}: {e}")
-            continue
-
-    # Traiter les copy trades
-    for copy_trade in active_copies:
-        try:
-            # Calculer le profit basé sur le rendement mensuel du trader
-            monthly_return = copy_trade['monthly_return'] / 100  # Convertir en décimal
-            daily_return = monthly_return / 30  # Approximation quotidienne
-            daily_profit = copy_trade['amount'] * daily_return * copy_trade['copy_ratio']
-            
-            if daily_profit > 0:
-                print(f"📈 Ajout de {daily_profit:.2f} USDT pour le copy trade {copy_trade['id']} de l'utilisateur {copy_trade['user_id']}")
-
-                # Mettre à jour le solde utilisateur
-                conn.execute('''
-                    UPDATE users 
-                    SET balance = balance + ? 
-                    WHERE id = ?
-                ''', (daily_profit, copy_trade['user_id']))
-
-                # Mettre à jour les profits totaux du copy trade
-                current_profit = copy_trade['total_profit'] if copy_trade['total_profit'] else 0
-                new_total_profit = current_profit + daily_profit
-                conn.execute('''
-                    UPDATE user_copy_trading 
-                    SET total_profit = ? 
-                    WHERE id = ?
-                ''', (new_total_profit, copy_trade['id']))
-
-                # Ajouter transaction
-                conn.execute('''
-                    INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-                    VALUES (?, 'copy_profit', ?, 'completed', ?)
-                ''', (copy_trade['user_id'], daily_profit, generate_transaction_hash()))
-
-                # Ajouter notification
-                add_notification(
-                    copy_trade['user_id'],
-                    'Profit copy trading',
-                    f'Votre copy de {copy_trade["trader_name"]} a généré {daily_profit:.2f} USDT de profit!',
-                    'success'
-                )
+    try:
+        if PROFIT_WORKERS > 1:
+            return accrue_daily_profits_sharded(conn, DATABASE, workers=PROFIT_WORKERS)
+        return accrue_daily_profits(conn)
+    finally:
+        conn.close()
 
-        except Exception as e:
-            print(f"❌ Erreur calcul profit pour copy trade {copy_trade['id']}: {e}")
-            continue
+def purge_notifications():
+    """Résumés des profits et archivage des notifications lues anciennes"""
+    # Les notifications encore en buffer font partie des données à traiter
+    notification_buffer.flush().result(WRITE_TIMEOUT)
+    conn = get_db_connection()
+    try:
+        stats = run_notification_retention(conn)
+    finally:
+        conn.close()
+    print(f"🧹 Rétention notifications: {stats['digests']} résumés ({stats['collapsed']} regroupées), "
+          f"{stats['archived']} archivées en {stats['batches']} lots")
+    return stats
 
-    conn.commit()
-    conn.close()
-    print("✅ Calcul des profits quotidiens terminé")
+def partition_transactions():
+    """Déplacer les mois clos de transactions vers leurs partitions mensuelles"""
+    conn = get_db_connection()
+    try:
+        moved = partition_ledger(conn, default_archive_dir(DATABASE))
+    finally:
+        conn.close()
+    for month, count in moved.items():
+        print(f"🗄️ Transactions {month}: {count} lignes déplacées vers la partition")
+    return moved
+
+def backup_database(force_full=False):
+    """Sauvegarde en ligne : snapshot complet ou delta des pages modifiées"""
+    stats = run_backup(DATABASE, default_backup_dir(DATABASE), force_full=force_full)
+    if stats['status'] in ('full', 'delta'):
+        print(f"💾 Sauvegarde {stats['status']}: {stats['pages']} pages, {stats['bytes']} octets "
+              f"en {stats['seconds']}s ({stats['file']})")
+    return stats
 
 # Routes
 @app.route('/')
@@ -1265,6 +516,12 @@ def dashboard():
             notif_dict['created_at'] = datetime.now()
         notifications.append(notif_dict)
 
+    # Gains projetés des bots et copy trades actifs (noyau vectorisé)
+    projections = project_user_earnings(conn, session['user_id'], horizons=(7, 30))
+
+    # Totaux du portefeuille (résumé matérialisé)
+    portfolio = get_portfolio_summary(conn, session['user_id'])
+
     conn.close()
 
     # Debug info
@@ -1276,7 +533,9 @@ def dashboard():
                          user=user, 
                          investments=investments, 
                          project_investments=project_investments,
-                         notifications=notifications)
+                         notifications=notifications,
+                         projections=projections,
+                         portfolio=portfolio)
 
 
 
@@ -1289,11 +548,11 @@ def ultra_plans():
     conn = get_db_connection()
     
     # Récupérer seulement les plans ultra-rentables (20%+ quotidien)
-    ultra_plans = conn.execute('''
-        SELECT * FROM roi_plans 
-        WHERE is_active = 1 AND daily_rate >= 0.20
-        ORDER BY daily_rate DESC, duration_days ASC
-    ''').fetchall()
+    ultra_plans = sorted(
+        (plan for plan in get_catalog(conn).all(conn, 'roi_plans')
+         if plan['is_active'] and plan['daily_rate'] >= 0.20),
+        key=lambda plan: (-plan['daily_rate'], plan['duration_days'])
+    )
     
     conn.close()
 
@@ -1310,7 +569,7 @@ def invest_roi():
     conn = get_db_connection()
 
     # Récupérer les détails du plan
-    plan = conn.execute('SELECT * FROM roi_plans WHERE id = ?', (plan_id,)).fetchone()
+    plan = get_catalog(conn).get(conn, 'roi_plans', plan_id)
     if not plan:
         conn.close()
         return jsonify({'error': 'Plan non trouvé'}), 404
@@ -1320,34 +579,35 @@ def invest_roi():
         conn.close()
         return jsonify({'error': f'Montant doit être entre {plan["min_amount"]} et {plan["max_amount"]} USDT'}), 400
 
-    # Vérifier le solde utilisateur
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        conn.close()
-        return jsonify({'error': 'Solde insuffisant'}), 400
+    conn.close()
 
     # Calculer les dates et profits
+    user_id = session['user_id']
     start_date = datetime.now()
     end_date = start_date + timedelta(days=plan['duration_days'])
     daily_profit = amount * plan['daily_rate']
 
-    # Créer l'investissement
-    cursor = conn.execute('''
-        INSERT INTO user_investments (user_id, plan_id, amount, start_date, end_date, daily_profit, transaction_hash)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (session['user_id'], plan_id, amount, start_date, end_date, daily_profit, generate_transaction_hash()))
+    def debit_and_invest(conn):
+        # Vérifier et débiter le solde dans la même transaction d'écriture
+        if not debit_balance(conn, user_id, amount):
+            return False
 
-    # Mettre à jour le solde utilisateur
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
+        # Créer l'investissement
+        conn.execute('''
+            INSERT INTO user_investments (user_id, plan_id, amount, start_date, end_date, daily_profit, transaction_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, plan_id, amount, start_date, end_date, daily_profit, generate_transaction_hash()))
+        record_position_opened(conn, user_id, amount)
 
-    # Ajouter transaction
-    conn.execute('''
-        INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-        VALUES (?, 'roi_investment', ?, 'completed', ?)
-    ''', (session['user_id'], amount, generate_transaction_hash()))
+        # Ajouter transaction
+        conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
+            VALUES (?, 'roi_investment', ?, 'completed', ?)
+        ''', (user_id, amount, generate_transaction_hash()))
+        return True
 
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_invest), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
 
     # Ajouter notification
     add_notification(
@@ -1364,188 +624,103 @@ def invest_roi():
 @app.route('/investment-history')
 @login_required
 def investment_history():
-    """Page d'historique complet des investissements"""
+    """Page d'historique complet des investissements (positions chargées page par page)"""
     conn = get_db_connection()
 
-    # Récupérer tous les investissements ROI de l'utilisateur
-    roi_investments = conn.execute('''
-        SELECT ui.*, rp.name as plan_name
-        FROM user_investments ui
-        LEFT JOIN roi_plans rp ON ui.plan_id = rp.id
-        WHERE ui.user_id = ?
-        ORDER BY ui.start_date DESC
-    ''', (session['user_id'],)).fetchall()
+    # Statistiques globales : une lecture du résumé matérialisé
+    stats = get_portfolio_summary(conn, session['user_id'])
 
-    # Récupérer tous les investissements staking
-    staking_investments = conn.execute('''
-        SELECT us.*, sp.name as plan_name, sp.duration_days, sp.annual_rate
-        FROM user_staking us
-        LEFT JOIN staking_plans sp ON us.plan_id = sp.id
-        WHERE us.user_id = ?
-        ORDER BY us.start_date DESC
-    ''', (session['user_id'],)).fetchall()
-
-    # Récupérer tous les bots de trading
-    trading_bots = conn.execute('''
-        SELECT utb.*, ts.name as strategy_name, ts.risk_level
-        FROM user_trading_bots utb
-        LEFT JOIN trading_strategies ts ON utb.strategy_id = ts.id
-        WHERE utb.user_id = ?
-        ORDER BY utb.start_date DESC
-    ''', (session['user_id'],)).fetchall()
+    conn.close()
 
-    # Récupérer tous les copy trades
-    copy_trades = conn.execute('''
-        SELECT uct.*, tt.name as trader_name, tt.total_return
-        FROM user_copy_trading uct
-        LEFT JOIN top_traders tt ON uct.trader_id = tt.id
-        WHERE uct.user_id = ?
-        ORDER BY uct.start_date DESC
-    ''', (session['user_id'],)).fetchall()
+    return render_template('investment_history.html', stats=stats)
 
-    # Récupérer les investissements dans les projets
-    project_investments = conn.execute('''
-        SELECT pi.*, p.title, p.status, p.expected_return
-        FROM project_investments pi
-        JOIN projects p ON pi.project_id = p.id
-        WHERE pi.user_id = ?
-        ORDER BY pi.investment_date DESC
-    ''', (session['user_id'],)).fetchall()
+@app.route('/investment-history/positions')
+@login_required
+def investment_history_positions():
+    """Page JSON de l'historique des positions (pagination par curseur)"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
 
+    conn = get_db_connection()
+    positions, next_cursor = fetch_positions_page(
+        conn,
+        session['user_id'],
+        kind=request.args.get('type'),
+        status=request.args.get('status'),
+        date_from=request.args.get('date_from') or None,
+        date_to=request.args.get('date_to') or None,
+        cursor=request.args.get('cursor') or None,
+        limit=limit
+    )
     conn.close()
 
-    # Calculer les statistiques globales
-    total_invested = 0
-    total_profits = 0
-    active_count = 0
-    completed_count = 0
-
-    # Traiter les investissements ROI
-    for inv in roi_investments:
-        total_invested += inv['amount'] if inv['amount'] else 0
-        total_profits += inv['total_earned'] if inv['total_earned'] else 0
-        if inv['is_active']:
-            active_count += 1
-        else:
-            completed_count += 1
-
-    # Traiter les investissements staking
-    for inv in staking_investments:
-        total_invested += inv['amount'] if inv['amount'] else 0
-        total_profits += inv['total_earned'] if inv['total_earned'] else 0
-        if inv['is_active']:
-            active_count += 1
-        else:
-            completed_count += 1
-
-    # Traiter les bots de trading
-    for bot in trading_bots:
-        total_invested += bot['amount'] if bot['amount'] else 0
-        total_profits += bot['total_profit'] if bot['total_profit'] else 0
-        if bot['is_active']:
-            active_count += 1
-        else:
-            completed_count += 1
-
-    # Traiter les copy trades
-    for trade in copy_trades:
-        total_invested += trade['amount'] if trade['amount'] else 0
-        total_profits += trade['total_profit'] if trade['total_profit'] else 0
-        if trade['is_active']:
-            active_count += 1
-        else:
-            completed_count += 1
-
-    # Traiter les investissements projets
-    for proj in project_investments:
-        total_invested += proj['amount'] if proj['amount'] else 0
-        # Les projets sont considérés comme actifs
-        active_count += 1
-
-    # Créer un dictionnaire de statistiques
-    stats = {
-        'total_invested': total_invested,
-        'total_profits': total_profits,
-        'active_count': active_count,
-        'completed_count': completed_count,
-        'total_count': len(roi_investments) + len(staking_investments) + len(trading_bots) + len(copy_trades) + len(project_investments)
+    return jsonify({
+        'success': True,
+        'positions': positions,
+        'next_cursor': next_cursor
+    })
+
+def export_response(dataset, user_id=None, suffix=''):
+    """Réponse en flux d'un export (format, gzip et filtres lus dans la query string)"""
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({'error': 'Export inconnu'}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Format non supporté'}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+    filters = {
+        'user_id': user_id,
+        'type': request.args.get('type') or None,
+        'date_from': request.args.get('date_from') or None,
+        'date_to': request.args.get('date_to') or None,
     }
 
-    # Combiner tous les investissements pour les filtres
-    all_investments = []
-    
-    # Ajouter les investissements ROI
-    for inv in roi_investments:
-        all_investments.append({
-            'id': inv['id'],
-            'type': 'roi',
-            'amount': inv['amount'],
-            'total_earned': inv['total_earned'] if inv['total_earned'] else 0,
-            'is_active': inv['is_active'],
-            'start_date': inv['start_date']
-        })
-    
-    # Ajouter les autres types d'investissements
-    for inv in staking_investments:
-        all_investments.append({
-            'id': inv['id'],
-            'type': 'staking',
-            'amount': inv['amount'],
-            'total_earned': inv['total_earned'] if inv['total_earned'] else 0,
-            'is_active': inv['is_active'],
-            'start_date': inv['start_date']
-        })
-    
-    for bot in trading_bots:
-        all_investments.append({
-            'id': bot['id'],
-            'type': 'trading',
-            'amount': bot['amount'],
-            'total_earned': bot['total_profit'] if bot['total_profit'] else 0,
-            'is_active': bot['is_active'],
-            'start_date': bot['start_date']
-        })
-    
-    for trade in copy_trades:
-        all_investments.append({
-            'id': trade['id'],
-            'type': 'copy',
-            'amount': trade['amount'],
-            'total_earned': trade['total_profit'] if trade['total_profit'] else 0,
-            'is_active': trade['is_active'],
-            'start_date': trade['start_date']
-        })
-    
-    for proj in project_investments:
-        all_investments.append({
-            'id': proj['id'],
-            'type': 'project',
-            'amount': proj['amount'],
-            'total_earned': 0,  # Les projets n'ont pas encore de gains
-            'is_active': True,
-            'start_date': proj['investment_date']
-        })
+    def generate():
+        # Connexion propre au flux, rendue au pool à la fin (ou à la déconnexion du client)
+        conn = get_db_connection()
+        try:
+            yield from export_stream(conn, dataset, fmt, compress, **filters)
+        finally:
+            conn.close()
 
-    return render_template('investment_history.html',
-                         roi_investments=roi_investments,
-                         staking_investments=staking_investments,
-                         trading_bots=trading_bots,
-                         copy_trades=copy_trades,
-                         project_investments=project_investments,
-                         all_investments=all_investments,
-                         stats=stats)
+    filename = export_filename(dataset, fmt, compress, suffix)
+    return Response(generate(), mimetype='application/gzip' if compress else EXPORT_MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/export/<dataset>')
+@login_required
+def export_user_data(dataset):
+    """Export des transactions ou des positions de l'utilisateur (CSV ou JSON Lines)"""
+    return export_response(dataset, user_id=session['user_id'], suffix=f"_{datetime.now().strftime('%Y%m%d')}")
+
+@app.route('/admin/export/<dataset>')
+@admin_required
+def admin_export(dataset):
+    """Export admin de tous les utilisateurs, ou d'un seul avec user_id"""
+    user_id = request.args.get('user_id', type=int)
+    suffix = f'_user{user_id}' if user_id else '_all'
+    return export_response(dataset, user_id=user_id, suffix=f"{suffix}_{datetime.now().strftime('%Y%m%d')}")
+
+def with_progress(project):
+    """Copie d'un projet du catalogue avec son pourcentage de collecte"""
+    return dict(project, progress_percent=project['raised_amount'] * 100.0 / project['target_amount'])
 
 @app.route('/projects')
 @login_required
 def projects():
     conn = get_db_connection()
-    projects = conn.execute('''
-        SELECT *, 
-               (raised_amount * 100.0 / target_amount) as progress_percent
-        FROM projects 
-        WHERE status = 'collecting' AND deadline > datetime('now')
-        ORDER BY created_at DESC
-    ''').fetchall()
+    # datetime('now') de SQLite est en UTC, au même format que deadline
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    projects = sorted(
+        (with_progress(project) for project in get_catalog(conn).all(conn, 'projects')
+         if project['status'] == 'collecting' and project['deadline'] and str(project['deadline']) > now),
+        key=lambda project: str(project['created_at']),
+        reverse=True
+    )
     conn.close()
 
     return render_template('projects.html', projects=projects)
@@ -1554,12 +729,9 @@ def projects():
 @login_required
 def project_detail(project_id):
     conn = get_db_connection()
-    project = conn.execute('''
-        SELECT *, 
-               (raised_amount * 100.0 / target_amount) as progress_percent
-        FROM projects 
-        WHERE id = ?
-    ''', (project_id,)).fetchone()
+    project = get_catalog(conn).get(conn, 'projects', project_id)
+    if project:
+        project = with_progress(project)
 
     if not project:
         flash('Projet non trouvé', 'error')
@@ -1590,7 +762,7 @@ def invest_project():
     conn = get_db_connection()
 
     # Get project details
-    project = conn.execute('SELECT * FROM projects WHERE id = ?', (project_id,)).fetchone()
+    project = get_catalog(conn).get(conn, 'projects', project_id)
     if not project:
         return jsonify({'error': 'Projet non trouvé'}), 404
 
@@ -1598,29 +770,33 @@ def invest_project():
     if amount < project['min_investment'] or amount > project['max_investment']:
         return jsonify({'error': f'Montant doit être entre {project["min_investment"]} et {project["max_investment"]} USDT'}), 400
 
-    # Check user balance
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        return jsonify({'error': 'Solde insuffisant'}), 400
+    conn.close()
+    user_id = session['user_id']
 
-    # Create investment
-    conn.execute('''
-        INSERT INTO project_investments (user_id, project_id, amount, transaction_hash)
-        VALUES (?, ?, ?, ?)
-    ''', (session['user_id'], project_id, amount, generate_transaction_hash()))
+    def debit_and_invest(conn):
+        # Check and debit the balance in the same write transaction
+        if not debit_balance(conn, user_id, amount):
+            return False
+
+        # Create investment
+        conn.execute('''
+            INSERT INTO project_investments (user_id, project_id, amount, transaction_hash)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, project_id, amount, generate_transaction_hash()))
+        record_position_opened(conn, user_id, amount)
 
-    # Update user balance and project raised amount
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
-    conn.execute('UPDATE projects SET raised_amount = raised_amount + ? WHERE id = ?', (amount, project_id))
+        # Update project raised amount
+        conn.execute('UPDATE projects SET raised_amount = raised_amount + ? WHERE id = ?', (amount, project_id))
 
-    # Add transaction record
-    conn.execute('''
-        INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-        VALUES (?, 'project_investment', ?, 'completed', ?)
-    ''', (session['user_id'], amount, generate_transaction_hash()))
+        # Add transaction record
+        conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
+            VALUES (?, 'project_investment', ?, 'completed', ?)
+        ''', (user_id, amount, generate_transaction_hash()))
+        return True
 
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_invest), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
 
     return jsonify({'success': True, 'message': 'Investissement dans le projet réalisé avec succès!'})
 
@@ -1648,7 +824,7 @@ def profile():
 @login_required
 def staking_plans():
     conn = get_db_connection()
-    plans = conn.execute('SELECT * FROM staking_plans WHERE is_active = 1').fetchall()
+    plans = [plan for plan in get_catalog(conn).all(conn, 'staking_plans') if plan['is_active']]
     conn.close()
 
     return render_template('staking_plans.html', plans=plans)
@@ -1663,7 +839,7 @@ def invest_staking():
     conn = get_db_connection()
 
     # Get plan details
-    plan = conn.execute('SELECT * FROM staking_plans WHERE id = ?', (plan_id,)).fetchone()
+    plan = get_catalog(conn).get(conn, 'staking_plans', plan_id)
     if not plan:
         return jsonify({'error': 'Plan de staking non trouvé'}), 404
 
@@ -1671,26 +847,28 @@ def invest_staking():
     if amount < plan['min_amount'] or amount > plan['max_amount']:
         return jsonify({'error': f'Montant doit être entre {plan["min_amount"]} et {plan["max_amount"]} USDT'}), 400
 
-    # Check user balance
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        return jsonify({'error': 'Solde insuffisant'}), 400
+    conn.close()
 
     # Calculate dates
+    user_id = session['user_id']
     start_date = datetime.now()
     end_date = start_date + timedelta(days=plan['duration_days'])
 
-    # Create staking
-    conn.execute('''
-        INSERT INTO user_staking (user_id, plan_id, amount, start_date, end_date, transaction_hash)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (session['user_id'], plan_id, amount, start_date, end_date, generate_transaction_hash()))
+    def debit_and_stake(conn):
+        # Check and debit the balance in the same write transaction
+        if not debit_balance(conn, user_id, amount):
+            return False
 
-    # Update user balance
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
+        # Create staking
+        conn.execute('''
+            INSERT INTO user_staking (user_id, plan_id, amount, start_date, end_date, transaction_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, plan_id, amount, start_date, end_date, generate_transaction_hash()))
+        record_position_opened(conn, user_id, amount)
+        return True
 
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_stake), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
 
     return jsonify({'success': True, 'message': 'Staking activé avec succès!'})
 
@@ -1698,7 +876,7 @@ def invest_staking():
 @login_required
 def frozen_plans():
     conn = get_db_connection()
-    plans = conn.execute('SELECT * FROM frozen_plans WHERE is_active = 1').fetchall()
+    plans = [plan for plan in get_catalog(conn).all(conn, 'frozen_plans') if plan['is_active']]
     conn.close()
 
     return render_template('frozen_plans.html', plans=plans)
@@ -1713,7 +891,7 @@ def invest_frozen():
     conn = get_db_connection()
 
     # Get plan details
-    plan = conn.execute('SELECT * FROM frozen_plans WHERE id = ?', (plan_id,)).fetchone()
+    plan = get_catalog(conn).get(conn, 'frozen_plans', plan_id)
     if not plan:
         return jsonify({'error': 'Plan gelé non trouvé'}), 404
 
@@ -1721,27 +899,28 @@ def invest_frozen():
     if amount < plan['min_amount'] or amount > plan['max_amount']:
         return jsonify({'error': f'Montant doit être entre {plan["min_amount"]} et {plan["max_amount"]} USDT'}), 400
 
-    # Check user balance
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        return jsonify({'error': 'Solde insuffisant'}), 400
+    conn.close()
 
     # Calculate dates and final amount
+    user_id = session['user_id']
     start_date = datetime.now()
     end_date = start_date + timedelta(days=plan['duration_days'])
     final_amount = amount * plan['total_return_rate']
 
-    # Create frozen investment
-    conn.execute('''
-        INSERT INTO user_frozen_investments (user_id, plan_id, amount, start_date, end_date, final_amount, transaction_hash)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (session['user_id'], plan_id, amount, start_date, end_date, final_amount, generate_transaction_hash()))
+    def debit_and_freeze(conn):
+        # Check and debit the balance in the same write transaction
+        if not debit_balance(conn, user_id, amount):
+            return False
 
-    # Update user balance
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
+        # Create frozen investment
+        conn.execute('''
+            INSERT INTO user_frozen_investments (user_id, plan_id, amount, start_date, end_date, final_amount, transaction_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, plan_id, amount, start_date, end_date, final_amount, generate_transaction_hash()))
+        return True
 
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_freeze), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
 
     return jsonify({'success': True, 'message': 'Investissement gelé créé avec succès!'})
 
@@ -1756,60 +935,69 @@ def portfolio_invest():
         return jsonify({'error': 'Données de répartition invalides'}), 400
 
     conn = get_db_connection()
+    catalog_view = get_catalog(conn)
+    user_id = session['user_id']
 
-    # Check user balance
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < total_amount:
-        return jsonify({'error': 'Solde insuffisant'}), 400
-
-    # Process each distribution
+    # Résoudre les plans sur la connexion de la requête ; le writer n'exécute que les écritures
+    positions = []
     for dist in distributions:
         investment_type = dist.get('type')
         plan_id = dist.get('plan_id')
         amount = float(dist.get('amount', 0))
 
         if investment_type == 'roi':
-            plan = conn.execute('SELECT * FROM roi_plans WHERE id = ?', (plan_id,)).fetchone()
+            plan = catalog_view.get(conn, 'roi_plans', plan_id)
             if plan:
                 start_date = datetime.now()
                 end_date = start_date + timedelta(days=plan['duration_days'])
-                daily_profit = amount * plan['daily_rate']
-
-                conn.execute('''
-                    INSERT INTO user_investments (user_id, plan_id, amount, start_date, end_date, daily_profit, transaction_hash)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (session['user_id'], plan_id, amount, start_date, end_date, daily_profit, generate_transaction_hash()))
+                positions.append(('roi', plan_id, amount, start_date, end_date, amount * plan['daily_rate']))
 
         elif investment_type == 'staking':
-            plan = conn.execute('SELECT * FROM staking_plans WHERE id = ?', (plan_id,)).fetchone()
+            plan = catalog_view.get(conn, 'staking_plans', plan_id)
             if plan:
                 start_date = datetime.now()
                 end_date = start_date + timedelta(days=plan['duration_days'])
-
-                conn.execute('''
-                    INSERT INTO user_staking (user_id, plan_id, amount, start_date, end_date, transaction_hash)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (session['user_id'], plan_id, amount, start_date, end_date, generate_transaction_hash()))
+                positions.append(('staking', plan_id, amount, start_date, end_date, None))
 
         elif investment_type == 'project':
-            conn.execute('''
-                INSERT INTO project_investments (user_id, project_id, amount, transaction_hash)
-                VALUES (?, ?, ?, ?)
-            ''', (session['user_id'], plan_id, amount, generate_transaction_hash()))
+            positions.append(('project', plan_id, amount, None, None, None))
 
-            conn.execute('UPDATE projects SET raised_amount = raised_amount + ? WHERE id = ?', (amount, plan_id))
+    conn.close()
 
-    # Save portfolio distribution
-    conn.execute('''
-        INSERT INTO portfolio_distributions (user_id, total_amount, distribution_data)
-        VALUES (?, ?, ?)
-    ''', (session['user_id'], total_amount, json.dumps(distributions)))
+    def debit_and_distribute(conn):
+        # Check and debit the balance in the same write transaction
+        if not debit_balance(conn, user_id, total_amount):
+            return False
+
+        # Process each distribution
+        for investment_type, plan_id, amount, start_date, end_date, daily_profit in positions:
+            if investment_type == 'roi':
+                conn.execute('''
+                    INSERT INTO user_investments (user_id, plan_id, amount, start_date, end_date, daily_profit, transaction_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, plan_id, amount, start_date, end_date, daily_profit, generate_transaction_hash()))
+            elif investment_type == 'staking':
+                conn.execute('''
+                    INSERT INTO user_staking (user_id, plan_id, amount, start_date, end_date, transaction_hash)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, plan_id, amount, start_date, end_date, generate_transaction_hash()))
+            else:
+                conn.execute('''
+                    INSERT INTO project_investments (user_id, project_id, amount, transaction_hash)
+                    VALUES (?, ?, ?, ?)
+                ''', (user_id, plan_id, amount, generate_transaction_hash()))
+                conn.execute('UPDATE projects SET raised_amount = raised_amount + ? WHERE id = ?', (amount, plan_id))
+            record_position_opened(conn, user_id, amount)
 
-    # Update user balance
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (total_amount, session['user_id']))
+        # Save portfolio distribution
+        conn.execute('''
+            INSERT INTO portfolio_distributions (user_id, total_amount, distribution_data)
+            VALUES (?, ?, ?)
+        ''', (user_id, total_amount, json.dumps(distributions)))
+        return True
 
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_distribute), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
 
     return jsonify({'success': True, 'message': 'Portfolio diversifié créé avec succès!'})
 
@@ -1827,17 +1015,11 @@ def submit_deposit():
     if amount < 10:
         return jsonify({'error': 'Montant minimum de dépôt: 10 USDT'}), 400
 
-    conn = get_db_connection()
-
-    # Créer la transaction en attente
-    cursor = conn.execute('''
+    # Créer la transaction en attente (validée par le writer avant de répondre)
+    deposit_id = db_writer.wait(db_writer.execute('''
         INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
         VALUES (?, 'deposit', ?, 'pending', ?)
-    ''', (session['user_id'], amount, transaction_hash))
-
-    deposit_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    ''', (session['user_id'], amount, transaction_hash)), WRITE_TIMEOUT)
 
     # Notification admin pour nouveau dépôt
     add_notification(
@@ -1871,33 +1053,27 @@ def submit_withdrawal():
     if amount < 10:
         return jsonify({'error': 'Montant minimum de retrait: 10 USDT'}), 400
 
-    conn = get_db_connection()
-
-    # Vérifier le solde utilisateur
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        return jsonify({'error': 'Solde insuffisant'}), 400
+    user_id = session['user_id']
 
-    # Débiter temporairement le solde
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
-
-    # Créer la transaction en attente
-    cursor = conn.execute('''
-        INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-        VALUES (?, 'withdrawal', ?, 'pending', ?)
-    ''', (session['user_id'], amount, f"withdrawal_{generate_transaction_hash()[:16]}"))
+    def debit_and_record(conn):
+        # Vérification et débit dans la même transaction d'écriture
+        user = conn.execute('SELECT balance FROM users WHERE id = ?', (user_id,)).fetchone()
+        if user['balance'] < amount:
+            return None
 
-    withdrawal_id = cursor.lastrowid
+        # Débiter temporairement le solde
+        conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, user_id))
 
-    # Stocker l'adresse de retrait
-    conn.execute('''
-        UPDATE transactions 
-        SET transaction_hash = ? 
-        WHERE id = ?
-    ''', (f"{withdrawal_address}|{amount}", withdrawal_id))
+        # Créer la transaction en attente avec l'adresse de retrait
+        cursor = conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
+            VALUES (?, 'withdrawal', ?, 'pending', ?)
+        ''', (user_id, amount, f"{withdrawal_address}|{amount}"))
+        return cursor.lastrowid
 
-    conn.commit()
-    conn.close()
+    withdrawal_id = db_writer.wait(db_writer.submit(debit_and_record), WRITE_TIMEOUT)
+    if withdrawal_id is None:
+        return jsonify({'error': 'Solde insuffisant'}), 400
 
     # Notification admin pour nouveau retrait
     add_notification(
@@ -1934,9 +1110,10 @@ def support():
     ''', (session['user_id'],)).fetchall()
 
     # Get FAQ
-    faq_items = conn.execute('''
-        SELECT * FROM faq WHERE is_active = 1 ORDER BY category, id
-    ''').fetchall()
+    faq_items = sorted(
+        (item for item in get_catalog(conn).all(conn, 'faq') if item['is_active']),
+        key=lambda item: (item['category'], item['id'])
+    )
 
     conn.close()
 
@@ -2070,7 +1247,7 @@ def send_support_message():
         return jsonify({'error': 'Ticket non trouvé'}), 404
 
     # Add message
-    conn.execute('''
+    cursor = conn.execute('''
         INSERT INTO support_messages (ticket_id, user_id, message, is_admin)
         VALUES (?, ?, ?, 0)
     ''', (ticket_id, session['user_id'], message))
@@ -2084,64 +1261,181 @@ def send_support_message():
 
     conn.commit()
     conn.close()
+    event_broker.publish(support_topic(ticket['id']))
 
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'message_id': cursor.lastrowid})
 
 @app.route('/support/get-messages/<int:ticket_id>')
 @login_required
 def get_support_messages(ticket_id):
+    """Messages d'un ticket, depuis since_id ; 304 si la conversation n'a pas changé (ETag)"""
+    try:
+        since_id = int(request.args.get('since_id', 0))
+    except ValueError:
+        since_id = 0
+
     try:
         conn = get_db_connection()
 
-        # Verify ticket belongs to user
+        # Vérifier que le ticket appartient à l'utilisateur et lire sa version (dernier id)
         ticket = conn.execute('''
-            SELECT id FROM support_tickets 
-            WHERE id = ? AND user_id = ?
+            SELECT st.id,
+                   (SELECT MAX(sm.id) FROM support_messages sm WHERE sm.ticket_id = st.id) as last_id
+            FROM support_tickets st
+            WHERE st.id = ? AND st.user_id = ?
         ''', (ticket_id, session['user_id'])).fetchone()
 
         if not ticket:
             conn.close()
             return jsonify({'error': 'Ticket non trouvé'}), 404
 
-        # Get messages
-        messages = conn.execute('''
-            SELECT sm.*, u.first_name, u.last_name
-            FROM support_messages sm
-            LEFT JOIN users u ON sm.user_id = u.id
-            WHERE sm.ticket_id = ?
-            ORDER BY sm.created_at ASC
-        ''', (ticket_id,)).fetchall()
-
-        conn.close()
+        last_id = ticket['last_id'] or 0
+        etag = messages_etag(ticket_id, last_id, since_id)
+        if request.if_none_match.contains(etag):
+            conn.close()
+            response = Response(status=304)
+        else:
+            # Rien après since_id : pas de jointure à faire
+            messages_list = fetch_messages(conn, ticket_id, since_id) if last_id > since_id else []
+            conn.close()
 
-        messages_list = []
-        for msg in messages:
-            # Gérer les valeurs NULL proprement
-            first_name = msg['first_name'] if msg['first_name'] else ''
-            last_name = msg['last_name'] if msg['last_name'] else ''
-
-            sender_name = 'Support' if msg['is_admin'] else f"{first_name} {last_name}".strip()
-            if not sender_name or sender_name.isspace():
-                sender_name = 'Utilisateur'
-
-            messages_list.append({
-                'id': msg['id'],
-                'message': msg['message'] if msg['message'] else '',
-                'is_admin': bool(msg['is_admin']),
-                'created_at': msg['created_at'] if msg['created_at'] else '',
-                'sender_name': sender_name
+            response = jsonify({
+                'success': True,
+                'messages': messages_list,
+                'ticket_id': ticket_id,
+                'last_id': last_id
             })
 
-        return jsonify({
-            'success': True,
-            'messages': messages_list,
-            'ticket_id': ticket_id
-        })
+        response.set_etag(etag)
+        # Revalidation à chaque appel, réponse propre à l'utilisateur
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
 
     except Exception as e:
         print(f"Erreur get_support_messages: {e}")
         return jsonify({'error': 'Erreur serveur'}), 500
 
+def event_stream_response(topic, fetch, last_id):
+    """Réponse SSE bornée par stream_slots ; 503 avec délai de reprise quand le quota est atteint"""
+    topic_watcher.start()
+    if not stream_slots.acquire():
+        return Response(f'retry: {SSE_BUSY_RETRY_MS}\n\n', status=503, mimetype='text/event-stream', headers={
+            'Retry-After': str(SSE_BUSY_RETRY_MS // 1000),
+            'Cache-Control': 'no-cache'
+        })
+    response = Response(stream_events(event_broker, topic, fetch, last_id=last_id),
+                        mimetype='text/event-stream', headers={
+                            'Cache-Control': 'no-cache',
+                            'X-Accel-Buffering': 'no'
+                        })
+    # Place rendue quand le serveur ferme la réponse (fin du flux ou client parti)
+    response.call_on_close(stream_slots.release)
+    return response
+
+def support_message_stream(ticket_id):
+    """Réponse SSE des nouveaux messages d'un ticket (reprise via Last-Event-ID ou since_id)"""
+    def fetch(since_id):
+        # Connexion empruntée le temps de la lecture : le flux ne garde rien du pool
+        conn = get_db_connection()
+        try:
+            return fetch_messages(conn, ticket_id, since_id)
+        finally:
+            conn.close()
+
+    return event_stream_response(support_topic(ticket_id), fetch, last_event_id(request.headers, request.args))
+
+@app.route('/support/stream/<int:ticket_id>')
+@login_required
+def support_stream(ticket_id):
+    """Flux SSE des messages d'un ticket de l'utilisateur"""
+    conn = get_db_connection()
+    ticket = conn.execute('''
+        SELECT id FROM support_tickets
+        WHERE id = ? AND user_id = ?
+    ''', (ticket_id, session['user_id'])).fetchone()
+    conn.close()
+
+    if not ticket:
+        return jsonify({'error': 'Ticket non trouvé'}), 404
+    return support_message_stream(ticket_id)
+
+@app.route('/admin/support/stream/<int:ticket_id>')
+@admin_required
+def admin_support_stream(ticket_id):
+    """Flux SSE des messages d'un ticket (admin)"""
+    return support_message_stream(ticket_id)
+
+@app.context_processor
+def inject_notification_state():
+    """Compteur de notifications non lues de la barre de navigation (lecture par clé primaire)"""
+    if 'user_id' not in session:
+        return {}
+    conn = get_db_connection()
+    unread_count, last_id = get_notification_state(conn, session['user_id'])
+    conn.close()
+    return {'unread_notifications': unread_count, 'last_notification_id': last_id}
+
+@app.route('/notifications/state')
+@login_required
+def notifications_state():
+    """Nombre de notifications non lues et dernier id"""
+    conn = get_db_connection()
+    unread_count, last_id = get_notification_state(conn, session['user_id'])
+    conn.close()
+    return jsonify({'success': True, 'unread_count': unread_count, 'last_id': last_id})
+
+@app.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def notifications_mark_read():
+    """Marquer des notifications comme lues (toutes si ids est absent)"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is not None:
+        ids = [int(notification_id) for notification_id in ids if str(notification_id).isdigit()]
+
+    conn = get_db_connection()
+    updated = mark_notifications_read(conn, session['user_id'], ids)
+    conn.commit()
+    unread_count, last_id = get_notification_state(conn, session['user_id'])
+    conn.close()
+
+    # Les autres onglets ouverts mettent leur compteur à jour
+    if updated:
+        event_broker.publish(notification_topic(session['user_id']))
+    return jsonify({'success': True, 'updated': updated, 'unread_count': unread_count, 'last_id': last_id})
+
+@app.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    """Flux SSE des nouvelles notifications et du compteur de non lues"""
+    user_id = session['user_id']
+    since_id = last_event_id(request.headers, request.args, default=None)
+    if since_id is None:
+        # Sans point de reprise : seulement les notifications à venir
+        conn = get_db_connection()
+        since_id = get_notification_state(conn, user_id)[1]
+        conn.close()
+
+    sent = {'unread_count': None}
+
+    def fetch(since_id):
+        conn = get_db_connection()
+        try:
+            unread_count, last_id = get_notification_state(conn, user_id)
+            notifications = fetch_notifications_since(conn, user_id, since_id) if last_id > since_id else []
+        finally:
+            conn.close()
+        if not notifications and unread_count == sent['unread_count']:
+            return []
+        sent['unread_count'] = unread_count
+        return [{
+            'id': notifications[-1]['id'] if notifications else since_id,
+            'unread_count': unread_count,
+            'notifications': notifications
+        }]
+
+    return event_stream_response(notification_topic(user_id), fetch, since_id)
+
 @app.route('/admin')
 def admin_panel():
     """Panneau d'administration principal - ACCÈS LIBRE"""
@@ -2191,7 +1485,61 @@ def admin_dashboard():
 
     conn.close()
 
-    return render_template('admin_dashboard.html', stats=stats, transactions=transactions)
+    return render_template('admin_dashboard.html', stats=stats, transactions=transactions,
+                           slow_queries=slow_query_log.summary()[:10],
+                           slow_query_threshold=slow_query_log.threshold * 1000,
+                           slow_queries_all_workers=bool(slow_query_log.log_dir))
+
+@app.route('/admin/slow-queries')
+@admin_required
+def admin_slow_queries():
+    """Journal des requêtes lentes (tous les workers avec METRICS_DIR) : regroupement et dernières entrées"""
+    return jsonify({
+        'success': True,
+        'threshold_ms': slow_query_log.threshold * 1000,
+        'all_workers': bool(slow_query_log.log_dir),
+        'summary': slow_query_log.summary(),
+        'entries': slow_query_log.entries()[:request.args.get('limit', 100, type=int)]
+    })
+
+def collapsed_response(text, kind):
+    """Fichier collapsed stacks (flamegraph.pl, speedscope) de ce worker"""
+    filename = f"profile-{kind}-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return Response(text, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Profile-Worker': str(os.getpid())
+    })
+
+@app.route('/admin/profile/sample')
+@admin_required
+def admin_profile_sample():
+    """Échantillonner les piles de ce worker pendant ?seconds= (bloque la requête le temps de la mesure)"""
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval_ms', SAMPLE_INTERVAL_MS, type=float)
+    try:
+        counts = sample_stacks(seconds, interval_ms, ignore_threads=(threading.get_ident(),))
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return collapsed_response(collapse(counts), 'sample')
+
+@app.route('/admin/profile/requests', methods=['GET', 'POST'])
+@admin_required
+def admin_profile_requests():
+    """POST ?count=N : profiler les N prochaines requêtes de ce worker ; GET : résultat cumulé"""
+    if request.method == 'POST':
+        request_profiler.arm(request.args.get('count', 20, type=int))
+        return jsonify({'success': True, 'worker': os.getpid(), **request_profiler.status()})
+
+    status = request_profiler.status()
+    if request.args.get('format') == 'json' or not status['profiled']:
+        return jsonify({'success': True, 'worker': os.getpid(), **status}), 200 if status['profiled'] else 202
+    return collapsed_response(request_profiler.collapsed(), 'cprofile')
+
+@app.route('/admin/slow-queries/clear', methods=['POST'])
+@admin_required
+def admin_clear_slow_queries():
+    slow_query_log.clear()
+    return jsonify({'success': True})
 
 @app.route('/admin-activation-required')
 def admin_activation_required():
@@ -2335,6 +1683,7 @@ def restore_user_investments(user_id, investments_data=None):
                 inv_data.get('total_earned', 0),
                 generate_transaction_hash()
             ))
+            record_position_opened(conn, user_id, inv_data['amount'], profits=inv_data.get('total_earned', 0))
         
         conn.commit()
         conn.close()
@@ -2359,64 +1708,118 @@ def restore_user_investments(user_id, investments_data=None):
 @app.route('/admin/transactions')
 @admin_required
 def admin_transactions():
-    """Gestion des transactions (dépôts/retraits)"""
+    """Gestion des transactions (dépôts/retraits) : la liste est chargée par l'API paginée"""
     conn = get_db_connection()
+    counts = admin_queue.pending_counts(conn)
+    conn.close()
 
-    # Récupérer toutes les transactions en attente
-    pending_transactions = conn.execute('''
-        SELECT t.*, u.first_name, u.last_name, u.email
-        FROM transactions t
-        JOIN users u ON t.user_id = u.id
-        WHERE t.status = 'pending'
-        ORDER BY t.created_at DESC
-    ''').fetchall()
+    return render_template('admin_transactions.html', counts=counts)
+
+def admin_queue_filters():
+    """Filtres de la file admin lus dans la query string"""
+    return {
+        'tx_type': request.args.get('type') or None,
+        'min_amount': request.args.get('min_amount'),
+        'max_amount': request.args.get('max_amount'),
+        'date_from': request.args.get('date_from') or None,
+        'date_to': request.args.get('date_to') or None,
+    }
+
+@app.route('/admin/transactions/queue')
+@admin_required
+def admin_transactions_queue():
+    """Page JSON des transactions en attente (pagination par curseur)"""
+    try:
+        limit = int(request.args.get('limit', admin_queue.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = admin_queue.DEFAULT_PAGE_SIZE
 
+    conn = get_db_connection()
+    transactions, next_cursor = admin_queue.fetch_pending_page(
+        conn,
+        cursor=request.args.get('cursor') or None,
+        limit=limit,
+        **admin_queue_filters()
+    )
+    counts = admin_queue.pending_counts(conn)
     conn.close()
 
-    return render_template('admin_transactions.html', transactions=pending_transactions)
+    return jsonify({
+        'success': True,
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'counts': counts
+    })
+
+@app.route('/admin/transactions/changes')
+@admin_required
+def admin_transactions_changes():
+    """Delta de la file : nouvelles transactions après since_id et id affichés déjà traités"""
+    try:
+        since_id = int(request.args.get('since_id', 0))
+    except ValueError:
+        since_id = 0
+
+    conn = get_db_connection()
+    changes = admin_queue.fetch_queue_changes(
+        conn,
+        since_id=since_id,
+        watched_ids=admin_queue.parse_id_list(request.args.get('ids')),
+        **admin_queue_filters()
+    )
+    conn.close()
+
+    return jsonify({'success': True, **changes})
 
 @app.route('/restore-from-backup', methods=['POST'])
-@login_required
+@admin_required
 def restore_from_backup():
-    """Restaurer manuellement depuis la sauvegarde"""
+    """Restaurer manuellement un export du répertoire des sauvegardes (le plus récent par défaut)"""
     try:
-        if not REPLIT_DB_AVAILABLE:
+        dump_dir = default_dump_dir(default_backup_dir(DATABASE))
+        name = request.args.get('name')
+        path = os.path.join(dump_dir, os.path.basename(name)) if name else latest_dump(dump_dir)
+
+        if not path or not os.path.isfile(path):
             return jsonify({
-                'error': 'Sauvegarde Replit non disponible'
+                'error': 'Aucune sauvegarde disponible'
             }), 400
         
-        success = restore_critical_data()
+        stats = restore_critical_data(path)
         
-        if success:
-            return jsonify({
-                'success': True,
-                'message': 'Données restaurées depuis la sauvegarde!'
-            })
-        else:
-            return jsonify({
-                'error': 'Aucune sauvegarde disponible ou données déjà présentes'
-            }), 400
+        return jsonify({
+            'success': True,
+            'message': 'Données restaurées depuis la sauvegarde!',
+            'restore': stats
+        })
             
     except Exception as e:
         return jsonify({
             'error': f'Erreur: {str(e)}'
         }), 500
 
+@app.route('/metrics')
+def metrics():
+    """Métriques par route au format texte Prometheus (désactivé sans METRICS_TOKEN)"""
+    if not METRICS_TOKEN:
+        return Response('Not Found\n', status=404, mimetype='text/plain')
+    if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(render_prometheus(metrics_registry.collect()),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/force-backup', methods=['POST'])
-@login_required
+@admin_required
 def force_backup():
     """Forcer une sauvegarde manuelle"""
     try:
-        if not REPLIT_DB_AVAILABLE:
-            return jsonify({
-                'error': 'Sauvegarde Replit non disponible'
-            }), 400
-        
-        backup_critical_data()
-        
+        stats = backup_database(force_full=request.args.get('full') == '1')
+
         return jsonify({
             'success': True,
-            'message': 'Sauvegarde effectuée avec succès!'
+            'message': 'Sauvegarde effectuée avec succès!' if stats['status'] != 'skipped'
+                       else 'Aucune modification depuis la dernière sauvegarde',
+            'backup': stats
         })
             
     except Exception as e:
@@ -2453,38 +1856,38 @@ def approve_transaction(transaction_id):
             conn.close()
             return jsonify({'error': 'Montant de transaction invalide'}), 400
 
-        # Traiter selon le type de transaction
-        if transaction['type'] == 'deposit':
-            # Approuver le dépôt - créditer le compte
-            new_balance = transaction['balance'] + transaction['amount']
-            conn.execute('''
-                UPDATE users 
-                SET balance = ?
-                WHERE id = ?
-            ''', (new_balance, transaction['user_id']))
+        if transaction['type'] not in ('deposit', 'withdrawal'):
+            conn.close()
+            return jsonify({'error': 'Type de transaction non supporté'}), 400
+
+        conn.close()
 
+        def complete_and_credit(conn):
+            # Marquer la transaction comme complétée, seulement si elle est encore en attente
+            cursor = conn.execute('''
+                UPDATE transactions 
+                SET status = 'completed', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+            ''', (transaction_id,))
+            if cursor.rowcount != 1:
+                return None
+
+            # Approuver le dépôt - créditer le compte (le retrait a déjà été débité lors de la demande)
+            if transaction['type'] == 'deposit':
+                conn.execute('UPDATE users SET balance = balance + ? WHERE id = ?',
+                             (transaction['amount'], transaction['user_id']))
+            return conn.execute('SELECT balance FROM users WHERE id = ?', (transaction['user_id'],)).fetchone()['balance']
+
+        new_balance = db_writer.wait(db_writer.submit(complete_and_credit), WRITE_TIMEOUT)
+        if new_balance is None:
+            return jsonify({'error': 'Transaction non trouvée ou déjà traitée'}), 404
+
+        if transaction['type'] == 'deposit':
             # Message de notification pour dépôt
             notification_msg = f'Votre dépôt de {transaction["amount"]:.2f} USDT a été approuvé et crédité à votre compte. Nouveau solde: {new_balance:.2f} USDT'
-            
-        elif transaction['type'] == 'withdrawal':
-            # Le montant a déjà été débité lors de la demande
+        else:
             # Message de notification pour retrait
             notification_msg = f'Votre retrait de {transaction["amount"]:.2f} USDT a été traité avec succès et sera envoyé à votre adresse.'
-            
-        else:
-            conn.close()
-            return jsonify({'error': 'Type de transaction non supporté'}), 400
-
-        # Marquer la transaction comme complétée avec updated_at
-        conn.execute('''
-            UPDATE transactions 
-            SET status = 'completed', updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (transaction_id,))
-
-        # Valider toutes les modifications
-        conn.commit()
-        conn.close()
 
         # Ajouter notification après fermeture de la connexion
         add_notification(
@@ -2508,6 +1911,9 @@ def approve_transaction(transaction_id):
             'message': f'{transaction["type"].title()} #{transaction_id} approuvé avec succès'
         })
 
+    except WriteTimeout:
+        # Écriture annulée : 503 « réessayez » via l'errorhandler
+        raise
     except Exception as e:
         print(f"❌ Erreur lors de l'approbation: {e}")
         if 'conn' in locals():
@@ -2542,20 +1948,27 @@ def reject_transaction(transaction_id):
         if not transaction:
             return jsonify({'error': 'Transaction non trouvée'}), 404
 
-        if transaction['type'] == 'withdrawal':
-            # Rembourser le montant au solde utilisateur
-            conn.execute('''
-                UPDATE users 
-                SET balance = balance + ? 
-                WHERE id = ?
-            ''', (transaction['amount'], transaction['user_id']))
+        def fail_and_refund(conn):
+            # Marquer comme rejetée, seulement si elle est encore en attente (un seul remboursement)
+            cursor = conn.execute('''
+                UPDATE transactions 
+                SET status = 'failed', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+            ''', (transaction_id,))
+            if cursor.rowcount != 1:
+                return False
+
+            if transaction['type'] == 'withdrawal':
+                # Rembourser le montant au solde utilisateur
+                conn.execute('''
+                    UPDATE users 
+                    SET balance = balance + ? 
+                    WHERE id = ?
+                ''', (transaction['amount'], transaction['user_id']))
+            return True
 
-        # Marquer comme rejetée
-        conn.execute('''
-            UPDATE transactions 
-            SET status = 'failed' 
-            WHERE id = ?
-        ''', (transaction_id,))
+        if not db_writer.wait(db_writer.submit(fail_and_refund), WRITE_TIMEOUT):
+            return jsonify({'error': 'Transaction non trouvée ou déjà traitée'}), 404
 
         # Ajouter notification
         add_notification(
@@ -2565,12 +1978,11 @@ def reject_transaction(transaction_id):
             'error'
         )
 
-        conn.commit()
-
         return jsonify({'success': True, 'message': 'Transaction rejetée'})
 
+    except WriteTimeout:
+        raise
     except Exception as e:
-        conn.rollback()
         return jsonify({'error': f'Erreur: {str(e)}'}), 500
     finally:
         conn.close()
@@ -2642,7 +2054,7 @@ def admin_support_reply():
 
     try:
         # Ajouter la réponse admin
-        conn.execute('''
+        cursor = conn.execute('''
             INSERT INTO support_messages (ticket_id, message, is_admin)
             VALUES (?, ?, 1)
         ''', (ticket_id, message))
@@ -2663,6 +2075,7 @@ def admin_support_reply():
         ''', (ticket_id,)).fetchone()
 
         conn.commit()
+        event_broker.publish(support_topic(ticket_id))
 
         # Ajouter notification à l'utilisateur
         if ticket:
@@ -2673,7 +2086,7 @@ def admin_support_reply():
                 'info'
             )
 
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'message_id': cursor.lastrowid})
 
     except Exception as e:
         conn.rollback()
@@ -2798,11 +2211,10 @@ def auto_trading():
     conn = get_db_connection()
     
     # Récupérer les stratégies de trading
-    strategies = conn.execute('''
-        SELECT * FROM trading_strategies 
-        WHERE is_active = 1
-        ORDER BY risk_level, expected_daily_return DESC
-    ''').fetchall()
+    strategies = sorted(
+        (strategy for strategy in get_catalog(conn).all(conn, 'trading_strategies') if strategy['is_active']),
+        key=lambda strategy: (strategy['risk_level'], -strategy['expected_daily_return'])
+    )
     
     # Récupérer les bots actifs de l'utilisateur
     user_bots = conn.execute('''
@@ -2824,11 +2236,11 @@ def copy_trading():
     conn = get_db_connection()
     
     # Récupérer les top traders
-    top_traders = conn.execute('''
-        SELECT * FROM top_traders 
-        WHERE is_active = 1
-        ORDER BY total_return DESC
-    ''').fetchall()
+    top_traders = sorted(
+        (trader for trader in get_catalog(conn).all(conn, 'top_traders') if trader['is_active']),
+        key=lambda trader: trader['total_return'],
+        reverse=True
+    )
     
     # Récupérer les copy trades actifs de l'utilisateur
     user_copies = conn.execute('''
@@ -2854,7 +2266,7 @@ def start_trading_bot():
     conn = get_db_connection()
     
     # Récupérer les détails de la stratégie
-    strategy = conn.execute('SELECT * FROM trading_strategies WHERE id = ?', (strategy_id,)).fetchone()
+    strategy = get_catalog(conn).get(conn, 'trading_strategies', strategy_id)
     if not strategy:
         conn.close()
         return jsonify({'error': 'Stratégie non trouvée'}), 404
@@ -2864,32 +2276,33 @@ def start_trading_bot():
         conn.close()
         return jsonify({'error': f'Montant doit être entre {strategy["min_amount"]} et {strategy["max_amount"]} USDT'}), 400
     
-    # Vérifier le solde utilisateur
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        conn.close()
-        return jsonify({'error': 'Solde insuffisant'}), 400
+    conn.close()
     
     # Calculer le profit quotidien estimé
+    user_id = session['user_id']
     daily_profit = amount * strategy['expected_daily_return']
     
-    # Créer le bot de trading
-    cursor = conn.execute('''
-        INSERT INTO user_trading_bots (user_id, strategy_id, amount, daily_profit, transaction_hash)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (session['user_id'], strategy_id, amount, daily_profit, generate_transaction_hash()))
-    
-    # Mettre à jour le solde utilisateur
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
-    
-    # Ajouter transaction
-    conn.execute('''
-        INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-        VALUES (?, 'trading_bot', ?, 'completed', ?)
-    ''', (session['user_id'], amount, generate_transaction_hash()))
+    def debit_and_start(conn):
+        # Vérifier et débiter le solde dans la même transaction d'écriture
+        if not debit_balance(conn, user_id, amount):
+            return False
+        
+        # Créer le bot de trading
+        conn.execute('''
+            INSERT INTO user_trading_bots (user_id, strategy_id, amount, daily_profit, transaction_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, strategy_id, amount, daily_profit, generate_transaction_hash()))
+        record_position_opened(conn, user_id, amount)
+        
+        # Ajouter transaction
+        conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
+            VALUES (?, 'trading_bot', ?, 'completed', ?)
+        ''', (user_id, amount, generate_transaction_hash()))
+        return True
     
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_start), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
     
     # Ajouter notification
     add_notification(
@@ -2913,7 +2326,7 @@ def start_copy_trading():
     conn = get_db_connection()
     
     # Récupérer les détails du trader
-    trader = conn.execute('SELECT * FROM top_traders WHERE id = ?', (trader_id,)).fetchone()
+    trader = get_catalog(conn).get(conn, 'top_traders', trader_id)
     if not trader:
         conn.close()
         return jsonify({'error': 'Trader non trouvé'}), 404
@@ -2923,32 +2336,33 @@ def start_copy_trading():
         conn.close()
         return jsonify({'error': f'Montant doit être entre {trader["min_copy_amount"]} et {trader["max_copy_amount"]} USDT'}), 400
     
-    # Vérifier le solde utilisateur
-    user = conn.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-    if user['balance'] < amount:
-        conn.close()
-        return jsonify({'error': 'Solde insuffisant'}), 400
-    
-    # Créer le copy trading
-    cursor = conn.execute('''
-        INSERT INTO user_copy_trading (user_id, trader_id, amount, copy_ratio, transaction_hash)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (session['user_id'], trader_id, amount, copy_ratio, generate_transaction_hash()))
-    
-    # Mettre à jour le solde utilisateur
-    conn.execute('UPDATE users SET balance = balance - ? WHERE id = ?', (amount, session['user_id']))
-    
-    # Mettre à jour le nombre de followers du trader
-    conn.execute('UPDATE top_traders SET followers_count = followers_count + 1 WHERE id = ?', (trader_id,))
+    conn.close()
+    user_id = session['user_id']
     
-    # Ajouter transaction
-    conn.execute('''
-        INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
-        VALUES (?, 'copy_trading', ?, 'completed', ?)
-    ''', (session['user_id'], amount, generate_transaction_hash()))
+    def debit_and_copy(conn):
+        # Vérifier et débiter le solde dans la même transaction d'écriture
+        if not debit_balance(conn, user_id, amount):
+            return False
+        
+        # Créer le copy trading
+        conn.execute('''
+            INSERT INTO user_copy_trading (user_id, trader_id, amount, copy_ratio, transaction_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, trader_id, amount, copy_ratio, generate_transaction_hash()))
+        record_position_opened(conn, user_id, amount)
+        
+        # Mettre à jour le nombre de followers du trader
+        conn.execute('UPDATE top_traders SET followers_count = followers_count + 1 WHERE id = ?', (trader_id,))
+        
+        # Ajouter transaction
+        conn.execute('''
+            INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
+            VALUES (?, 'copy_trading', ?, 'completed', ?)
+        ''', (user_id, amount, generate_transaction_hash()))
+        return True
     
-    conn.commit()
-    conn.close()
+    if not db_writer.wait(db_writer.submit(debit_and_copy), WRITE_TIMEOUT):
+        return jsonify({'error': 'Solde insuffisant'}), 400
     
     # Ajouter notification
     add_notification(
@@ -2964,32 +2378,34 @@ def start_copy_trading():
 @login_required
 def stop_trading_bot(bot_id):
     """Arrêter un bot de trading"""
-    conn = get_db_connection()
-    
-    # Récupérer et vérifier le bot
-    bot = conn.execute('''
-        SELECT * FROM user_trading_bots 
-        WHERE id = ? AND user_id = ? AND is_active = 1
-    ''', (bot_id, session['user_id'])).fetchone()
+    user_id = session['user_id']
+    
+    def stop_and_refund(conn):
+        # Récupérer et vérifier le bot dans la transaction d'écriture (un seul remboursement)
+        bot = conn.execute('''
+            SELECT amount, total_profit FROM user_trading_bots 
+            WHERE id = ? AND user_id = ? AND is_active = 1
+        ''', (bot_id, user_id)).fetchone()
+        if not bot:
+            return None
+        
+        # Arrêter le bot
+        conn.execute('''
+            UPDATE user_trading_bots 
+            SET is_active = 0, end_date = CURRENT_TIMESTAMP 
+            WHERE id = ?
+        ''', (bot_id,))
+        record_position_closed(conn, user_id)
+        
+        # Rembourser le capital + profits
+        total_amount = bot['amount'] + bot['total_profit']
+        conn.execute('UPDATE users SET balance = balance + ? WHERE id = ?', (total_amount, user_id))
+        return total_amount
     
-    if not bot:
-        conn.close()
+    total_amount = db_writer.wait(db_writer.submit(stop_and_refund), WRITE_TIMEOUT)
+    if total_amount is None:
         return jsonify({'error': 'Bot non trouvé ou déjà arrêté'}), 404
     
-    # Arrêter le bot
-    conn.execute('''
-        UPDATE user_trading_bots 
-        SET is_active = 0, end_date = CURRENT_TIMESTAMP 
-        WHERE id = ?
-    ''', (bot_id,))
-    
-    # Rembourser le capital + profits
-    total_amount = bot['amount'] + bot['total_profit']
-    conn.execute('UPDATE users SET balance = balance + ? WHERE id = ?', (total_amount, session['user_id']))
-    
-    conn.commit()
-    conn.close()
-    
     add_notification(
         session['user_id'],
         'Bot de trading arrêté',
@@ -3003,35 +2419,37 @@ def stop_trading_bot(bot_id):
 @login_required
 def stop_copy_trading(copy_id):
     """Arrêter le copy trading"""
-    conn = get_db_connection()
-    
-    # Récupérer et vérifier le copy trade
-    copy_trade = conn.execute('''
-        SELECT * FROM user_copy_trading 
-        WHERE id = ? AND user_id = ? AND is_active = 1
-    ''', (copy_id, session['user_id'])).fetchone()
+    user_id = session['user_id']
+    
+    def stop_and_refund(conn):
+        # Récupérer et vérifier le copy trade dans la transaction d'écriture (un seul remboursement)
+        copy_trade = conn.execute('''
+            SELECT amount, total_profit, trader_id FROM user_copy_trading 
+            WHERE id = ? AND user_id = ? AND is_active = 1
+        ''', (copy_id, user_id)).fetchone()
+        if not copy_trade:
+            return None
+        
+        # Arrêter le copy trading
+        conn.execute('''
+            UPDATE user_copy_trading 
+            SET is_active = 0, end_date = CURRENT_TIMESTAMP 
+            WHERE id = ?
+        ''', (copy_id,))
+        record_position_closed(conn, user_id)
+        
+        # Rembourser le capital + profits
+        total_amount = copy_trade['amount'] + copy_trade['total_profit']
+        conn.execute('UPDATE users SET balance = balance + ? WHERE id = ?', (total_amount, user_id))
+        
+        # Réduire le nombre de followers du trader
+        conn.execute('UPDATE top_traders SET followers_count = followers_count - 1 WHERE id = ?', (copy_trade['trader_id'],))
+        return total_amount
     
-    if not copy_trade:
-        conn.close()
+    total_amount = db_writer.wait(db_writer.submit(stop_and_refund), WRITE_TIMEOUT)
+    if total_amount is None:
         return jsonify({'error': 'Copy trading non trouvé ou déjà arrêté'}), 404
     
-    # Arrêter le copy trading
-    conn.execute('''
-        UPDATE user_copy_trading 
-        SET is_active = 0, end_date = CURRENT_TIMESTAMP 
-        WHERE id = ?
-    ''', (copy_id,))
-    
-    # Rembourser le capital + profits
-    total_amount = copy_trade['amount'] + copy_trade['total_profit']
-    conn.execute('UPDATE users SET balance = balance + ? WHERE id = ?', (total_amount, session['user_id']))
-    
-    # Réduire le nombre de followers du trader
-    conn.execute('UPDATE top_traders SET followers_count = followers_count - 1 WHERE id = ?', (copy_trade['trader_id'],))
-    
-    conn.commit()
-    conn.close()
-    
     add_notification(
         session['user_id'],
         'Copy Trading arrêté',
@@ -3049,24 +2467,6 @@ def security_settings():
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
 
-    # Créer la table security_logs si elle n'existe pas
-    try:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS security_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                ip_address TEXT,
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        conn.commit()
-    except Exception as e:
-        print(f"Erreur création table security_logs: {e}")
-
     # Récupérer les logs de sécurité récents
     try:
         security_logs = conn.execute('''
@@ -3342,45 +2742,29 @@ def create_secure_admin(email, password, first_name="Admin", last_name="System")
         print(f"❌ Erreur création admin: {e}")
         return False
 
+def report_security_log_failure(future):
+    if future.exception() is not None:
+        print(f"❌ Erreur journal de sécurité: {future.exception()}")
+
 def log_security_action(user_id, action, details=""):
-    """Enregistrer une action de sécurité"""
+    """Enregistrer une action de sécurité (via le writer, sans attente)"""
+    # Récupérer l'IP et User-Agent depuis Flask si disponible (avant de quitter le thread de la requête)
+    ip_address = None
+    user_agent = None
     try:
-        conn = get_db_connection()
-
-        # Créer table de logs de sécurité si elle n'existe pas
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS security_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                ip_address TEXT,
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-
-        # Récupérer l'IP et User-Agent depuis Flask si disponible
-        ip_address = None
-        user_agent = None
-        try:
-            from flask import request
-            ip_address = request.remote_addr
-            user_agent = request.headers.get('User-Agent', '')
-        except:
-            pass
+        from flask import request
+        ip_address = request.remote_addr
+        user_agent = request.headers.get('User-Agent', '')
+    except:
+        pass
 
+    def insert_log(conn):
         conn.execute('''
             INSERT INTO security_logs (user_id, action, details, ip_address, user_agent)
             VALUES (?, ?, ?, ?, ?)
         ''', (user_id, action, details, ip_address, user_agent))
 
-        conn.commit()
-        conn.close()
-
-    except Exception as e:
-        print(f"❌ Erreur log sécurité: {e}")
+    db_writer.submit(insert_log).add_done_callback(report_security_log_failure)
 
 if __name__ == '__main__':
     # Initialize database with retry logic
@@ -3390,9 +2774,9 @@ if __name__ == '__main__':
             init_db()
             print("✅ Base de données initialisée avec succès")
             
-            # Tenter de restaurer les données depuis la sauvegarde
-            if REPLIT_DB_AVAILABLE:
-                restore_critical_data()
+            # Restauration en masse demandée au démarrage (RESTORE_DUMP=chemin de l'export)
+            if os.environ.get('RESTORE_DUMP'):
+                restore_critical_data(os.environ['RESTORE_DUMP'])
             
             break
         except sqlite3.OperationalError as e:
@@ -3429,15 +2813,32 @@ if __name__ == '__main__':
             minute=0,
             id='daily_profits'
         )
+
+        # Rétention des notifications, après le run de profits
+        scheduler.add_job(
+            func=purge_notifications,
+            trigger="cron",
+            hour=3,
+            minute=30,
+            id='notification_retention'
+        )
+
+        # Partitionnement des mois clos de transactions
+        scheduler.add_job(
+            func=partition_transactions,
+            trigger="cron",
+            hour=4,
+            minute=0,
+            id='ledger_partitions'
+        )
         
-        # Sauvegarde périodique toutes les 30 minutes si Replit DB disponible
-        if REPLIT_DB_AVAILABLE:
-            scheduler.add_job(
-                func=backup_critical_data,
-                trigger="interval",
-                minutes=30,
-                id='backup_data'
-            )
+        # Sauvegarde en ligne périodique (ignorée si la base n'a pas changé)
+        scheduler.add_job(
+            func=backup_database,
+            trigger="interval",
+            minutes=BACKUP_INTERVAL_MINUTES,
+            id='backup_data'
+        )
         
         scheduler.start()
 
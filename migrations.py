@@ -0,0 +1,903 @@
+"""
+Migrations versionnées du schéma
+
+Source unique du schéma : toutes les entrées (main, render_start,
+render_optimized, database_config) appellent run_migrations(). Au
+démarrage, seule la version enregistrée dans schema_version est lue ; les
+étapes manquantes sont appliquées dans l'ordre, en une transaction.
+"""
+
+import sqlite3
+
+# Tables canoniques, dans l'ordre de création (les plans avant les positions)
+SCHEMA = (
+    ('users', '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            wallet_address TEXT,
+            balance REAL DEFAULT 0.0,
+            pending_balance REAL DEFAULT 0.0,
+            kyc_status TEXT DEFAULT 'pending',
+            referral_code TEXT UNIQUE,
+            referred_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            two_fa_enabled BOOLEAN DEFAULT 0,
+            two_fa_secret TEXT,
+            telegram_id INTEGER UNIQUE,
+            last_login TIMESTAMP,
+            failed_login_attempts INTEGER DEFAULT 0,
+            account_locked BOOLEAN DEFAULT 0,
+            locked_until TIMESTAMP
+        )
+    '''),
+    ('roi_plans', '''
+        CREATE TABLE IF NOT EXISTS roi_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            daily_rate REAL NOT NULL,
+            duration_days INTEGER NOT NULL,
+            min_amount REAL NOT NULL,
+            max_amount REAL NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''),
+    ('staking_plans', '''
+        CREATE TABLE IF NOT EXISTS staking_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            duration_days INTEGER NOT NULL,
+            annual_rate REAL NOT NULL,
+            min_amount REAL NOT NULL,
+            max_amount REAL NOT NULL,
+            penalty_rate REAL DEFAULT 0.05,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''),
+    ('frozen_plans', '''
+        CREATE TABLE IF NOT EXISTS frozen_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            duration_days INTEGER NOT NULL,
+            total_return_rate REAL NOT NULL,
+            min_amount REAL NOT NULL,
+            max_amount REAL NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''),
+    ('projects', '''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            category TEXT NOT NULL,
+            target_amount REAL NOT NULL,
+            raised_amount REAL DEFAULT 0.0,
+            expected_return REAL NOT NULL,
+            duration_months INTEGER NOT NULL,
+            min_investment REAL NOT NULL,
+            max_investment REAL NOT NULL,
+            status TEXT DEFAULT 'collecting',
+            image_url TEXT,
+            video_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            deadline TIMESTAMP
+        )
+    '''),
+    ('trading_strategies', '''
+        CREATE TABLE IF NOT EXISTS trading_strategies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            risk_level TEXT NOT NULL,
+            expected_daily_return REAL NOT NULL,
+            min_amount REAL NOT NULL,
+            max_amount REAL NOT NULL,
+            strategy_type TEXT NOT NULL,
+            parameters TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''),
+    ('top_traders', '''
+        CREATE TABLE IF NOT EXISTS top_traders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            avatar_url TEXT,
+            total_return REAL NOT NULL,
+            win_rate REAL NOT NULL,
+            followers_count INTEGER DEFAULT 0,
+            monthly_return REAL NOT NULL,
+            risk_score REAL NOT NULL,
+            trading_style TEXT NOT NULL,
+            min_copy_amount REAL NOT NULL,
+            max_copy_amount REAL NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''),
+    ('user_investments', '''
+        CREATE TABLE IF NOT EXISTS user_investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            plan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            daily_profit REAL NOT NULL,
+            total_earned REAL DEFAULT 0.0,
+            is_active BOOLEAN DEFAULT 1,
+            transaction_hash TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (plan_id) REFERENCES roi_plans (id)
+        )
+    '''),
+    ('project_investments', '''
+        CREATE TABLE IF NOT EXISTS project_investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            project_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            investment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            transaction_hash TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (project_id) REFERENCES projects (id)
+        )
+    '''),
+    ('transactions', '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            amount REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            transaction_hash TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''),
+    ('notifications', '''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            type TEXT NOT NULL,
+            is_read BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''),
+    ('user_staking', '''
+        CREATE TABLE IF NOT EXISTS user_staking (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            plan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            is_withdrawn BOOLEAN DEFAULT 0,
+            total_earned REAL DEFAULT 0.0,
+            transaction_hash TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (plan_id) REFERENCES staking_plans (id)
+        )
+    '''),
+    ('user_frozen_investments', '''
+        CREATE TABLE IF NOT EXISTS user_frozen_investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            plan_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            final_amount REAL NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            is_completed BOOLEAN DEFAULT 0,
+            transaction_hash TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (plan_id) REFERENCES frozen_plans (id)
+        )
+    '''),
+    ('portfolio_distributions', '''
+        CREATE TABLE IF NOT EXISTS portfolio_distributions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            total_amount REAL NOT NULL,
+            distribution_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''),
+    ('user_trading_bots', '''
+        CREATE TABLE IF NOT EXISTS user_trading_bots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            strategy_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            total_profit REAL DEFAULT 0.0,
+            daily_profit REAL DEFAULT 0.0,
+            last_profit_date TIMESTAMP,
+            transaction_hash TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (strategy_id) REFERENCES trading_strategies (id)
+        )
+    '''),
+    ('user_copy_trading', '''
+        CREATE TABLE IF NOT EXISTS user_copy_trading (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            trader_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            end_date TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            total_profit REAL DEFAULT 0.0,
+            copy_ratio REAL DEFAULT 1.0,
+            transaction_hash TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (trader_id) REFERENCES top_traders (id)
+        )
+    '''),
+    ('trading_signals', '''
+        CREATE TABLE IF NOT EXISTS trading_signals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            strategy_id INTEGER NOT NULL,
+            signal_type TEXT NOT NULL,
+            asset_pair TEXT NOT NULL,
+            action TEXT NOT NULL,
+            price REAL NOT NULL,
+            confidence REAL NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_executed BOOLEAN DEFAULT 0,
+            FOREIGN KEY (strategy_id) REFERENCES trading_strategies (id)
+        )
+    '''),
+    ('support_tickets', '''
+        CREATE TABLE IF NOT EXISTS support_tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            status TEXT DEFAULT 'open',
+            priority TEXT DEFAULT 'normal',
+            category TEXT DEFAULT 'general',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            assigned_to TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''),
+    ('support_messages', '''
+        CREATE TABLE IF NOT EXISTS support_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            user_id INTEGER,
+            message TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (ticket_id) REFERENCES support_tickets (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''),
+    ('faq', '''
+        CREATE TABLE IF NOT EXISTS faq (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            category TEXT DEFAULT 'general',
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''),
+    ('security_logs', '''
+        CREATE TABLE IF NOT EXISTS security_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            details TEXT,
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    '''),
+)
+
+# Données de référence, insérées quand la table est vide
+SEEDS = (
+    ('faq', '''
+        INSERT INTO faq (question, answer, category) VALUES
+        ('Comment déposer des fonds ?', 'Rendez-vous dans votre portefeuille et cliquez sur "Déposer". Suivez les instructions pour transférer vos USDT.', 'wallet'),
+        ('Quand puis-je retirer mes gains ?', 'Vos gains quotidiens sont disponibles immédiatement pour retrait. Le capital initial est libéré à la fin du plan.', 'investment'),
+        ('Les investissements sont-ils sécurisés ?', 'Oui, nous utilisons des smart contracts et un système de sécurité multicouche pour protéger vos investissements.', 'security'),
+        ('Comment fonctionne le parrainage ?', 'Partagez votre code de parrainage unique et recevez 5% sur tous les investissements de vos filleuls.', 'referral'),
+        ('Quel est le montant minimum d investissement ?', 'Le montant minimum est de 20 USDT pour tous nos plans d investissement.', 'investment')
+    '''),
+    ('roi_plans', '''
+        INSERT INTO roi_plans (name, description, daily_rate, duration_days, min_amount, max_amount)
+        VALUES
+        ('Rocket Launch', '🚀 Plan meteore ultra-rentable ! 35% quotidien pendant 3 jours.', 0.35, 3, 20, 2000),
+        ('Mega Booster', '💥 Plan mega booster ! 30% quotidien pendant 5 jours.', 0.30, 5, 20, 3000),
+        ('Super Express', '⚡ Plan super express ! 25% quotidien pendant 7 jours.', 0.25, 7, 20, 4000),
+        ('Lightning Pro', '⚡ Plan lightning pro ! 22% quotidien pendant 10 jours.', 0.22, 10, 20, 5000),
+        ('Turbo Flash', '🔥 Plan turbo flash ! 20% quotidien pendant 14 jours.', 0.20, 14, 20, 8000)
+    '''),
+    ('staking_plans', '''
+        INSERT INTO staking_plans (name, description, duration_days, annual_rate, min_amount, max_amount, penalty_rate)
+        VALUES
+        ('Quick Stake', '⚡ Staking rapide 7 jours ! 8% annuel. Parfait pour tester le staking.', 7, 0.08, 20, 300, 0.02),
+        ('Flex Stake', '🔄 Staking flexible 15 jours ! 12% annuel. Idéal pour débutants.', 15, 0.12, 20, 500, 0.03),
+        ('Standard Stake', '📊 Staking standard 30 jours ! 18% annuel. Notre choix populaire.', 30, 0.18, 20, 1000, 0.04),
+        ('Power Stake', '💪 Staking puissant 45 jours ! 22% annuel. Excellent rendement.', 45, 0.22, 20, 2000, 0.05),
+        ('Premium Stake', '💎 Staking premium 60 jours ! 28% annuel. Pour investisseurs sérieux.', 60, 0.28, 20, 3000, 0.06),
+        ('Elite Stake', '🏆 Staking elite 90 jours ! 35% annuel. Performance exceptionnelle.', 90, 0.35, 20, 5000, 0.07),
+        ('Master Stake', '👑 Staking master 120 jours ! 42% annuel. Retour impressionnant.', 120, 0.42, 20, 8000, 0.08),
+        ('Royal Stake', '🎖️ Staking royal 150 jours ! 50% annuel. Rendement royal.', 150, 0.50, 20, 12000, 0.09),
+        ('Supreme Stake', '⭐ Staking suprême 180 jours ! 60% annuel. Le top du staking.', 180, 0.60, 20, 20000, 0.10),
+        ('Ultimate Stake', '🚀 Staking ultimate 365 jours ! 80% annuel. Performance ultime.', 365, 0.80, 20, 50000, 0.12)
+    '''),
+    ('frozen_plans', '''
+        INSERT INTO frozen_plans (name, description, duration_days, total_return_rate, min_amount, max_amount)
+        VALUES
+        ('Ice Starter', '🧊 Plan gelé débutant ! 30 jours gelés pour 150% de retour total.', 30, 1.5, 20, 400),
+        ('Frost Basic', '❄️ Plan frost basique ! 60 jours gelés pour 180% de retour total.', 60, 1.8, 20, 600),
+        ('Freeze Standard', '🥶 Plan freeze standard ! 90 jours gelés pour 220% de retour total.', 90, 2.2, 20, 800),
+        ('Glacial Pro', '🏔️ Plan glacial pro ! 120 jours gelés pour 280% de retour total.', 120, 2.8, 20, 1200),
+        ('Arctic Elite', '🐧 Plan arctique elite ! 150 jours gelés pour 350% de retour total.', 150, 3.5, 20, 2000),
+        ('Polar Premium', '🐻‍❄️ Plan polaire premium ! 180 jours gelés pour 450% de retour total.', 180, 4.5, 20, 3000),
+        ('Blizzard VIP', '❄️ Plan blizzard VIP ! 240 jours gelés pour 600% de retour total.', 240, 6.0, 20, 5000),
+        ('Absolute Zero', '🌨️ Plan zéro absolu ! 300 jours gelés pour 800% de retour total.', 300, 8.0, 20, 8000),
+        ('Eternal Frost', '🧊 Plan gel éternel ! 360 jours gelés pour 1200% de retour total.', 360, 12.0, 20, 15000),
+        ('Cosmic Ice', '🌌 Plan glace cosmique ! 450 jours gelés pour 2000% de retour total.', 450, 20.0, 20, 50000)
+    '''),
+    ('projects', '''
+        INSERT INTO projects (title, description, category, target_amount, expected_return, duration_months, min_investment, max_investment, deadline)
+        VALUES
+        ('Crypto Mining Farm', '⛏️ Ferme de minage crypto moderne ! 15% de retour en 6 mois.', 'Mining', 10000, 0.15, 6, 20, 1000, datetime('now', '+30 days')),
+        ('E-commerce Platform', '🛒 Plateforme e-commerce innovante ! 18% de retour en 8 mois.', 'Tech', 15000, 0.18, 8, 20, 1500, datetime('now', '+45 days')),
+        ('Green Energy Solar', '☀️ Énergie solaire verte ! 20% de retour en 12 mois.', 'Énergie', 25000, 0.20, 12, 20, 2500, datetime('now', '+60 days')),
+        ('FinTech Startup', '💳 Startup fintech prometteuse ! 22% de retour en 10 mois.', 'Finance', 20000, 0.22, 10, 20, 2000, datetime('now', '+40 days')),
+        ('Real Estate Fund', '🏠 Fonds immobilier diversifié ! 25% de retour en 18 mois.', 'Immobilier', 50000, 0.25, 18, 20, 5000, datetime('now', '+75 days')),
+        ('AI Tech Company', '🤖 Entreprise tech IA ! 28% de retour en 14 mois.', 'Intelligence Artificielle', 35000, 0.28, 14, 20, 3500, datetime('now', '+50 days')),
+        ('Renewable Energy', '🌱 Énergies renouvelables ! 30% de retour en 20 mois.', 'Écologie', 40000, 0.30, 20, 20, 4000, datetime('now', '+65 days')),
+        ('Biotech Innovation', '🧬 Innovation biotechnologique ! 35% de retour en 24 mois.', 'Biotechnologie', 60000, 0.35, 24, 20, 6000, datetime('now', '+80 days')),
+        ('Space Technology', '🚀 Technologie spatiale ! 40% de retour en 30 mois.', 'Espace', 80000, 0.40, 30, 20, 8000, datetime('now', '+90 days')),
+        ('Quantum Computing', '⚛️ Informatique quantique ! 50% de retour en 36 mois.', 'Quantique', 100000, 0.50, 36, 20, 10000, datetime('now', '+120 days'))
+    '''),
+    ('trading_strategies', '''
+        INSERT INTO trading_strategies (name, description, risk_level, expected_daily_return, min_amount, max_amount, strategy_type, parameters)
+        VALUES
+        ('IA Conservateur', '🛡️ Stratégie IA sécurisée avec analyse de risque avancée. Idéale pour débuter le trading automatique.', 'Faible', 0.015, 20, 1000, 'ai_conservative', '{"stop_loss": 0.05, "take_profit": 0.03, "max_trades": 3}'),
+        ('IA Équilibré', '⚖️ Stratégie IA équilibrée combinant sécurité et performance. Parfait équilibre risque/rendement.', 'Moyen', 0.025, 20, 2000, 'ai_balanced', '{"stop_loss": 0.08, "take_profit": 0.05, "max_trades": 5}'),
+        ('IA Agressif', '🚀 Stratégie IA haute performance avec algorithmes avancés. Pour investisseurs expérimentés.', 'Élevé', 0.04, 20, 5000, 'ai_aggressive', '{"stop_loss": 0.12, "take_profit": 0.08, "max_trades": 8}'),
+        ('Scalping Bot', '⚡ Bot de scalping ultra-rapide avec IA prédictive. Trades haute fréquence pour profits constants.', 'Moyen', 0.035, 20, 3000, 'scalping_ai', '{"timeframe": "1m", "trades_per_hour": 10, "profit_target": 0.02}'),
+        ('Arbitrage IA', '🔄 Bot d arbitrage intelligent détectant les écarts de prix entre exchanges. Profits garantis.', 'Faible', 0.02, 20, 10000, 'arbitrage_ai', '{"min_spread": 0.01, "max_exposure": 0.3, "exchanges": 5}'),
+        ('Swing Trading Pro', '📈 IA de swing trading analysant les tendances moyennes. Positions 2-7 jours pour profits optimaux.', 'Moyen', 0.03, 20, 4000, 'swing_ai', '{"timeframe": "4h", "trend_strength": 0.7, "position_size": 0.2}'),
+        ('DeFi Yield Bot', '🌾 Bot DeFi intelligent optimisant les rendements sur protocols décentralisés. Farming automatisé.', 'Moyen', 0.045, 20, 8000, 'defi_yield', '{"protocols": ["uniswap", "compound"], "rebalance_frequency": "daily"}'),
+        ('Grid Trading IA', '🔳 Stratégie de trading en grille avec IA adaptative. Profits dans tous les marchés.', 'Faible', 0.018, 20, 6000, 'grid_ai', '{"grid_size": 20, "price_range": 0.1, "adaptive": true}'),
+        ('News Trading Bot', '📰 Bot réagissant aux news crypto en temps réel avec analyse sentiment IA. Profits sur volatilité.', 'Élevé', 0.038, 20, 2500, 'news_ai', '{"sentiment_threshold": 0.8, "reaction_time": "30s", "news_sources": 15}'),
+        ('Multi-Strategy IA', '🎯 Bot combinant plusieurs stratégies IA adaptatives. Performance optimisée automatiquement.', 'Moyen', 0.032, 20, 15000, 'multi_ai', '{"strategies": 5, "allocation_dynamic": true, "rebalance": "weekly"}')
+    '''),
+    ('top_traders', '''
+        INSERT INTO top_traders (name, avatar_url, total_return, win_rate, followers_count, monthly_return, risk_score, trading_style, min_copy_amount, max_copy_amount)
+        VALUES
+        ('CryptoKing_AI', '/static/avatars/trader1.png', 245.5, 78.5, 1250, 25.2, 6.2, 'Swing Trading + IA', 20, 5000),
+        ('QuantMaster_Pro', '/static/avatars/trader2.png', 189.3, 82.1, 980, 18.7, 4.8, 'Algorithmic Trading', 20, 3000),
+        ('ScalpBot_Elite', '/static/avatars/trader3.png', 156.8, 75.3, 1580, 22.4, 7.1, 'Scalping + Arbitrage', 20, 2500),
+        ('TrendHunter_IA', '/static/avatars/trader4.png', 198.7, 80.2, 920, 19.8, 5.5, 'Trend Following IA', 20, 4000),
+        ('DeFi_Wizard', '/static/avatars/trader5.png', 134.2, 88.9, 750, 15.8, 3.2, 'DeFi Yield Farming', 20, 8000),
+        ('Volatility_Pro', '/static/avatars/trader6.png', 178.5, 73.4, 1120, 21.3, 8.5, 'Volatility Trading', 20, 3500),
+        ('AI_GridMaster', '/static/avatars/trader7.png', 145.6, 85.7, 680, 16.9, 4.1, 'Grid + IA Adaptive', 20, 6000),
+        ('NewsBot_Elite', '/static/avatars/trader8.png', 167.3, 76.8, 1340, 20.1, 6.8, 'News-based Trading', 20, 2800),
+        ('Hodl_IA_Pro', '/static/avatars/trader9.png', 123.8, 91.2, 2100, 14.5, 2.9, 'Long-term IA', 20, 10000),
+        ('MultiStrat_Bot', '/static/avatars/trader10.png', 201.4, 79.6, 1450, 23.7, 5.9, 'Multi-Strategy IA', 20, 7500)
+    '''),
+)
+
+# Colonnes NOT NULL absentes des anciens schémas (render_optimized / database_config) :
+# (table, colonne) -> (colonne ancienne requise, expression de remplissage)
+LEGACY_FILLS = {
+    ('user_investments', 'plan_id'): (
+        'plan_name', 'COALESCE((SELECT rp.id FROM roi_plans rp WHERE rp.name = legacy.plan_name), 0)'
+    ),
+    ('trading_strategies', 'expected_daily_return'): ('daily_return', 'COALESCE(legacy.daily_return, 0)'),
+}
+
+def _canonical_columns():
+    """Colonnes du schéma canonique, lues depuis une base en mémoire"""
+    scratch = sqlite3.connect(':memory:')
+    try:
+        columns = {}
+        for table, ddl in SCHEMA:
+            scratch.execute(ddl)
+            columns[table] = scratch.execute(f'PRAGMA table_info({table})').fetchall()
+        return columns
+    finally:
+        scratch.close()
+
+def _existing_columns(conn, table):
+    return {row[1]: row for row in conn.execute(f'PRAGMA table_info({table})').fetchall()}
+
+def _blocking(column):
+    """Colonne NOT NULL sans valeur par défaut (interdit l'INSERT sans elle)"""
+    return column[3] and column[4] is None and not column[5]
+
+def _typed_default(declared_type):
+    declared_type = (declared_type or '').upper()
+    if 'TIMESTAMP' in declared_type:
+        return 'CURRENT_TIMESTAMP'
+    if 'TEXT' in declared_type:
+        return "''"
+    return '0'
+
+def _rebuild_table(conn, table, ddl, canonical, existing):
+    """Recréer une table ancienne au format canonique en conservant ses lignes"""
+    # Nouvelle table puis renommage : renommer l'ancienne réécrirait les clés
+    # étrangères des autres tables vers elle
+    conn.execute(ddl.replace(f'CREATE TABLE IF NOT EXISTS {table} (', f'CREATE TABLE new_{table} ('))
+
+    targets, expressions = [], []
+    for column in canonical:
+        name = column[1]
+        if name in existing:
+            targets.append(name)
+            expressions.append(f'legacy.{name}')
+        elif _blocking(column):
+            required, expression = LEGACY_FILLS.get((table, name), (None, None))
+            if required not in existing:
+                expression = _typed_default(column[2])
+            targets.append(name)
+            expressions.append(expression)
+
+    conn.execute(f'''
+        INSERT INTO new_{table} ({', '.join(targets)})
+        SELECT {', '.join(expressions)} FROM {table} legacy
+    ''')
+    conn.execute(f'DROP TABLE {table}')
+    conn.execute(f'ALTER TABLE new_{table} RENAME TO {table}')
+    # Les index du pack ont disparu avec la table : l'étape du pack d'index les recrée
+    print(f"✅ Table {table} reconstruite au format canonique")
+
+def _add_columns(conn, table, canonical, existing):
+    """Ajouter les colonnes canoniques manquantes (ALTER TABLE ADD COLUMN)"""
+    for column in canonical:
+        _, name, declared_type, notnull, default, _ = column
+        if name in existing:
+            continue
+        if default is not None and default.upper() == 'CURRENT_TIMESTAMP':
+            # Défaut non constant interdit par ADD COLUMN : remplir après coup
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {declared_type}')
+            conn.execute(f'UPDATE {table} SET {name} = CURRENT_TIMESTAMP')
+        else:
+            clause = f' DEFAULT {default}' if default is not None else ''
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {declared_type}{clause}')
+        print(f"✅ Colonne {name} ajoutée à la table {table}")
+
+def _reconcile_table(conn, table, ddl, canonical):
+    """Créer la table, ou aligner une table existante sur le schéma canonique"""
+    existing = _existing_columns(conn, table)
+    if not existing:
+        conn.execute(ddl)
+        return
+
+    names = {column[1] for column in canonical}
+    obsolete_blocking = any(_blocking(column) and name not in names for name, column in existing.items())
+    missing_blocking = any(_blocking(column) and column[1] not in existing for column in canonical)
+    if obsolete_blocking or missing_blocking:
+        _rebuild_table(conn, table, ddl, canonical, existing)
+    else:
+        _add_columns(conn, table, canonical, existing)
+
+def _fold_legacy_support(conn, support_messages_ddl):
+    """Reporter les messages des anciens tickets (support_tickets.message, ticket_responses) dans support_messages"""
+    tickets = _existing_columns(conn, 'support_tickets')
+    has_responses = bool(_existing_columns(conn, 'ticket_responses'))
+    if 'message' not in tickets and not has_responses:
+        return
+
+    conn.execute(support_messages_ddl)
+    if 'message' in tickets:
+        conn.execute('''
+            INSERT INTO support_messages (ticket_id, user_id, message, is_admin, created_at)
+            SELECT id, user_id, message, 0, created_at FROM support_tickets
+            WHERE message IS NOT NULL
+        ''')
+    if has_responses:
+        conn.execute('''
+            INSERT INTO support_messages (ticket_id, user_id, message, is_admin, created_at)
+            SELECT ticket_id, user_id, message, is_admin, created_at FROM ticket_responses
+        ''')
+        conn.execute('DROP TABLE ticket_responses')
+    print("✅ Messages des anciens tickets reportés dans support_messages")
+
+def _initial_schema(conn):
+    """Schéma complet de la plateforme et données de référence"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    ddl_by_table = dict(SCHEMA)
+    _fold_legacy_support(conn, ddl_by_table['support_messages'])
+
+    canonical = _canonical_columns()
+    seeds = dict(SEEDS)
+    for table, ddl in SCHEMA:
+        _reconcile_table(conn, table, ddl, canonical[table])
+        # Données de référence insérées une seule fois (table vide)
+        if table in seeds and conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0:
+            conn.execute(seeds[table])
+
+    # Contraintes UNIQUE perdues par ADD COLUMN sur les anciennes bases
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_users_referral_code ON users (referral_code)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_users_telegram_id ON users (telegram_id)')
+
+    # Ancien nommage des colonnes 2FA
+    users = _existing_columns(conn, 'users')
+    if 'two_factor_secret' in users and 'two_factor_enabled' in users:
+        conn.execute('''
+            UPDATE users
+            SET two_fa_secret = COALESCE(two_fa_secret, two_factor_secret),
+                two_fa_enabled = MAX(COALESCE(two_fa_enabled, 0), COALESCE(two_factor_enabled, 0))
+            WHERE two_factor_secret IS NOT NULL OR two_factor_enabled
+        ''')
+
+def _portfolio_summary(conn):
+    """Résumé matérialisé du portefeuille par utilisateur, initialisé depuis les positions"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_portfolio_summary (
+            user_id INTEGER PRIMARY KEY,
+            total_invested REAL DEFAULT 0.0,
+            total_profits REAL DEFAULT 0.0,
+            active_count INTEGER DEFAULT 0,
+            completed_count INTEGER DEFAULT 0,
+            total_count INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # Copie figée de portfolio_summary.rebuild_portfolio_summaries à la v2
+    conn.execute('DELETE FROM user_portfolio_summary')
+    conn.execute('''
+        INSERT INTO user_portfolio_summary
+            (user_id, total_invested, total_profits, active_count, completed_count, total_count)
+        SELECT user_id,
+               SUM(amount),
+               SUM(profit),
+               SUM(CASE WHEN is_active THEN 1 ELSE 0 END),
+               SUM(CASE WHEN is_active THEN 0 ELSE 1 END),
+               COUNT(*)
+        FROM (
+            SELECT user_id, COALESCE(amount, 0) AS amount, COALESCE(total_earned, 0) AS profit, is_active
+            FROM user_investments
+            UNION ALL
+            SELECT user_id, COALESCE(amount, 0), COALESCE(total_earned, 0), is_active
+            FROM user_staking
+            UNION ALL
+            SELECT user_id, COALESCE(amount, 0), COALESCE(total_profit, 0), is_active
+            FROM user_trading_bots
+            UNION ALL
+            SELECT user_id, COALESCE(amount, 0), COALESCE(total_profit, 0), is_active
+            FROM user_copy_trading
+            UNION ALL
+            SELECT user_id, COALESCE(amount, 0), 0, 1
+            FROM project_investments
+        )
+        GROUP BY user_id
+    ''')
+
+def _positions_view(conn):
+    """Vue unifiée des positions (ROI, staking, bots, copy trading, projets)"""
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS user_positions AS
+        SELECT 'roi' AS kind, ui.id, ui.user_id, rp.name AS label, ui.amount,
+               COALESCE(ui.total_earned, 0) AS profit, ui.daily_profit,
+               ui.is_active, ui.start_date, ui.end_date
+        FROM user_investments ui
+        LEFT JOIN roi_plans rp ON ui.plan_id = rp.id
+        UNION ALL
+        SELECT 'staking', us.id, us.user_id, sp.name, us.amount,
+               COALESCE(us.total_earned, 0), NULL,
+               us.is_active, us.start_date, us.end_date
+        FROM user_staking us
+        LEFT JOIN staking_plans sp ON us.plan_id = sp.id
+        UNION ALL
+        SELECT 'trading', utb.id, utb.user_id, ts.name, utb.amount,
+               COALESCE(utb.total_profit, 0), utb.daily_profit,
+               utb.is_active, utb.start_date, utb.end_date
+        FROM user_trading_bots utb
+        LEFT JOIN trading_strategies ts ON utb.strategy_id = ts.id
+        UNION ALL
+        SELECT 'copy', uct.id, uct.user_id, tt.name, uct.amount,
+               COALESCE(uct.total_profit, 0), NULL,
+               uct.is_active, uct.start_date, uct.end_date
+        FROM user_copy_trading uct
+        LEFT JOIN top_traders tt ON uct.trader_id = tt.id
+        UNION ALL
+        SELECT 'project', pi.id, pi.user_id, p.title, pi.amount,
+               0, NULL,
+               1, pi.investment_date, NULL
+        FROM project_investments pi
+        LEFT JOIN projects p ON pi.project_id = p.id
+    ''')
+
+def _notification_state(conn):
+    """Compteur de non lues par utilisateur, tenu à jour par triggers, initialisé depuis notifications"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_notification_state (
+            user_id INTEGER PRIMARY KEY,
+            unread_count INTEGER NOT NULL DEFAULT 0,
+            last_notification_id INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_state_insert
+        AFTER INSERT ON notifications
+        BEGIN
+            INSERT INTO user_notification_state (user_id, unread_count, last_notification_id)
+            VALUES (NEW.user_id, CASE WHEN COALESCE(NEW.is_read, 0) THEN 0 ELSE 1 END, NEW.id)
+            ON CONFLICT(user_id) DO UPDATE SET
+                unread_count = unread_count + excluded.unread_count,
+                last_notification_id = MAX(last_notification_id, excluded.last_notification_id);
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_state_read
+        AFTER UPDATE OF is_read ON notifications
+        WHEN COALESCE(OLD.is_read, 0) != COALESCE(NEW.is_read, 0)
+        BEGIN
+            UPDATE user_notification_state
+            SET unread_count = MAX(unread_count + CASE WHEN COALESCE(NEW.is_read, 0) THEN -1 ELSE 1 END, 0)
+            WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_notifications_state_delete
+        AFTER DELETE ON notifications
+        WHEN NOT COALESCE(OLD.is_read, 0)
+        BEGIN
+            UPDATE user_notification_state
+            SET unread_count = MAX(unread_count - 1, 0)
+            WHERE user_id = OLD.user_id;
+        END
+    ''')
+
+    # Copie figée de notification_feed.rebuild_notification_state à la v4
+    conn.execute('DELETE FROM user_notification_state')
+    conn.execute('''
+        INSERT INTO user_notification_state (user_id, unread_count, last_notification_id)
+        SELECT user_id,
+               SUM(CASE WHEN COALESCE(is_read, 0) THEN 0 ELSE 1 END),
+               MAX(id)
+        FROM notifications
+        GROUP BY user_id
+    ''')
+
+def _notification_archive(conn):
+    """Archive compacte des notifications lues anciennes"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notification_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            message TEXT NOT NULL,
+            type TEXT NOT NULL,
+            created_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notification_archive_user_created
+        ON notification_archive (user_id, created_at)
+    ''')
+
+def _ledger_partitions(conn):
+    """Registre des partitions mensuelles de transactions"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_partitions (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_count INTEGER DEFAULT 0,
+            min_created_at TIMESTAMP,
+            max_created_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _accrual_registry(conn):
+    """Registre du calcul des profits : un run par date et un crédit par position et par date"""
+    # En-tête de run : un par date d'accrual, avec un curseur de reprise par type de position
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS accrual_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            accrual_date TEXT UNIQUE NOT NULL,
+            status TEXT DEFAULT 'running',
+            bot_cursor INTEGER DEFAULT 0,
+            copy_cursor INTEGER DEFAULT 0,
+            chunks_committed INTEGER DEFAULT 0,
+            positions_count INTEGER DEFAULT 0,
+            total_amount REAL DEFAULT 0.0,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+    # Registre : une position ne peut être créditée qu'une fois par date
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS accrual_ledger (
+            accrual_date TEXT NOT NULL,
+            position_kind TEXT NOT NULL,
+            position_id INTEGER NOT NULL,
+            run_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (accrual_date, position_kind, position_id),
+            FOREIGN KEY (run_id) REFERENCES accrual_runs (id)
+        )
+    ''')
+
+def _index_pack(conn):
+    """Index des requêtes chaudes (contrôlés par db_indexes.check_query_plans)"""
+    for name, target in (
+        ('idx_notifications_user_read_created', 'notifications (user_id, is_read, created_at)'),
+        ('idx_transactions_status_created', 'transactions (status, created_at)'),
+        ('idx_transactions_created', 'transactions (created_at)'),
+        ('idx_support_messages_ticket_created', 'support_messages (ticket_id, created_at)'),
+        ('idx_support_tickets_user_created', 'support_tickets (user_id, created_at)'),
+        ('idx_user_trading_bots_user_active', 'user_trading_bots (user_id, is_active)'),
+        ('idx_user_copy_trading_user_active', 'user_copy_trading (user_id, is_active)'),
+        ('idx_user_trading_bots_user_start', 'user_trading_bots (user_id, start_date)'),
+        ('idx_user_copy_trading_user_start', 'user_copy_trading (user_id, start_date)'),
+        ('idx_user_investments_user', 'user_investments (user_id, start_date)'),
+        ('idx_user_staking_user', 'user_staking (user_id, start_date)'),
+        ('idx_users_referred_by', 'users (referred_by)'),
+        ('idx_project_investments_user', 'project_investments (user_id, investment_date)'),
+        ('idx_project_investments_project', 'project_investments (project_id, investment_date)'),
+        ('idx_projects_status_deadline', 'projects (status, deadline)'),
+        ('idx_security_logs_user_created', 'security_logs (user_id, created_at)'),
+        ('idx_transactions_status_type_created', 'transactions (status, type, created_at)'),
+        ('idx_support_messages_ticket_id', 'support_messages (ticket_id, id)'),
+        ('idx_notifications_user_id', 'notifications (user_id, id)'),
+    ):
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {target}')
+
+def _positions_sort_date(conn):
+    """Vue des positions avec clé de tri non nulle (sort_date) pour la pagination keyset"""
+    # Une position sans start_date échoue toute comparaison de ligne : elle se
+    # trie sous sort_date = '' (dernière page) au lieu de disparaître
+    conn.execute('DROP VIEW IF EXISTS user_positions')
+    conn.execute('''
+        CREATE VIEW user_positions AS
+        SELECT 'roi' AS kind, ui.id, ui.user_id, rp.name AS label, ui.amount,
+               COALESCE(ui.total_earned, 0) AS profit, ui.daily_profit,
+               ui.is_active, ui.start_date, ui.end_date,
+               COALESCE(ui.start_date, '') AS sort_date
+        FROM user_investments ui
+        LEFT JOIN roi_plans rp ON ui.plan_id = rp.id
+        UNION ALL
+        SELECT 'staking', us.id, us.user_id, sp.name, us.amount,
+               COALESCE(us.total_earned, 0), NULL,
+               us.is_active, us.start_date, us.end_date,
+               COALESCE(us.start_date, '')
+        FROM user_staking us
+        LEFT JOIN staking_plans sp ON us.plan_id = sp.id
+        UNION ALL
+        SELECT 'trading', utb.id, utb.user_id, ts.name, utb.amount,
+               COALESCE(utb.total_profit, 0), utb.daily_profit,
+               utb.is_active, utb.start_date, utb.end_date,
+               COALESCE(utb.start_date, '')
+        FROM user_trading_bots utb
+        LEFT JOIN trading_strategies ts ON utb.strategy_id = ts.id
+        UNION ALL
+        SELECT 'copy', uct.id, uct.user_id, tt.name, uct.amount,
+               COALESCE(uct.total_profit, 0), NULL,
+               uct.is_active, uct.start_date, uct.end_date,
+               COALESCE(uct.start_date, '')
+        FROM user_copy_trading uct
+        LEFT JOIN top_traders tt ON uct.trader_id = tt.id
+        UNION ALL
+        SELECT 'project', pi.id, pi.user_id, p.title, pi.amount,
+               0, NULL,
+               1, pi.investment_date, NULL,
+               COALESCE(pi.investment_date, '')
+        FROM project_investments pi
+        LEFT JOIN projects p ON pi.project_id = p.id
+    ''')
+
+# Étapes ordonnées : (version, description, fonction(conn)). Chaque étape porte sa
+# propre copie figée du DDL et du SQL d'initialisation : ne jamais modifier une
+# étape publiée (ni lui faire appeler le code ou lire une constante d'un autre
+# module), en ajouter une nouvelle.
+MIGRATIONS = (
+    (1, 'schéma initial et données de référence', _initial_schema),
+    (2, 'résumé matérialisé des portefeuilles', _portfolio_summary),
+    (3, 'vue unifiée des positions', _positions_view),
+    (4, 'compteur de notifications non lues', _notification_state),
+    (5, 'archive des notifications', _notification_archive),
+    (6, 'partitions mensuelles des transactions', _ledger_partitions),
+    (7, "registre d'accrual des profits", _accrual_registry),
+    (8, "pack d'index des requêtes chaudes", _index_pack),
+    (9, 'clé de tri non nulle des positions', _positions_sort_date),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def current_version(conn):
+    """Version du schéma enregistrée (0 pour une base vierge)"""
+    _ensure_version_table(conn)
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def require_current_schema(conn):
+    """Vérifier que la base est à LATEST_VERSION (les migrations sont appliquées au démarrage)"""
+    version = current_version(conn)
+    if version < LATEST_VERSION:
+        raise RuntimeError(f'Schéma v{version} antérieur à v{LATEST_VERSION} : exécuter run_migrations()')
+    return version
+
+def run_migrations(conn):
+    """
+    Amener la base à LATEST_VERSION.
+
+    Une base à jour ne coûte qu'une lecture de schema_version. Sinon les
+    étapes manquantes sont appliquées dans une transaction BEGIN IMMEDIATE :
+    les workers qui démarrent en même temps attendent le premier, puis
+    relisent la version et n'ont plus rien à faire.
+    """
+    if current_version(conn) >= LATEST_VERSION:
+        return LATEST_VERSION
+
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = current_version(conn)
+            for step_version, description, step in MIGRATIONS:
+                if step_version <= version:
+                    continue
+                step(conn)
+                conn.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                    (step_version, description)
+                )
+                print(f"✅ Migration {step_version} appliquée: {description}")
+                version = step_version
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+    return version
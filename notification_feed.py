@@ -0,0 +1,89 @@
+"""
+Compteur de notifications non lues et flux temps réel
+
+user_notification_state porte, par utilisateur, le nombre de
+notifications non lues et le dernier id de notification. Il est tenu à
+jour par des triggers sur notifications (créés par migrations.py, étape
+4) : les insertions passent par plusieurs chemins (buffer de
+notifications, crédit des profits en SQL, restaurations), qu'aucun code
+applicatif ne couvre à lui seul.
+"""
+
+FEED_PAGE_SIZE = 20
+
+def notification_topic(user_id):
+    """Sujet du broker temps réel des notifications d'un utilisateur"""
+    return f'notifications:{user_id}'
+
+def rebuild_notification_state(conn, user_id=None):
+    """Recalculer compteurs et derniers id depuis notifications (tous, ou un seul utilisateur)"""
+    scope, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    conn.execute(f'DELETE FROM user_notification_state {scope}', params)
+    conn.execute(f'''
+        INSERT INTO user_notification_state (user_id, unread_count, last_notification_id)
+        SELECT user_id,
+               SUM(CASE WHEN COALESCE(is_read, 0) THEN 0 ELSE 1 END),
+               MAX(id)
+        FROM notifications
+        {scope}
+        GROUP BY user_id
+    ''', params)
+
+def get_notification_state(conn, user_id):
+    """(nombre de non lues, dernier id de notification) d'un utilisateur (lecture par clé primaire)"""
+    row = conn.execute('''
+        SELECT unread_count, last_notification_id
+        FROM user_notification_state
+        WHERE user_id = ?
+    ''', (user_id,)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+def notification_versions(conn, user_ids):
+    """(non lues, dernier id) de chaque utilisateur (sonde de TopicWatcher, clé primaire)"""
+    placeholders = ', '.join('?' * len(user_ids))
+    rows = conn.execute(f'''
+        SELECT user_id, unread_count, last_notification_id
+        FROM user_notification_state
+        WHERE user_id IN ({placeholders})
+    ''', list(user_ids)).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+def fetch_notifications_since(conn, user_id, since_id=0, limit=FEED_PAGE_SIZE):
+    """Notifications de l'utilisateur postérieures à since_id, dans l'ordre d'arrivée"""
+    rows = conn.execute('''
+        SELECT id, title, message, type, is_read, created_at
+        FROM notifications
+        WHERE user_id = ? AND id > ?
+        ORDER BY id ASC
+        LIMIT ?
+    ''', (user_id, since_id, limit)).fetchall()
+    return [
+        {
+            'id': row[0],
+            'title': row[1],
+            'message': row[2],
+            'type': row[3],
+            'is_read': bool(row[4]),
+            'created_at': row[5] or ''
+        }
+        for row in rows
+    ]
+
+def mark_notifications_read(conn, user_id, notification_ids=None):
+    """Marquer comme lues les notifications données (toutes si None) ; retourne le nombre modifié"""
+    if notification_ids is None:
+        cursor = conn.execute('''
+            UPDATE notifications SET is_read = 1
+            WHERE user_id = ? AND is_read = 0
+        ''', (user_id,))
+        return cursor.rowcount
+
+    notification_ids = list(notification_ids)
+    if not notification_ids:
+        return 0
+    placeholders = ', '.join('?' * len(notification_ids))
+    cursor = conn.execute(f'''
+        UPDATE notifications SET is_read = 1
+        WHERE user_id = ? AND is_read = 0 AND id IN ({placeholders})
+    ''', [user_id] + notification_ids)
+    return cursor.rowcount
@@ -0,0 +1,81 @@
+"""
+Pipeline de notifications bufferisé
+
+Les handlers déposent leurs notifications dans un buffer mémoire ; un
+thread de vidage les écrit par lots (executemany) via le writer unique,
+ce qui retire l'écriture de notification du chemin de la requête.
+"""
+
+import os
+import threading
+from concurrent.futures import Future
+
+INSERT_NOTIFICATION = '''
+    INSERT INTO notifications (user_id, title, message, type)
+    VALUES (?, ?, ?, ?)
+'''
+
+def _report_failure(future):
+    if future.exception() is not None:
+        print(f"❌ Erreur ajout notifications: {future.exception()}")
+
+class NotificationBuffer:
+    """Buffer de notifications vidé périodiquement par lots"""
+
+    def __init__(self, writer, flush_interval=0.05, max_buffer=1000, on_written=None):
+        self.writer = writer
+        # Appelé avec les user_id d'un lot une fois celui-ci validé
+        self.on_written = on_written
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Un thread de vidage par processus (les threads ne survivent pas au fork)
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pending = []
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='notification-flusher', daemon=True)
+                self._thread.start()
+
+    def add(self, user_id, title, message, type='info'):
+        """Mettre une notification en attente d'écriture"""
+        self._ensure_started()
+        with self._lock:
+            self._pending.append((user_id, title, message, type))
+            full = len(self._pending) >= self.max_buffer
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Écrire immédiatement les notifications en attente ; retourne le Future du lot"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            future = Future()
+            future.set_result(0)
+            return future
+        future = self.writer.executemany(INSERT_NOTIFICATION, rows)
+        future.add_done_callback(_report_failure)
+        if self.on_written is not None:
+            user_ids = {row[0] for row in rows}
+            future.add_done_callback(lambda done: done.exception() is None and self.on_written(user_ids))
+        return future
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Erreur vidage notifications: {e}")
@@ -0,0 +1,136 @@
+"""
+Rétention des notifications : résumés quotidiens et archivage
+
+Le run de profits ajoute une notification par position et par jour, et
+rien ne supprimait les anciennes. La tâche de rétention, par lots
+d'utilisateurs (une transaction courte par lot) :
+
+- regroupe les notifications de profit des jours écoulés en une ligne de
+  résumé par utilisateur et par jour, fenêtre de dates par fenêtre de dates
+  (regroupement et sommes calculés par SQLite) ;
+- déplace les notifications lues plus anciennes que la durée de
+  rétention vers notification_archive.
+
+Les triggers de user_notification_state gardent le compteur de non lues
+exact : un résumé reste non lu si l'une des notifications regroupées
+l'était.
+"""
+
+import os
+
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 30))
+# Jours complets laissés intacts avant le regroupement des profits (0 : dès le lendemain)
+NOTIFICATION_DIGEST_AFTER_DAYS = int(os.environ.get('NOTIFICATION_DIGEST_AFTER_DAYS', 1))
+RETENTION_BATCH_USERS = 200
+# Jours regroupés par transaction pour un lot d'utilisateurs
+RETENTION_WINDOW_DAYS = 7
+
+# Titres posés par profit_calculator._apply_credits
+PROFIT_NOTIFICATION_TITLES = ('Profit bot de trading', 'Profit copy trading')
+DIGEST_TITLE = 'Résumé des profits'
+
+# Le montant suit ce texte dans le message (« ... a généré 12.34 USDT de profit! »)
+AMOUNT_MARKER = ' a généré '
+
+def _user_batches(conn, batch_size):
+    """Lots d'user_id ayant des notifications (parcours par clé, sans OFFSET)"""
+    last_user_id = -1
+    while True:
+        user_ids = [row[0] for row in conn.execute('''
+            SELECT user_id FROM user_notification_state
+            WHERE user_id > ?
+            ORDER BY user_id
+            LIMIT ?
+        ''', (last_user_id, batch_size)).fetchall()]
+        if not user_ids:
+            return
+        yield user_ids
+        last_user_id = user_ids[-1]
+
+def _digest_windows(conn, user_ids, cutoff_day, window_days):
+    """Fenêtres [début, fin) de window_days jours, de la plus ancienne notification de profit à cutoff_day"""
+    placeholders = ', '.join('?' * len(user_ids))
+    titles = ', '.join('?' * len(PROFIT_NOTIFICATION_TITLES))
+    start = conn.execute(f'''
+        SELECT date(MIN(created_at)) FROM notifications
+        WHERE user_id IN ({placeholders}) AND title IN ({titles}) AND created_at < ?
+    ''', list(user_ids) + list(PROFIT_NOTIFICATION_TITLES) + [cutoff_day]).fetchone()[0]
+    while start is not None and start < cutoff_day:
+        end = min(conn.execute('SELECT date(?, ?)', (start, f'+{window_days} days')).fetchone()[0], cutoff_day)
+        yield start, end
+        start = end
+
+def _digest_window(conn, user_ids, start, end):
+    """Regrouper les notifications de profit du [start, end) ; retourne (résumés, regroupées)"""
+    placeholders = ', '.join('?' * len(user_ids))
+    titles = ', '.join('?' * len(PROFIT_NOTIFICATION_TITLES))
+    groups = conn.execute(f'''
+        SELECT user_id, date(created_at) AS day, COUNT(*),
+               SUM(CAST(substr(message, instr(message, ?) + ?) AS REAL)),
+               MIN(COALESCE(is_read, 0))
+        FROM notifications
+        WHERE user_id IN ({placeholders})
+          AND title IN ({titles})
+          AND created_at >= ? AND created_at < ?
+        GROUP BY user_id, day
+        HAVING COUNT(*) > 1
+    ''', [AMOUNT_MARKER, len(AMOUNT_MARKER)] + list(user_ids) + list(PROFIT_NOTIFICATION_TITLES)
+        + [start, end]).fetchall()
+    if not groups:
+        return 0, 0
+
+    # Un résumé reste non lu si l'une des notifications regroupées l'était
+    conn.executemany('''
+        INSERT INTO notifications (user_id, title, message, type, is_read, created_at)
+        VALUES (?, ?, ?, 'success', ?, ?)
+    ''', [
+        (user_id, DIGEST_TITLE,
+         f'{day} : {count} crédits de profit (bots et copy trading), total {total or 0:.2f} USDT',
+         all_read, f'{day} 23:59:59')
+        for user_id, day, count, total, all_read in groups
+    ])
+    conn.executemany(f'''
+        DELETE FROM notifications
+        WHERE user_id = ? AND title IN ({titles})
+          AND created_at >= ? AND created_at < date(?, '+1 day')
+    ''', [(user_id, *PROFIT_NOTIFICATION_TITLES, day, day) for user_id, day, _, _, _ in groups])
+    return len(groups), sum(group[2] for group in groups)
+
+def _archive_batch(conn, user_ids, cutoff):
+    """Déplacer les notifications lues antérieures à cutoff ; retourne le nombre archivé"""
+    placeholders = ', '.join('?' * len(user_ids))
+    params = list(user_ids) + [cutoff]
+    scope = f'user_id IN ({placeholders}) AND is_read = 1 AND created_at < ?'
+    conn.execute(f'''
+        INSERT OR IGNORE INTO notification_archive (id, user_id, title, message, type, created_at)
+        SELECT id, user_id, title, message, type, created_at
+        FROM notifications
+        WHERE {scope}
+    ''', params)
+    return conn.execute(f'DELETE FROM notifications WHERE {scope}', params).rowcount
+
+def run_notification_retention(conn, retention_days=NOTIFICATION_RETENTION_DAYS,
+                               digest_after_days=NOTIFICATION_DIGEST_AFTER_DAYS,
+                               batch_size=RETENTION_BATCH_USERS, window_days=RETENTION_WINDOW_DAYS):
+    """Résumés des profits puis archivage, un commit par fenêtre de dates et par lot ; retourne les totaux"""
+    # Bornes calculées par SQLite : même horloge (UTC) et même format que created_at
+    cutoff_day, archive_cutoff = conn.execute(
+        "SELECT date('now', ?), datetime('now', ?)",
+        (f'-{digest_after_days} days', f'-{retention_days} days')
+    ).fetchone()
+
+    stats = {'digests': 0, 'collapsed': 0, 'archived': 0, 'batches': 0}
+    for user_ids in _user_batches(conn, batch_size):
+        try:
+            for start, end in _digest_windows(conn, user_ids, cutoff_day, window_days):
+                digests, collapsed = _digest_window(conn, user_ids, start, end)
+                conn.commit()
+                stats['digests'] += digests
+                stats['collapsed'] += collapsed
+            stats['archived'] += _archive_batch(conn, user_ids, archive_cutoff)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        stats['batches'] += 1
+    return stats
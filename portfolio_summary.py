@@ -0,0 +1,101 @@
+"""
+Résumé matérialisé du portefeuille par utilisateur
+
+user_portfolio_summary porte les totaux affichés en tête de
+/investment-history et du dashboard. Il est mis à jour par deltas dans la
+transaction de chaque ouverture, arrêt ou crédit de position, et peut être
+reconstruit depuis les tables de positions.
+"""
+
+# Positions prises en compte : (user_id, montant investi, gains, actif)
+POSITIONS_UNION = '''
+    SELECT user_id, COALESCE(amount, 0) AS amount, COALESCE(total_earned, 0) AS profit, is_active
+    FROM user_investments
+    UNION ALL
+    SELECT user_id, COALESCE(amount, 0), COALESCE(total_earned, 0), is_active
+    FROM user_staking
+    UNION ALL
+    SELECT user_id, COALESCE(amount, 0), COALESCE(total_profit, 0), is_active
+    FROM user_trading_bots
+    UNION ALL
+    SELECT user_id, COALESCE(amount, 0), COALESCE(total_profit, 0), is_active
+    FROM user_copy_trading
+    UNION ALL
+    -- Les projets sont considérés comme actifs, sans gains pour l'instant
+    SELECT user_id, COALESCE(amount, 0), 0, 1
+    FROM project_investments
+'''
+
+EMPTY_SUMMARY = {
+    'total_invested': 0.0,
+    'total_profits': 0.0,
+    'active_count': 0,
+    'completed_count': 0,
+    'total_count': 0,
+}
+
+def apply_portfolio_delta(conn, user_id, invested=0.0, profits=0.0, active=0, completed=0, opened=0):
+    """Ajouter un delta au résumé d'un utilisateur (dans la transaction de l'appelant)"""
+    conn.execute('''
+        INSERT INTO user_portfolio_summary
+            (user_id, total_invested, total_profits, active_count, completed_count, total_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_invested = total_invested + excluded.total_invested,
+            total_profits = total_profits + excluded.total_profits,
+            active_count = active_count + excluded.active_count,
+            completed_count = completed_count + excluded.completed_count,
+            total_count = total_count + excluded.total_count,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (user_id, invested, profits, active, completed, opened))
+
+def record_position_opened(conn, user_id, amount, profits=0.0):
+    """Nouvelle position active"""
+    apply_portfolio_delta(conn, user_id, invested=amount, profits=profits, active=1, opened=1)
+
+def record_position_closed(conn, user_id):
+    """Position passée d'active à terminée"""
+    apply_portfolio_delta(conn, user_id, active=-1, completed=1)
+
+def record_accrual_profits(conn):
+    """Reporter les crédits de temp.accrual_credits dans les résumés (une ligne par utilisateur)"""
+    # WHERE 1 : lève l'ambiguïté entre ON CONFLICT et une clause de jointure
+    conn.execute('''
+        INSERT INTO user_portfolio_summary (user_id, total_profits)
+        SELECT user_id, SUM(amount)
+        FROM temp.accrual_credits
+        WHERE 1
+        GROUP BY user_id
+        ON CONFLICT(user_id) DO UPDATE SET
+            total_profits = total_profits + excluded.total_profits,
+            updated_at = CURRENT_TIMESTAMP
+    ''')
+
+def rebuild_portfolio_summaries(conn, user_id=None):
+    """Recalculer les résumés depuis les tables de positions (tous, ou un seul utilisateur)"""
+    scope, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    conn.execute(f'DELETE FROM user_portfolio_summary {scope}', params)
+    conn.execute(f'''
+        INSERT INTO user_portfolio_summary
+            (user_id, total_invested, total_profits, active_count, completed_count, total_count)
+        SELECT user_id,
+               SUM(amount),
+               SUM(profit),
+               SUM(CASE WHEN is_active THEN 1 ELSE 0 END),
+               SUM(CASE WHEN is_active THEN 0 ELSE 1 END),
+               COUNT(*)
+        FROM ({POSITIONS_UNION})
+        {scope}
+        GROUP BY user_id
+    ''', params)
+
+def get_portfolio_summary(conn, user_id):
+    """Totaux du portefeuille d'un utilisateur (lecture par clé primaire)"""
+    row = conn.execute('''
+        SELECT total_invested, total_profits, active_count, completed_count, total_count
+        FROM user_portfolio_summary
+        WHERE user_id = ?
+    ''', (user_id,)).fetchone()
+    if row is None:
+        return dict(EMPTY_SUMMARY)
+    return dict(zip(EMPTY_SUMMARY, row))
@@ -0,0 +1,79 @@
+"""
+Historique des positions paginé par curseur (keyset)
+
+Les pages sont lues dans la vue user_positions, triées par
+(sort_date, kind, id) décroissants : sort_date vaut start_date, ou '' pour
+une position sans date (servie en dernier), et kind départage les id
+identiques des différentes tables. Le curseur encode la clé de la dernière ligne
+servie ; chaque page coûte donc le même prix quelle que soit sa profondeur.
+"""
+
+from sqlite_utils import encode_cursor, decode_cursor
+
+POSITION_KINDS = ('roi', 'staking', 'trading', 'copy', 'project')
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+POSITION_COLUMNS = (
+    'kind', 'id', 'label', 'amount', 'profit', 'daily_profit', 'is_active', 'start_date', 'end_date'
+)
+def _cursor_text(value):
+    """Valeur texte d'un curseur ; None (ou un nombre) le rend invalide"""
+    if not isinstance(value, str):
+        raise TypeError(f'Valeur de curseur invalide: {value!r}')
+    return value
+
+# Clé de tri encodée dans le curseur, et conversion de chaque valeur au décodage
+CURSOR_COLUMNS = ('sort_date', 'kind', 'id')
+CURSOR_TYPES = (_cursor_text, _cursor_text, int)
+
+def fetch_positions_page(conn, user_id, kind=None, status=None, date_from=None, date_to=None,
+                         cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Page de positions d'un utilisateur.
+
+    Filtres côté serveur : kind (POSITION_KINDS), status ('active' ou
+    'completed'), date_from / date_to (AAAA-MM-JJ, bornes incluses).
+    Retourne (positions, curseur de la page suivante ou None).
+    """
+    clauses = ['user_id = ?']
+    params = [user_id]
+
+    if kind in POSITION_KINDS:
+        clauses.append('kind = ?')
+        params.append(kind)
+    if status == 'active':
+        clauses.append('is_active = 1')
+    elif status == 'completed':
+        clauses.append('is_active = 0')
+    if date_from:
+        clauses.append('start_date >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append("start_date < date(?, '+1 day')")
+        params.append(date_to)
+
+    key = decode_cursor(cursor, CURSOR_TYPES) if cursor else None
+    if key:
+        clauses.append('(sort_date, kind, id) < (?, ?, ?)')
+        params.extend(key)
+
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    # Une ligne de plus que la page pour savoir s'il en reste
+    cursor_rows = conn.execute(f'''
+        SELECT {', '.join(POSITION_COLUMNS)}, sort_date
+        FROM user_positions
+        WHERE {' AND '.join(clauses)}
+        ORDER BY sort_date DESC, kind DESC, id DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+    rows = [dict(zip(POSITION_COLUMNS + ('sort_date',), row)) for row in cursor_rows.fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], CURSOR_COLUMNS)
+    for row in rows:
+        del row['sort_date']
+        row['is_active'] = bool(row['is_active'])
+    return rows, next_cursor
@@ -0,0 +1,180 @@
+"""
+Profilage à la demande d'un worker en production
+
+Deux modes, sans aucun coût tant qu'ils ne sont pas actifs :
+
+- échantillonnage : pendant N secondes, un thread relève la pile de tous
+  les threads du processus (sys._current_frames) toutes les interval_ms ;
+- cProfile : les N prochaines requêtes traitées par ce worker sont
+  profilées une à une, puis leurs statistiques sont additionnées.
+
+Les deux produisent un fichier « collapsed stacks » (une pile par ligne,
+cadres séparés par ';', suivie du nombre d'échantillons ou de
+microsecondes), lisible par flamegraph.pl, speedscope ou inferno.
+Pour cProfile, les piles sont reconstruites depuis le graphe appelant →
+appelé : le temps d'une fonction est réparti entre ses appelants au
+prorata de leurs appels, ce qui reste une approximation.
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+SAMPLE_INTERVAL_MS = 5
+MAX_PROFILE_SECONDS = 60
+MAX_PROFILE_REQUESTS = 200
+MAX_STACK_DEPTH = 200
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def _short_path(filename):
+    if filename.startswith(_ROOT + os.sep):
+        return os.path.relpath(filename, _ROOT)
+    return os.path.join(*filename.split(os.sep)[-2:]) if os.sep in filename else filename
+
+def _label(filename, line, name):
+    # ';' sépare les cadres : jamais dans un cadre
+    return f'{name} ({_short_path(filename)}:{line})'.replace(';', ':')
+
+def _frame_stack(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return ';'.join(stack)
+
+def collapse(counts):
+    """Texte collapsed stacks, piles les plus fréquentes d'abord"""
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common() if count > 0)
+
+_sampling = threading.Lock()
+
+def sample_stacks(seconds, interval_ms=SAMPLE_INTERVAL_MS, ignore_threads=()):
+    """
+    Échantillonner les piles du processus pendant seconds ; retourne un Counter {pile: échantillons}.
+
+    Les threads de ignore_threads (ids) et le thread d'échantillonnage sont exclus.
+    Lève RuntimeError si un échantillonnage est déjà en cours.
+    """
+    if not _sampling.acquire(blocking=False):
+        raise RuntimeError('Échantillonnage déjà en cours')
+    try:
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        interval = max(interval_ms, 1) / 1000.0
+        ignored = set(ignore_threads) | {threading.get_ident()}
+        counts = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in ignored:
+                    counts[_frame_stack(frame)] += 1
+            time.sleep(interval)
+        return counts
+    finally:
+        _sampling.release()
+
+def stats_to_collapsed(stats):
+    """Piles reconstruites depuis pstats.Stats ; valeurs en microsecondes de temps propre"""
+    entries = stats.stats
+    callees = {}
+    for func, entry in entries.items():
+        callers = entry[4]
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    counts = Counter()
+
+    def walk(func, funcs, path, share):
+        tt = entries[func][2]
+        funcs = funcs + (func,)
+        path = path + (_label(*func),)
+        own = int(tt * share * 1_000_000)
+        if own:
+            counts[';'.join(path)] += own
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_ct in callees.get(func, ()):
+            # Récursion (directe ou non) : le temps est déjà compté sur le premier passage
+            if callee in funcs or callee not in entries or entries[callee][3] <= 0:
+                continue
+            # Part du temps de l'appelé passée sous ce chemin
+            callee_share = min(share * edge_ct / entries[callee][3], 1.0)
+            if callee_share * entries[callee][3] * 1_000_000 >= 1:
+                walk(callee, funcs, path, callee_share)
+
+    for func, entry in entries.items():
+        if not entry[4]:
+            walk(func, (), (), 1.0)
+    return counts
+
+class RequestProfiler:
+    """cProfile sur les N prochaines requêtes de ce worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Lu sans verrou par chaque requête : le seul coût quand rien n'est armé
+        self.armed = False
+        self._remaining = 0
+        self._requested = 0
+        self._profiled = 0
+        self._stats = None
+        self._started_at = None
+
+    def arm(self, requests):
+        requests = min(max(int(requests), 1), MAX_PROFILE_REQUESTS)
+        with self._lock:
+            self._remaining = self._requested = requests
+            self._profiled = 0
+            self._stats = None
+            self._started_at = time.time()
+            self.armed = True
+        return requests
+
+    def start(self):
+        """Profil de la requête courante, ou None si le quota est atteint"""
+        with self._lock:
+            if self._remaining <= 0:
+                self.armed = False
+                return None
+            self._remaining -= 1
+            if self._remaining == 0:
+                self.armed = False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Un autre profileur est actif (Python 3.12+ : un seul à la fois)
+            with self._lock:
+                self._remaining += 1
+                self.armed = True
+            return None
+        return profile
+
+    def finish(self, profile):
+        profile.disable()
+        with self._lock:
+            self._profiled += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def status(self):
+        with self._lock:
+            return {
+                'armed': self.armed,
+                'requested': self._requested,
+                'profiled': self._profiled,
+                'started_at': self._started_at,
+            }
+
+    def collapsed(self):
+        # Sous le verrou : une requête profilée peut encore ajouter ses statistiques
+        with self._lock:
+            return collapse(stats_to_collapsed(self._stats)) if self._stats is not None else ''
@@ -1,147 +1,375 @@
 """
-Calculateur de profits corrigé pour éviter les erreurs sqlite3.Row
+Moteur de calcul des profits quotidiens (requêtes ensemblistes)
 """
 
+import os
 import sqlite3
-from datetime import datetime
-from sqlite_utils import safe_row_get, row_to_dict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
 
-def calculate_daily_profits_safe():
+import accrual_kernel
+from migrations import require_current_schema
+from portfolio_summary import record_accrual_profits
+
+# Nombre de positions traitées par transaction d'écriture
+DEFAULT_CHUNK_SIZE = 5000
+
+# Crédits du jour : une ligne par position active
+ACCRUAL_CREDITS_TABLE = '''
+    CREATE TEMP TABLE IF NOT EXISTS accrual_credits (
+        kind TEXT NOT NULL,
+        position_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        label TEXT
+    )
+'''
+
+# Résumé du lot en cours
+CHUNK_STATS = '''
+    SELECT COUNT(*) AS positions,
+           COALESCE(SUM(kind = 'bot'), 0) AS bots,
+           COALESCE(SUM(kind = 'copy'), 0) AS copies,
+           COALESCE(SUM(amount), 0) AS total_amount
+    FROM temp.accrual_credits
+'''
+
+# Positions actives pas encore créditées à la date donnée ; {scope} restreint le
+# lot (curseur séquentiel ou tranche d'utilisateurs)
+BOT_CREDITS_SELECT = '''
+    SELECT 'bot', utb.id, utb.user_id, utb.daily_profit, ts.name
+    FROM user_trading_bots utb
+    JOIN users u ON utb.user_id = u.id
+    JOIN trading_strategies ts ON utb.strategy_id = ts.id
+    WHERE utb.is_active = 1 AND utb.daily_profit > 0
+      AND NOT EXISTS (
+          SELECT 1 FROM accrual_ledger al
+          WHERE al.accrual_date = ? AND al.position_kind = 'bot' AND al.position_id = utb.id
+      )
+      AND {scope}
+    ORDER BY utb.id
+'''
+
+# Copy trades : rendement mensuel du trader ramené au jour (approximation /30)
+COPY_CREDITS_SELECT = '''
+    SELECT 'copy', uct.id, uct.user_id,
+           uct.amount * (tt.monthly_return / 100.0 / 30) * COALESCE(uct.copy_ratio, 1.0),
+           tt.name
+    FROM user_copy_trading uct
+    JOIN users u ON uct.user_id = u.id
+    JOIN top_traders tt ON uct.trader_id = tt.id
+    WHERE uct.is_active = 1
+      AND uct.amount * (tt.monthly_return / 100.0 / 30) * COALESCE(uct.copy_ratio, 1.0) > 0
+      AND NOT EXISTS (
+          SELECT 1 FROM accrual_ledger al
+          WHERE al.accrual_date = ? AND al.position_kind = 'copy' AND al.position_id = uct.id
+      )
+      AND {scope}
+    ORDER BY uct.id
+'''
+
+def _collect_credits(conn, accrual_date, bot_cursor, copy_cursor, limit):
+    """Calculer les crédits du prochain lot de positions non encore créditées à cette date"""
+    # Bots de trading : profit quotidien fixé à l'activation
+    cursor = conn.execute(
+        'INSERT INTO temp.accrual_credits (kind, position_id, user_id, amount, label) '
+        + BOT_CREDITS_SELECT.format(scope='utb.id > ?') + ' LIMIT ?',
+        (accrual_date, bot_cursor, limit)
+    )
+    remaining = limit - cursor.rowcount
+    if remaining <= 0:
+        return
+
+    conn.execute(
+        'INSERT INTO temp.accrual_credits (kind, position_id, user_id, amount, label) '
+        + COPY_CREDITS_SELECT.format(scope='uct.id > ?') + ' LIMIT ?',
+        (accrual_date, copy_cursor, remaining)
+    )
+
+def _apply_credits(conn):
+    """Appliquer les crédits de temp.accrual_credits (soldes, positions, transactions, notifications)"""
+    # Un seul UPDATE par utilisateur, quel que soit son nombre de positions
+    conn.execute('''
+        UPDATE users
+        SET balance = balance + c.total
+        FROM (
+            SELECT user_id, SUM(amount) AS total
+            FROM temp.accrual_credits
+            GROUP BY user_id
+        ) AS c
+        WHERE users.id = c.user_id
+    ''')
+
+    conn.execute('''
+        UPDATE user_trading_bots
+        SET total_profit = COALESCE(user_trading_bots.total_profit, 0) + c.amount,
+            last_profit_date = CURRENT_TIMESTAMP
+        FROM temp.accrual_credits AS c
+        WHERE c.kind = 'bot' AND user_trading_bots.id = c.position_id
+    ''')
+
+    conn.execute('''
+        UPDATE user_copy_trading
+        SET total_profit = COALESCE(user_copy_trading.total_profit, 0) + c.amount
+        FROM temp.accrual_credits AS c
+        WHERE c.kind = 'copy' AND user_copy_trading.id = c.position_id
+    ''')
+
+    record_accrual_profits(conn)
+
+    # Même format de hash que generate_transaction_hash() (64 caractères hexadécimaux)
+    conn.execute('''
+        INSERT INTO transactions (user_id, type, amount, status, transaction_hash)
+        SELECT user_id,
+               CASE kind WHEN 'bot' THEN 'bot_profit' ELSE 'copy_profit' END,
+               amount, 'completed', lower(hex(randomblob(32)))
+        FROM temp.accrual_credits
+        ORDER BY kind, position_id
+    ''')
+
+    conn.execute('''
+        INSERT INTO notifications (user_id, title, message, type)
+        SELECT user_id,
+               CASE kind WHEN 'bot' THEN 'Profit bot de trading' ELSE 'Profit copy trading' END,
+               CASE kind
+                   WHEN 'bot' THEN 'Votre bot ' || label || ' a généré ' || printf('%.2f', amount) || ' USDT de profit!'
+                   ELSE 'Votre copy de ' || label || ' a généré ' || printf('%.2f', amount) || ' USDT de profit!'
+               END,
+               'success'
+        FROM temp.accrual_credits
+        ORDER BY kind, position_id
+    ''')
+
+def _record_chunk(conn, accrual_date, run_id, advance_cursors=True):
+    """Inscrire le lot au registre et mettre à jour le run (même transaction que les crédits)"""
+    conn.execute('''
+        INSERT INTO accrual_ledger (accrual_date, position_kind, position_id, run_id, user_id, amount)
+        SELECT ?, kind, position_id, ?, user_id, amount
+        FROM temp.accrual_credits
+    ''', (accrual_date, run_id))
+
+    # Les curseurs ne sont valables que pour un parcours dans l'ordre des id
+    if advance_cursors:
+        conn.execute('''
+            UPDATE accrual_runs
+            SET bot_cursor = MAX(bot_cursor, COALESCE((SELECT MAX(position_id) FROM temp.accrual_credits WHERE kind = 'bot'), 0)),
+                copy_cursor = MAX(copy_cursor, COALESCE((SELECT MAX(position_id) FROM temp.accrual_credits WHERE kind = 'copy'), 0))
+            WHERE id = ?
+        ''', (run_id,))
+
+    conn.execute('''
+        UPDATE accrual_runs
+        SET chunks_committed = chunks_committed + 1,
+            positions_count = positions_count + (SELECT COUNT(*) FROM temp.accrual_credits),
+            total_amount = total_amount + (SELECT COALESCE(SUM(amount), 0) FROM temp.accrual_credits),
+            status = 'running',
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (run_id,))
+
+def _start_run(conn, accrual_date):
+    """Créer (ou reprendre) l'en-tête de run de la date"""
+    conn.execute('''
+        INSERT INTO accrual_runs (accrual_date)
+        SELECT ? WHERE NOT EXISTS (SELECT 1 FROM accrual_runs WHERE accrual_date = ?)
+    ''', (accrual_date, accrual_date))
+    conn.commit()
+    return conn.execute('SELECT id FROM accrual_runs WHERE accrual_date = ?', (accrual_date,)).fetchone()[0]
+
+def accrue_daily_profits(conn, accrual_date=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Créditer les profits du jour des positions actives pas encore créditées.
+
+    Le calcul est fait en SQL ensembliste, par lots de chunk_size positions :
+    chaque lot est une transaction courte (BEGIN IMMEDIATE) qui applique les
+    crédits et les inscrit au registre accrual_ledger. Un run interrompu
+    reprend après son dernier lot validé, et un nouveau déclenchement pour une
+    date déjà traitée ne crédite rien deux fois.
+    """
+    accrual_date = accrual_date or date.today().isoformat()
+    require_current_schema(conn)
+    run_id = _start_run(conn, accrual_date)
+    conn.execute(ACCRUAL_CREDITS_TABLE)
+
+    totals = {'positions': 0, 'bots': 0, 'copies': 0, 'total_amount': 0.0, 'chunks': 0}
+    while True:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM temp.accrual_credits')
+            # Curseur relu sous verrou : un run concurrent a pu avancer entre deux lots
+            bot_cursor, copy_cursor = conn.execute(
+                'SELECT bot_cursor, copy_cursor FROM accrual_runs WHERE id = ?', (run_id,)
+            ).fetchone()
+            _collect_credits(conn, accrual_date, bot_cursor, copy_cursor, chunk_size)
+
+            stats = conn.execute(CHUNK_STATS).fetchone()
+            if stats[0] == 0:
+                conn.execute('''
+                    UPDATE accrual_runs
+                    SET status = 'completed', finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (run_id,))
+                conn.commit()
+                break
+
+            _apply_credits(conn)
+            _record_chunk(conn, accrual_date, run_id)
+            conn.execute('DELETE FROM temp.accrual_credits')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        _tally(totals, stats)
+
+    return _finish(totals, accrual_date, run_id)
+
+def _tally(totals, stats):
+    """Ajouter le résumé d'un lot validé aux totaux du run"""
+    totals['positions'] += stats[0]
+    totals['bots'] += stats[1]
+    totals['copies'] += stats[2]
+    totals['total_amount'] += stats[3]
+    totals['chunks'] += 1
+    print(f"🔄 Lot {totals['chunks']} validé: {stats[1]} bots, {stats[2]} copy trades")
+
+def _finish(totals, accrual_date, run_id):
+    totals['run_id'] = run_id
+    if totals['positions']:
+        print(f"✅ Calcul des profits du {accrual_date} terminé: {totals['total_amount']:.2f} USDT crédités sur {totals['positions']} positions")
+    else:
+        print(f"✅ Profits du {accrual_date} déjà crédités, rien à faire")
+    return totals
+
+def _compute_shard(database, accrual_date, user_range, bot_bound, copy_bound):
+    """Worker : calculer en lecture seule les crédits d'une tranche d'utilisateurs (colonnes compactes)"""
+    conn = sqlite3.connect(Path(database).resolve().as_uri() + '?mode=ro', uri=True, timeout=60)
+    try:
+        user_min, user_max = user_range
+        not_accrued = '''NOT EXISTS (
+            SELECT 1 FROM accrual_ledger al
+            WHERE al.accrual_date = ? AND al.position_kind = '{kind}' AND al.position_id = {alias}.id
+        )'''
+        columns = accrual_kernel.load_positions(
+            conn,
+            bot_scope='utb.user_id BETWEEN ? AND ? AND utb.id <= ? AND ' + not_accrued.format(kind='bot', alias='utb'),
+            copy_scope='uct.user_id BETWEEN ? AND ? AND uct.id <= ? AND ' + not_accrued.format(kind='copy', alias='uct'),
+            params=(user_min, user_max, bot_bound, accrual_date, user_min, user_max, copy_bound, accrual_date)
+        )
+        return accrual_kernel.credit_columns(columns)
+    finally:
+        conn.close()
+
+def _user_shards(conn, count):
+    """Découper la plage des id utilisateurs en tranches contiguës"""
+    low, high = conn.execute('SELECT MIN(id), MAX(id) FROM users').fetchone()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // count))
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+def _write_chunk(conn, accrual_date, run_id, rows):
+    """Writer unique : appliquer un lot de crédits calculés par les workers"""
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM temp.accrual_credits')
+        conn.executemany('''
+            INSERT INTO temp.accrual_credits (kind, position_id, user_id, amount, label)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+
+        # Sous verrou : écarter les positions créditées ou arrêtées depuis le calcul du worker
+        conn.execute('''
+            DELETE FROM temp.accrual_credits
+            WHERE EXISTS (
+                SELECT 1 FROM accrual_ledger al
+                WHERE al.accrual_date = ?
+                  AND al.position_kind = accrual_credits.kind
+                  AND al.position_id = accrual_credits.position_id
+            )
+            OR (kind = 'bot' AND position_id NOT IN (SELECT id FROM user_trading_bots WHERE is_active = 1))
+            OR (kind = 'copy' AND position_id NOT IN (SELECT id FROM user_copy_trading WHERE is_active = 1))
+        ''', (accrual_date,))
+
+        stats = conn.execute(CHUNK_STATS).fetchone()
+        if stats[0]:
+            _apply_credits(conn)
+            _record_chunk(conn, accrual_date, run_id, advance_cursors=False)
+        conn.execute('DELETE FROM temp.accrual_credits')
+        conn.commit()
+        return stats
+    except Exception:
+        conn.rollback()
+        raise
+
+def accrue_daily_profits_sharded(conn, database, accrual_date=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
     """
-    Version sécurisée du calcul des profits quotidiens
+    Variante multi-processus de accrue_daily_profits().
+
+    Les positions sont réparties par tranches d'id utilisateur ; chaque tranche
+    est chargée en colonnes et calculée par accrual_kernel (lecture seule) dans
+    un ProcessPoolExecutor, puis les
+    résultats passent par un writer unique (conn) qui valide des lots de
+    chunk_size lignes. Chaque transaction d'écriture reste courte, ce qui
+    laisse passer les requêtes interactives entre deux lots.
+    """
+    accrual_date = accrual_date or date.today().isoformat()
+    workers = workers or os.cpu_count() or 1
+    require_current_schema(conn)
+    run_id = _start_run(conn, accrual_date)
+    conn.execute(ACCRUAL_CREDITS_TABLE)
+
+    # Bornes figées avant le découpage : toute position <= borne appartient à
+    # un utilisateur déjà présent dans les tranches
+    bot_bound = conn.execute('SELECT COALESCE(MAX(id), 0) FROM user_trading_bots').fetchone()[0]
+    copy_bound = conn.execute('SELECT COALESCE(MAX(id), 0) FROM user_copy_trading').fetchone()[0]
+    shards = _user_shards(conn, workers * 4)
+
+    totals = {'positions': 0, 'bots': 0, 'copies': 0, 'total_amount': 0.0, 'chunks': 0}
+    # spawn : ne pas hériter des threads (scheduler, serveur) du processus parent.
+    # Chaque enfant réimporte toutefois le script principal (__mp_main__) : main.py
+    # y saute migrations, contrôle des plans et hooks atexit du writer
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [
+            pool.submit(_compute_shard, database, accrual_date, shard, bot_bound, copy_bound)
+            for shard in shards
+        ]
+        for future in as_completed(futures):
+            credits = future.result()
+            for start in range(0, len(credits['amount']), chunk_size):
+                rows = accrual_kernel.credit_rows(credits, start, start + chunk_size)
+                stats = _write_chunk(conn, accrual_date, run_id, rows)
+                if stats[0]:
+                    _tally(totals, stats)
+
+    # Toutes les positions <= bornes sont traitées : le mode séquentiel peut reprendre au-delà
+    conn.execute('''
+        UPDATE accrual_runs
+        SET status = 'completed',
+            bot_cursor = MAX(bot_cursor, ?),
+            copy_cursor = MAX(copy_cursor, ?),
+            finished_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (bot_bound, copy_bound, run_id))
+    conn.commit()
+
+    return _finish(totals, accrual_date, run_id)
+
+def calculate_daily_profits_safe(database='investment_platform.db'):
+    """
+    Version autonome du calcul des profits quotidiens (connexion dédiée)
     """
     try:
-        conn = sqlite3.connect('investment_platform.db')
+        conn = sqlite3.connect(database, timeout=60)
         conn.row_factory = sqlite3.Row
-        
-        # Plus d'investissements ROI actifs
-        active_investments = []
-
-        # Récupérer tous les bots de trading actifs
-        active_bots = conn.execute('''
-            SELECT utb.*, u.email, ts.name as strategy_name
-            FROM user_trading_bots utb
-            JOIN users u ON utb.user_id = u.id
-            JOIN trading_strategies ts ON utb.strategy_id = ts.id
-            WHERE utb.is_active = 1
-        ''').fetchall()
-
-        # Récupérer tous les copy trades actifs
-        active_copies = conn.execute('''
-            SELECT uct.*, u.email, tt.name as trader_name, tt.monthly_return
-            FROM user_copy_trading uct
-            JOIN users u ON uct.user_id = u.id
-            JOIN top_traders tt ON uct.trader_id = tt.id
-            WHERE uct.is_active = 1
-        ''').fetchall()
-
-        print(f"🔄 Calcul des profits pour {len(active_investments)} investissements, {len(active_bots)} bots, {len(active_copies)} copy trades")
-
-        # Traiter les investissements ROI classiques
-        for investment in active_investments:
-            try:
-                # Vérifier si l'investissement est vraiment actif (pas expiré)
-                if safe_row_get(investment, 'end_date'):
-                    end_date = datetime.fromisoformat(safe_row_get(investment, 'end_date', '').replace('Z', ''))
-                    if datetime.now() > end_date:
-                        # Marquer comme terminé
-                        conn.execute('''
-                            UPDATE user_investments 
-                            SET is_active = 0 
-                            WHERE id = ?
-                        ''', (safe_row_get(investment, 'id'),))
-                        continue
-
-                # Calculate daily profit
-                daily_profit = safe_row_get(investment, 'daily_profit', 0)
-                
-                if daily_profit > 0:
-                    print(f"💰 Ajout de {daily_profit:.2f} USDT pour l'utilisateur {safe_row_get(investment, 'user_id')} - Plan: {safe_row_get(investment, 'plan_name')}")
-
-                    # Update user balance
-                    conn.execute('''
-                        UPDATE users 
-                        SET balance = balance + ? 
-                        WHERE id = ?
-                    ''', (daily_profit, safe_row_get(investment, 'user_id')))
-
-                    # Update total earned
-                    current_earned = safe_row_get(investment, 'total_earned', 0)
-                    new_total_earned = current_earned + daily_profit
-                    conn.execute('''
-                        UPDATE user_investments 
-                        SET total_earned = ? 
-                        WHERE id = ?
-                    ''', (new_total_earned, safe_row_get(investment, 'id')))
-
-            except Exception as e:
-                print(f"❌ Erreur calcul profit pour investissement {safe_row_get(investment, 'id', 'unknown')}: {e}")
-                continue
-
-        # Traiter les bots de trading
-        for bot in active_bots:
-            try:
-                daily_profit = safe_row_get(bot, 'daily_profit', 0)
-                
-                if daily_profit > 0:
-                    print(f"🤖 Ajout de {daily_profit:.2f} USDT pour le bot {safe_row_get(bot, 'id')} de l'utilisateur {safe_row_get(bot, 'user_id')}")
-
-                    # Mettre à jour le solde utilisateur
-                    conn.execute('''
-                        UPDATE users 
-                        SET balance = balance + ? 
-                        WHERE id = ?
-                    ''', (daily_profit, safe_row_get(bot, 'user_id')))
-
-                    # Mettre à jour les profits totaux du bot
-                    current_profit = safe_row_get(bot, 'total_profit', 0)
-                    new_total_profit = current_profit + daily_profit
-                    conn.execute('''
-                        UPDATE user_trading_bots 
-                        SET total_profit = ?, last_profit_date = CURRENT_TIMESTAMP 
-                        WHERE id = ?
-                    ''', (new_total_profit, safe_row_get(bot, 'id')))
-
-            except Exception as e:
-                print(f"❌ Erreur calcul profit pour bot {safe_row_get(bot, 'id', 'unknown')}: {e}")
-                continue
-
-        # Traiter les copy trades
-        for copy_trade in active_copies:
-            try:
-                # Calculer le profit basé sur le rendement mensuel du trader
-                monthly_return = safe_row_get(copy_trade, 'monthly_return', 0) / 100  # Convertir en décimal
-                daily_return = monthly_return / 30  # Approximation quotidienne
-                daily_profit = safe_row_get(copy_trade, 'amount', 0) * daily_return * safe_row_get(copy_trade, 'copy_ratio', 1.0)
-                
-                if daily_profit > 0:
-                    print(f"📈 Ajout de {daily_profit:.2f} USDT pour le copy trade {safe_row_get(copy_trade, 'id')} de l'utilisateur {safe_row_get(copy_trade, 'user_id')}")
-
-                    # Mettre à jour le solde utilisateur
-                    conn.execute('''
-                        UPDATE users 
-                        SET balance = balance + ? 
-                        WHERE id = ?
-                    ''', (daily_profit, safe_row_get(copy_trade, 'user_id')))
-
-                    # Mettre à jour les profits totaux du copy trade
-                    current_profit = safe_row_get(copy_trade, 'total_profit', 0)
-                    new_total_profit = current_profit + daily_profit
-                    conn.execute('''
-                        UPDATE user_copy_trading 
-                        SET total_profit = ? 
-                        WHERE id = ?
-                    ''', (new_total_profit, safe_row_get(copy_trade, 'id')))
-
-            except Exception as e:
-                print(f"❌ Erreur calcul profit pour copy trade {safe_row_get(copy_trade, 'id', 'unknown')}: {e}")
-                continue
+        try:
+            return accrue_daily_profits(conn)
+        finally:
+            conn.close()
 
-        conn.commit()
-        conn.close()
-        print("✅ Calcul des profits quotidiens terminé")
-        
     except Exception as e:
         print(f"❌ Erreur générale calcul profits: {e}")
-        if 'conn' in locals():
-            conn.close()
+        return None
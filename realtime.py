@@ -0,0 +1,242 @@
+"""
+Diffusion temps réel (Server-Sent Events)
+
+EventBroker est un pub/sub en mémoire, propre à chaque processus : un
+sujet ('support:12', ...) porte un simple compteur de publications, et les
+flux SSE abonnés sont réveillés dès qu'il avance. La base reste la seule
+source des événements : un flux réveillé relit ce qui suit le dernier id
+envoyé. Les écritures faites par un autre worker (ou le scheduler) sont
+repérées par TopicWatcher : un thread par processus relève PRAGMA
+data_version toutes les SSE_WATCH_INTERVAL secondes et, seulement quand
+la base a changé, lit en une requête par type de sujet la version des
+sujets suivis (dernier id, compteur...) et publie ceux qui ont bougé. La
+relecture de secours (SSE_POLL_INTERVAL) ne sert plus que de filet. Entre
+deux événements, un flux inactif n'envoie que des commentaires keepalive.
+
+Chaque flux immobilise un thread du worker : StreamSlots borne leur nombre
+par processus, et un flux refusé reçoit un 503 avec un délai de reprise.
+"""
+
+import json
+import os
+import threading
+import time
+
+from database_config import open_connection
+
+# Durée maximale d'un flux : le navigateur se reconnecte ensuite seul (Last-Event-ID)
+SSE_MAX_DURATION = 600
+# Relecture de secours, si un changement échappait à TopicWatcher
+SSE_POLL_INTERVAL = 60
+# Période de relevé de PRAGMA data_version (écritures des autres processus)
+SSE_WATCH_INTERVAL = 1.0
+# Commentaire envoyé à un flux inactif (proxys, détection des clients partis)
+SSE_KEEPALIVE_INTERVAL = 25
+SSE_RETRY_MS = 3000
+# Flux simultanés par processus, et délai de reprise d'un flux refusé
+SSE_MAX_STREAMS = 16
+SSE_BUSY_RETRY_MS = 30000
+
+class EventBroker:
+    """Compteurs de publication par sujet et attente bloquante de leur changement"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequences = {}
+        # sujet -> [Condition, nombre d'attentes en cours]
+        self._waiters = {}
+        # sujet -> nombre de flux ouverts
+        self._subscribers = {}
+
+    def sequence(self, topic):
+        with self._lock:
+            return self._sequences.get(topic, 0)
+
+    def subscribe(self, topic):
+        """Déclarer un flux ouvert sur topic (suivi par TopicWatcher)"""
+        with self._lock:
+            self._subscribers[topic] = self._subscribers.get(topic, 0) + 1
+
+    def unsubscribe(self, topic):
+        with self._lock:
+            count = self._subscribers.get(topic, 0) - 1
+            if count > 0:
+                self._subscribers[topic] = count
+            else:
+                self._subscribers.pop(topic, None)
+
+    def topics(self):
+        """Sujets ayant au moins un flux ouvert"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, topic):
+        """Signaler un nouvel événement sur topic"""
+        with self._lock:
+            self._sequences[topic] = self._sequences.get(topic, 0) + 1
+            waiter = self._waiters.get(topic)
+            if waiter:
+                waiter[0].notify_all()
+
+    def wait(self, topic, sequence, timeout):
+        """Attendre que topic dépasse sequence ; False si le délai expire"""
+        with self._lock:
+            if self._sequences.get(topic, 0) != sequence:
+                return True
+            waiter = self._waiters.get(topic)
+            if waiter is None:
+                waiter = self._waiters[topic] = [threading.Condition(self._lock), 0]
+            waiter[1] += 1
+            try:
+                return waiter[0].wait_for(lambda: self._sequences.get(topic, 0) != sequence, timeout)
+            finally:
+                waiter[1] -= 1
+                if waiter[1] == 0:
+                    del self._waiters[topic]
+
+class TopicWatcher:
+    """
+    Réveil inter-processus des flux SSE, sur la base partagée.
+
+    probes associe un préfixe de sujet ('support', 'notifications') à une
+    fonction probe(conn, keys) -> {clé: version} qui lit en une requête la
+    version courante de chaque clé (entiers tirés des sujets 'préfixe:clé').
+    Un sujet vu pour la première fois est publié une fois : le flux relit
+    ce qui aurait pu arriver avant que sa version ne soit connue.
+    """
+
+    def __init__(self, database, broker, probes, interval=SSE_WATCH_INTERVAL):
+        self.database = database
+        self.broker = broker
+        self.probes = probes
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Démarrer le thread de relevé (paresseux, une fois par processus)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='sse-watcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = open_connection(self.database)
+        # Autocommit : aucune transaction de lecture gardée ouverte entre deux relevés
+        conn.isolation_level = None
+        data_version = None
+        versions = {}
+        while True:
+            time.sleep(self.interval)
+            topics = self.broker.topics()
+            # Plus aucun flux : les versions repartent de zéro au prochain
+            versions = {topic: version for topic, version in versions.items() if topic in topics}
+            if not topics:
+                continue
+            try:
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current == data_version and all(topic in versions for topic in topics):
+                    continue
+                for topic, version in self._probe(conn, topics).items():
+                    if topic not in versions or versions[topic] != version:
+                        versions[topic] = version
+                        self.broker.publish(topic)
+                data_version = current
+            except Exception as e:
+                print(f"⚠️ Erreur relevé des flux temps réel: {e}")
+
+    def _probe(self, conn, topics):
+        """Version courante de chaque sujet suivi, une requête par préfixe"""
+        keys = {}
+        for topic in topics:
+            prefix, _, key = topic.partition(':')
+            if prefix in self.probes and key.isdigit():
+                keys.setdefault(prefix, []).append(int(key))
+        # Sujets sans sonde : suivis sans version, jamais republiés
+        current = {topic: None for topic in topics}
+        for prefix, prefix_keys in keys.items():
+            found = self.probes[prefix](conn, prefix_keys)
+            for key in prefix_keys:
+                current[f'{prefix}:{key}'] = found.get(key)
+        return current
+
+class StreamSlots:
+    """Nombre borné de flux SSE ouverts en même temps dans le processus"""
+
+    def __init__(self, limit=SSE_MAX_STREAMS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._open = 0
+
+    @property
+    def open(self):
+        with self._lock:
+            return self._open
+
+    def acquire(self):
+        """Réserver une place ; False si le quota est atteint"""
+        with self._lock:
+            if self._open >= self.limit:
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open = max(self._open - 1, 0)
+
+def format_sse(data, event=None, event_id=None):
+    """Encoder un événement SSE (data sérialisé en JSON)"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def stream_events(broker, topic, fetch, last_id=0, event='message', poll_interval=SSE_POLL_INTERVAL,
+                  keepalive_interval=SSE_KEEPALIVE_INTERVAL, max_duration=SSE_MAX_DURATION):
+    """
+    Générateur SSE des événements de topic postérieurs à last_id.
+
+    fetch(last_id) retourne la liste des événements suivants, chacun étant
+    un dictionnaire avec une clé 'id' croissante. Il est appelé à
+    l'ouverture, à chaque réveil du broker, et sinon toutes les
+    poll_interval secondes.
+    """
+    deadline = time.monotonic() + max_duration
+    yield f'retry: {SSE_RETRY_MS}\n\n'
+    broker.subscribe(topic)
+    try:
+        while True:
+            # Lire le compteur avant la base : une publication pendant fetch réveille aussitôt
+            sequence = broker.sequence(topic)
+            for item in fetch(last_id):
+                last_id = item['id']
+                yield format_sse(item, event=event, event_id=last_id)
+
+            poll_at = min(time.monotonic() + poll_interval, deadline)
+            while not broker.wait(topic, sequence, min(keepalive_interval, max(poll_at - time.monotonic(), 0))):
+                if time.monotonic() >= poll_at:
+                    break
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield ': keepalive\n\n'
+            if time.monotonic() >= deadline:
+                return
+    finally:
+        broker.unsubscribe(topic)
+
+def last_event_id(headers, args, default=0):
+    """Point de reprise d'un flux : en-tête Last-Event-ID, sinon paramètre since_id"""
+    for value in (headers.get('Last-Event-ID'), args.get('since_id')):
+        try:
+            if value not in (None, ''):
+                return int(value)
+        except ValueError:
+            continue
+    return default
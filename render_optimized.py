@@ -6,9 +6,13 @@ Script de démarrage optimisé pour Render
 
 import os
 import sys
+import secrets
 import sqlite3
 from datetime import datetime
 
+from database_config import open_connection
+from migrations import run_migrations
+
 def create_directories():
     """Créer les répertoires nécessaires"""
     os.makedirs('static', exist_ok=True)
@@ -18,144 +22,10 @@ def create_directories():
 def init_database_safe():
     """Initialiser la base de données de manière sécurisée"""
     try:
-        conn = sqlite3.connect('investment_platform.db', timeout=30)
-        conn.row_factory = sqlite3.Row
-        
-        # Créer les tables essentielles
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                balance REAL DEFAULT 0.0,
-                is_admin BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                two_factor_secret TEXT,
-                two_factor_enabled BOOLEAN DEFAULT 0
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                amount REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                transaction_hash TEXT UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                message TEXT NOT NULL,
-                type TEXT DEFAULT 'info',
-                is_read BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_investments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                plan_name TEXT NOT NULL,
-                amount REAL NOT NULL,
-                daily_profit REAL NOT NULL,
-                total_earned REAL DEFAULT 0.0,
-                start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_date TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_trading_bots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                strategy_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_date TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                total_profit REAL DEFAULT 0.0,
-                daily_profit REAL DEFAULT 0.0,
-                last_profit_date TIMESTAMP,
-                transaction_hash TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_copy_trading (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                trader_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                start_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                end_date TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1,
-                total_profit REAL DEFAULT 0.0,
-                copy_ratio REAL DEFAULT 1.0,
-                transaction_hash TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS trading_strategies (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                daily_return REAL DEFAULT 0.0,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS top_traders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                monthly_return REAL DEFAULT 0.0,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS support_tickets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                subject TEXT NOT NULL,
-                message TEXT NOT NULL,
-                category TEXT DEFAULT 'general',
-                priority TEXT DEFAULT 'normal',
-                status TEXT DEFAULT 'open',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        conn = open_connection('investment_platform.db', timeout=30)
         
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS ticket_responses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ticket_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                message TEXT NOT NULL,
-                is_admin BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (ticket_id) REFERENCES support_tickets (id),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        # Schéma versionné (source unique : migrations.py)
+        run_migrations(conn)
         
         # Créer les comptes administrateur par défaut
         from werkzeug.security import generate_password_hash
@@ -173,9 +43,9 @@ def init_database_safe():
                 existing = conn.execute('SELECT id FROM users WHERE email = ?', (email,)).fetchone()
                 if not existing:
                     conn.execute('''
-                        INSERT INTO users (email, password_hash, first_name, last_name, is_admin, balance)
-                        VALUES (?, ?, ?, ?, 1, 10000.0)
-                    ''', (email, generate_password_hash(password), first_name, last_name))
+                        INSERT INTO users (email, password_hash, first_name, last_name, referral_code, kyc_status, balance)
+                        VALUES (?, ?, ?, ?, ?, 'verified', 10000.0)
+                    ''', (email, generate_password_hash(password), first_name, last_name, secrets.token_urlsafe(8).upper()))
                     print(f"✅ Compte admin créé: {email}")
                 else:
                     print(f"⚠️ Compte admin existe déjà: {email}")
@@ -0,0 +1,309 @@
+"""
+Métriques des requêtes HTTP et de leurs accès SQL (format texte Prometheus)
+
+Chaque requête Flask porte un QueryStats : la connexion de la requête est
+enveloppée par InstrumentedConnection, qui compte les requêtes SQL, leur
+durée (exécution et lecture des lignes) et les lignes lues. À la fin de la
+requête, MetricsRegistry agrège par route (règle d'URL, pas le chemin) :
+
+- histogramme des latences et du nombre de requêtes SQL par requête ;
+- totaux du temps SQL, des lignes lues et des connexions empruntées.
+
+Les registres sont propres à chaque worker. Avec METRICS_DIR, chaque
+worker y dépose périodiquement son instantané et /metrics additionne ceux
+de tous les workers (y compris ceux qui ont redémarré : les compteurs
+restent monotones).
+"""
+
+import bisect
+import json
+import os
+import secrets
+import threading
+import time
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+# Intervalle minimal entre deux dépôts de l'instantané d'un worker
+METRICS_FLUSH_SECONDS = 5
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+
+class QueryStats:
+    """Compteurs SQL d'une requête (route : étiquette du journal des requêtes lentes)"""
+
+    __slots__ = ('route', 'statements', 'seconds', 'rows', 'connections')
+
+    def __init__(self, route=None):
+        self.route = route
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.connections = 0
+
+class InstrumentedCursor:
+    """Curseur mesuré : temps d'exécution et de lecture, lignes lues, requêtes lentes"""
+
+    def __init__(self, cursor, stats, conn=None, slow_log=None):
+        self._cursor = cursor
+        self._stats = stats
+        self._conn = conn
+        self._slow_log = slow_log
+        self._statement = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _run(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self._stats.seconds += elapsed
+            if self._statement is not None:
+                self._track(elapsed)
+
+    def _track(self, elapsed):
+        # Durée cumulée de la requête courante : l'entrée lente suit les lectures suivantes
+        statement = self._statement
+        statement[3] += elapsed
+        if statement[3] < self._slow_log.threshold:
+            return
+        if statement[4] is None:
+            statement[4] = self._slow_log.record(self._conn, statement[0], statement[1], statement[3],
+                                                 self._stats.route, many=statement[2])
+        else:
+            statement[4]['ms'] = round(statement[3] * 1000, 2)
+
+    def _start(self, sql, parameters, many=False):
+        self._stats.statements += 1
+        if self._slow_log is not None:
+            # [sql, paramètres, executemany, durée cumulée, entrée du journal]
+            self._statement = [sql, parameters, many, 0.0, None]
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        self._run(self._cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None, many=True)
+        self._run(self._cursor.executemany, sql, seq_of_parameters)
+        return self
+
+    def executescript(self, script):
+        self._start(script, None, many=True)
+        self._run(self._cursor.executescript, script)
+        return self
+
+    def fetchone(self):
+        row = self._run(self._cursor.fetchone)
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._run(self._cursor.fetchmany, self._cursor.arraysize if size is None else size)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._run(self._cursor.fetchall)
+        self._stats.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+class InstrumentedConnection:
+    """Connexion (du pool) dont les curseurs sont mesurés ; le reste est délégué"""
+
+    def __init__(self, conn, stats, slow_log=None):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_slow_log', slow_log)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor(), self._stats, self._conn, self._slow_log)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+def _histogram(buckets):
+    return {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+
+def _observe(histogram, buckets, value):
+    histogram['buckets'][bisect.bisect_left(buckets, value)] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+class MetricsRegistry:
+    """Agrégats par route de ce worker"""
+
+    def __init__(self, metrics_dir=METRICS_DIR):
+        self.metrics_dir = metrics_dir
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._statuses = {}
+        self._flush_lock = threading.Lock()
+        self._flushed_at = 0.0
+        self._file_pid = None
+        self._file_name = None
+
+    def observe(self, route, method, status, duration, stats):
+        key = f'{route}\t{method}'
+        with self._lock:
+            entry = self._routes.get(key)
+            if entry is None:
+                entry = self._routes[key] = {
+                    'latency': _histogram(LATENCY_BUCKETS),
+                    'statements': _histogram(STATEMENT_BUCKETS),
+                    'sql_seconds': 0.0,
+                    'rows': 0,
+                    'connections': 0,
+                }
+            _observe(entry['latency'], LATENCY_BUCKETS, duration)
+            _observe(entry['statements'], STATEMENT_BUCKETS, stats.statements)
+            entry['sql_seconds'] += stats.seconds
+            entry['rows'] += stats.rows
+            entry['connections'] += stats.connections
+            status_key = f'{key}\t{status}'
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+        if self.metrics_dir and time.monotonic() - self._flushed_at >= METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps({'routes': self._routes, 'statuses': self._statuses}))
+
+    def flush(self):
+        """Déposer l'instantané de ce worker dans metrics_dir"""
+        with self._flush_lock:
+            self._flushed_at = time.monotonic()
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            # Nom propre à ce processus : un worker qui reprend le pid d'un worker mort
+            # n'écrase pas ses compteurs (la somme ne serait plus monotone)
+            if self._file_pid != os.getpid():
+                self._file_pid = os.getpid()
+                self._file_name = f'worker_{self._file_pid}_{secrets.token_hex(4)}.json'
+            path = os.path.join(self.metrics_dir, self._file_name)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+
+    def collect(self):
+        """Instantanés à exposer : ce worker, plus les autres si metrics_dir est configuré"""
+        if not self.metrics_dir:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for name in os.listdir(self.metrics_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.metrics_dir, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+def _add_histogram(total, histogram):
+    total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+    total['sum'] += histogram['sum']
+    total['count'] += histogram['count']
+
+def _merge(snapshots):
+    routes, statuses = {}, {}
+    for snapshot in snapshots:
+        for key, entry in snapshot['routes'].items():
+            total = routes.get(key)
+            if total is None:
+                routes[key] = entry
+                continue
+            _add_histogram(total['latency'], entry['latency'])
+            _add_histogram(total['statements'], entry['statements'])
+            for counter in ('sql_seconds', 'rows', 'connections'):
+                total[counter] += entry[counter]
+        for key, count in snapshot['statuses'].items():
+            statuses[key] = statuses.get(key, 0) + count
+    return routes, statuses
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+def _render_histogram(lines, name, buckets, histogram, **labels):
+    cumulative = 0
+    for bound, count in zip(buckets, histogram['buckets']):
+        cumulative += count
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram["count"]}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram["sum"]}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram["count"]}')
+
+def render_prometheus(snapshots):
+    """Texte d'exposition Prometheus (version 0.0.4) des instantanés additionnés"""
+    routes, statuses = _merge(snapshots)
+    keys = sorted(routes)
+    lines = [
+        '# HELP http_requests_total Requêtes traitées par route, méthode et statut',
+        '# TYPE http_requests_total counter',
+    ]
+    for key in sorted(statuses):
+        route, method, status = key.split('\t')
+        lines.append(f'http_requests_total{_labels(route=route, method=method, status=status)} {statuses[key]}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Latence des requêtes par route',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for key in keys:
+        route, method = key.split('\t')
+        _render_histogram(lines, 'http_request_duration_seconds', LATENCY_BUCKETS,
+                          routes[key]['latency'], route=route, method=method)
+
+    lines += [
+        '# HELP db_statements_per_request Requêtes SQL exécutées par requête HTTP',
+        '# TYPE db_statements_per_request histogram',
+    ]
+    for key in keys:
+        route, method = key.split('\t')
+        _render_histogram(lines, 'db_statements_per_request', STATEMENT_BUCKETS,
+                          routes[key]['statements'], route=route, method=method)
+
+    counters = (
+        ('db_query_seconds_total', 'sql_seconds', 'Temps passé en SQL (exécution et lecture)'),
+        ('db_rows_fetched_total', 'rows', 'Lignes lues'),
+        ('db_connections_opened_total', 'connections', 'Connexions empruntées au pool'),
+    )
+    for name, counter, help_text in counters:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for key in keys:
+            route, method = key.split('\t')
+            lines.append(f'{name}{_labels(route=route, method=method)} {routes[key][counter]}')
+    return '\n'.join(lines) + '\n'
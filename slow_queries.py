@@ -0,0 +1,193 @@
+"""
+Journal des requêtes SQL lentes
+
+Toute requête dont la durée (exécution et lecture des lignes) dépasse
+SLOW_QUERY_MS est inscrite dans un tampon circulaire propre au worker :
+SQL normalisé (littéraux et listes IN remplacés par ?), forme des
+paramètres, durée, route appelante et plan (EXPLAIN QUERY PLAN). Le plan
+n'est calculé qu'une fois par SQL normalisé (cache borné), sur la
+connexion de la requête. summary() regroupe le tampon par SQL normalisé
+pour le dashboard administrateur.
+
+Comme les métriques (request_metrics), le tampon est propre au worker.
+Avec METRICS_DIR, chaque worker dépose son tampon dans
+METRICS_DIR/slow_queries à la fin des requêtes qui l'ont modifié, et
+entries() / summary() fusionnent ceux de tous les workers ; clear() vide
+le journal de tous les workers (horodatage de remise à zéro partagé).
+Sans METRICS_DIR, le journal ne couvre que le worker qui sert la page.
+"""
+
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+SLOW_QUERY_BUFFER = 500
+PLAN_CACHE_SIZE = 256
+SLOW_QUERY_DIR = os.path.join(os.environ['METRICS_DIR'], 'slow_queries') if os.environ.get('METRICS_DIR') else None
+# Fichier de remise à zéro : les entrées antérieures sont ignorées par tous les workers
+CLEARED_FILE = 'cleared_at'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def normalize_sql(sql):
+    """SQL sur une ligne, littéraux remplacés par ?, listes IN (?, ?, ...) réduites"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _SPACES.sub(' ', sql).strip()
+    return _IN_LIST.sub('IN (?...)', sql)
+
+def params_shape(params):
+    """Types des paramètres, sans leurs valeurs"""
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+class SlowQueryLog:
+    """Tampon circulaire des requêtes lentes de ce worker, partagé via log_dir"""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_BUFFER, log_dir=SLOW_QUERY_DIR):
+        self.threshold = threshold_ms / 1000.0
+        self.log_dir = log_dir
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=size)
+        self._plans = OrderedDict()
+        self._dirty = False
+        self._flush_lock = threading.Lock()
+        self._file_pid = None
+        self._file_name = None
+
+    def _plan(self, conn, sql, normalized, params):
+        with self._lock:
+            plan = self._plans.get(normalized)
+            if plan is not None:
+                self._plans.move_to_end(normalized)
+                return plan
+        if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            plan = ''
+        else:
+            try:
+                rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params or ()).fetchall()
+                plan = '\n'.join(f'{row[0]}|{row[1]}| {row[3]}' for row in rows)
+            except Exception as e:
+                plan = f'(plan indisponible: {e})'
+        with self._lock:
+            self._plans[normalized] = plan
+            while len(self._plans) > PLAN_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return plan
+
+    def record(self, conn, sql, params, seconds, route, many=False):
+        """Inscrire une requête lente ; retourne l'entrée (sa durée peut encore être mise à jour)"""
+        normalized = normalize_sql(sql)
+        entry = {
+            'sql': normalized,
+            'params': 'executemany' if many else params_shape(params),
+            'ms': round(seconds * 1000, 2),
+            'route': route,
+            'at': time.time(),
+            'plan': '' if many else self._plan(conn, sql, normalized, params),
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self._dirty = True
+        return entry
+
+    def flush(self):
+        """Déposer le tampon de ce worker dans log_dir s'il a changé depuis le dernier dépôt"""
+        if not self.log_dir:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = [dict(entry) for entry in self._entries]
+            os.makedirs(self.log_dir, exist_ok=True)
+            # Nom propre à ce processus, comme les instantanés de request_metrics
+            if self._file_pid != os.getpid():
+                self._file_pid = os.getpid()
+                self._file_name = f'worker_{self._file_pid}_{secrets.token_hex(4)}.json'
+            path = os.path.join(self.log_dir, self._file_name)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(entries, f)
+            os.replace(path + '.tmp', path)
+
+    def _cleared_at(self):
+        try:
+            with open(os.path.join(self.log_dir, CLEARED_FILE)) as f:
+                return float(f.read())
+        except (OSError, ValueError):
+            return 0.0
+
+    def entries(self):
+        """Requêtes lentes (de tous les workers si log_dir), de la plus récente à la plus ancienne"""
+        if not self.log_dir:
+            with self._lock:
+                return list(reversed(self._entries))
+        self.flush()
+        cleared_at = self._cleared_at()
+        try:
+            names = os.listdir(self.log_dir)
+        except FileNotFoundError:
+            # Aucun worker n'a encore enregistré de requête lente
+            names = []
+        entries = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.log_dir, name)) as f:
+                    entries.extend(entry for entry in json.load(f) if entry['at'] > cleared_at)
+            except (OSError, ValueError):
+                continue
+        return sorted(entries, key=lambda entry: entry['at'], reverse=True)
+
+    def summary(self):
+        """Regroupement par SQL normalisé, trié par temps cumulé décroissant"""
+        groups = {}
+        for entry in self.entries():
+            group = groups.get(entry['sql'])
+            if group is None:
+                group = groups[entry['sql']] = {
+                    'sql': entry['sql'],
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'routes': set(),
+                    'params': entry['params'],
+                    'plan': entry['plan'],
+                    'last_at': entry['at'],
+                }
+            group['count'] += 1
+            group['total_ms'] += entry['ms']
+            group['max_ms'] = max(group['max_ms'], entry['ms'])
+            group['routes'].add(entry['route'])
+        result = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
+        for group in result:
+            group['routes'] = sorted(group['routes'])
+            group['avg_ms'] = round(group['total_ms'] / group['count'], 2)
+            group['total_ms'] = round(group['total_ms'], 2)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+            path = os.path.join(self.log_dir, CLEARED_FILE)
+            with open(path + '.tmp', 'w') as f:
+                f.write(repr(time.time()))
+            os.replace(path + '.tmp', path)
+            self.flush()
@@ -1,7 +1,11 @@
 """
-Utilitaires pour gérer les objets sqlite3.Row de manière compatible
+Utilitaires pour gérer les objets sqlite3.Row de manière compatible,
+et curseurs de pagination keyset partagés par les pages paginées
 """
 
+import base64
+import json
+
 def safe_get(row, key, default=None):
     """
     Récupère une valeur d'un objet sqlite3.Row de manière sécurisée
@@ -51,3 +55,18 @@ def safe_row_get(row, key, default=None):
             return getattr(row, key, default)
         except:
             return default
+
+def encode_cursor(row, columns):
+    """Curseur opaque encodant la clé (columns) de la dernière ligne servie"""
+    key = [row[column] for column in columns]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor, types):
+    """Clé d'un curseur convertie colonne par colonne (types), ou None s'il est invalide"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(key) != len(types):
+            return None
+        return tuple(convert(value) for convert, value in zip(types, key))
+    except (ValueError, TypeError):
+        return None
@@ -5,6 +5,23 @@ echo "🚀 Démarrage de l'application Investment Platform..."
 # Installer les dépendances
 pip install -r requirements.txt
 
+# Métriques /metrics additionnées entre workers (repartent de zéro à chaque démarrage)
+export METRICS_DIR=${METRICS_DIR:-/tmp/investment_metrics}
+rm -rf "$METRICS_DIR"
+
+# Budget de threads : WEB_WORKERS × WEB_THREADS threads au total (4 × 32 = 128).
+# Chaque flux SSE ouvert (un par onglet : notifications, ou ticket de support)
+# immobilise un thread ; SSE_MAX_STREAMS les borne par worker (16 × 4 = 64 flux),
+# au-delà le flux reçoit un 503 et le navigateur réessaie 30 à 60 s plus tard,
+# en relevant entre-temps le compteur de notifications toutes les 15 s.
+# Les threads restants (16 par worker) servent les requêtes ordinaires, chacun avec
+# sa connexion du pool (DB_POOL_SIZE) : augmenter SSE_MAX_STREAMS demande
+# d'augmenter WEB_THREADS d'autant.
+WEB_WORKERS=${WEB_WORKERS:-4}
+export WEB_THREADS=${WEB_THREADS:-32}
+export SSE_MAX_STREAMS=${SSE_MAX_STREAMS:-16}
+export DB_POOL_SIZE=${DB_POOL_SIZE:-$((WEB_THREADS - SSE_MAX_STREAMS))}
+
 # Démarrer l'application avec Gunicorn
 echo "🌐 Lancement du serveur web..."
-gunicorn --bind 0.0.0.0:$PORT --workers 4 --timeout 120 main:app
+gunicorn --bind 0.0.0.0:$PORT --workers $WEB_WORKERS --worker-class gthread --threads $WEB_THREADS --timeout 120 main:app
@@ -0,0 +1,58 @@
+"""
+Messages des tickets de support
+
+Lecture incrémentale des messages d'un ticket (id > since_id) et forme
+JSON commune à l'API, au flux SSE et aux pages de conversation.
+"""
+
+def support_topic(ticket_id):
+    """Sujet du broker temps réel d'un ticket"""
+    return f'support:{ticket_id}'
+
+def serialize_message(row):
+    """Message au format JSON des pages de conversation"""
+    first_name = row['first_name'] or ''
+    last_name = row['last_name'] or ''
+
+    sender_name = 'Support' if row['is_admin'] else f"{first_name} {last_name}".strip()
+    if not sender_name:
+        sender_name = 'Utilisateur'
+
+    return {
+        'id': row['id'],
+        'message': row['message'] or '',
+        'is_admin': bool(row['is_admin']),
+        'created_at': row['created_at'] or '',
+        'sender_name': sender_name
+    }
+
+def messages_etag(ticket_id, last_id, since_id=0):
+    """
+    ETag d'une réponse de /support/get-messages.
+
+    Les messages ne sont jamais modifiés : le dernier id du ticket suffit
+    à versionner la conversation, since_id distingue les réponses partielles.
+    """
+    return f'ticket-{ticket_id}-m{last_id}-s{since_id}'
+
+def latest_message_ids(conn, ticket_ids):
+    """Dernier id de message de chaque ticket (sonde de TopicWatcher, index ticket_id, id)"""
+    placeholders = ', '.join('?' * len(ticket_ids))
+    rows = conn.execute(f'''
+        SELECT ticket_id, MAX(id)
+        FROM support_messages
+        WHERE ticket_id IN ({placeholders})
+        GROUP BY ticket_id
+    ''', list(ticket_ids)).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+def fetch_messages(conn, ticket_id, since_id=0):
+    """Messages du ticket postérieurs à since_id, dans l'ordre d'envoi"""
+    rows = conn.execute('''
+        SELECT sm.id, sm.message, sm.is_admin, sm.created_at, u.first_name, u.last_name
+        FROM support_messages sm
+        LEFT JOIN users u ON sm.user_id = u.id
+        WHERE sm.ticket_id = ? AND sm.id > ?
+        ORDER BY sm.id ASC
+    ''', (ticket_id, since_id)).fetchall()
+    return [serialize_message(row) for row in rows]